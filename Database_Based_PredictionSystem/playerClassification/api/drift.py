@@ -0,0 +1,96 @@
+import threading
+from collections import deque
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+# PSI rule of thumb: below 0.1 stable, 0.1-0.25 moderate shift, above 0.25 drifted
+PSI_WARNING = 0.1
+PSI_DRIFT = 0.25
+
+
+class DriftMonitor:
+    """
+    Population stability index of recent request features against the
+    training data.
+
+    Numeric features are binned at the training deciles, categorical ones by
+    value, with values never seen in training sharing one extra bin. The last
+    window_size inputs are kept as bin indices with running counts, so each
+    observed row costs O(features) and a report does not rescan the window.
+    """
+
+    def __init__(self, training: pd.DataFrame, numeric: List[str], categorical: List[str],
+                 window_size: int = 5000, bins: int = 10):
+        self.window_size = window_size
+        self.edges: Dict[str, np.ndarray] = {}
+        self.categories: Dict[str, Dict[str, int]] = {}
+        self.expected: Dict[str, np.ndarray] = {}
+
+        for feature in numeric:
+            values = training[feature].dropna().to_numpy(dtype=float)
+            quantiles = np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1])
+            self.edges[feature] = np.unique(quantiles)
+            self.expected[feature] = self._frequencies(self._numeric_bins(feature, values),
+                                                       len(self.edges[feature]) + 1)
+
+        for feature in categorical:
+            values = training[feature].dropna().astype(str).str.lower()
+            self.categories[feature] = {value: i for i, value in enumerate(sorted(values.unique()))}
+            self.expected[feature] = self._frequencies(self._categorical_bins(feature, values),
+                                                       len(self.categories[feature]) + 1)
+
+        self._window: Dict[str, deque] = {feature: deque() for feature in self.expected}
+        self._counts = {feature: np.zeros(len(expected), dtype=np.int64)
+                        for feature, expected in self.expected.items()}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _frequencies(bin_indices: np.ndarray, n_bins: int) -> np.ndarray:
+        return np.bincount(bin_indices, minlength=n_bins) / max(len(bin_indices), 1)
+
+    def _numeric_bins(self, feature: str, values: np.ndarray) -> np.ndarray:
+        return np.searchsorted(self.edges[feature], values, side='right')
+
+    def _categorical_bins(self, feature: str, values: pd.Series) -> np.ndarray:
+        categories = self.categories[feature]
+        unseen = len(categories)
+        return np.fromiter((categories.get(value, unseen) for value in values), dtype=np.int64, count=len(values))
+
+    def observe(self, rows: pd.DataFrame) -> None:
+        """Add request rows to the window, evicting the oldest beyond window_size"""
+        bins = {}
+        for feature in self.edges:
+            bins[feature] = self._numeric_bins(feature, rows[feature].to_numpy(dtype=float))
+        for feature in self.categories:
+            bins[feature] = self._categorical_bins(feature, rows[feature].astype(str).str.lower())
+
+        with self._lock:
+            for feature, indices in bins.items():
+                window, counts = self._window[feature], self._counts[feature]
+                for index in indices:
+                    if len(window) == self.window_size:
+                        counts[window.popleft()] -= 1
+                    window.append(index)
+                    counts[index] += 1
+
+    def report(self) -> Dict[str, Dict]:
+        with self._lock:
+            counts = {feature: counts.copy() for feature, counts in self._counts.items()}
+
+        features = {}
+        for feature, observed in counts.items():
+            total = observed.sum()
+            if not total:
+                continue
+            # Floor empty bins so the log terms stay finite
+            actual = np.clip(observed / total, 1e-4, None)
+            expected = np.clip(self.expected[feature], 1e-4, None)
+            psi = float(np.sum((actual - expected) * np.log(actual / expected)))
+            features[feature] = {
+                'psi': round(psi, 4),
+                'status': 'drift' if psi > PSI_DRIFT else 'warning' if psi > PSI_WARNING else 'stable',
+                'observations': int(total),
+            }
+        return features
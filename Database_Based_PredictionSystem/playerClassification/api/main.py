@@ -1,6 +1,10 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Response
+from sqlalchemy import and_, func, inspect, or_, text
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional, Union
+import base64
+import logging
+import os
 import uuid
 import pandas as pd
 from datetime import datetime
@@ -8,12 +12,75 @@ from datetime import datetime
 from . import models, schemas
 from .schemas import *
 from .database import SessionLocal, engine
+from .drift import DriftMonitor
 from .ml_model import EngagementPredictor
+from .writer import PredictionWriter
+
+logger = logging.getLogger(__name__)
 
 models.Base.metadata.create_all(bind=engine)
+# create_all does not add columns to an existing game_engagement table
+ADDED_COLUMNS = {'model_version': 'VARCHAR(64) NULL', 'prediction_id': 'BINARY(16) NULL'}
+existing_columns = {column['name'] for column in inspect(engine).get_columns('game_engagement')}
+for name, definition in ADDED_COLUMNS.items():
+    if name not in existing_columns:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE game_engagement ADD COLUMN {name} {definition}"))
+# create_all skips tables that already exist; add missing indexes to those too
+for index in models.GameEngagement.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
 
 app = FastAPI()
 predictor = EngagementPredictor()
+# Prediction records are inserted in the background; responses carry the
+# prediction_id assigned up front instead of the row id
+writer = PredictionWriter(SessionLocal)
+
+FEATURE_COLUMNS = ['age', 'total_games_played', 'win_ratio', 'total_moves', 'highest_score',
+                   'rating', 'player_level', 'country', 'gender']
+MAX_BATCH_SIZE = 5000
+MAX_PAGE_SIZE = 500
+
+# Training data the drift monitor compares recent inputs against
+TRAINING_DATA_PATH = os.getenv('TRAINING_DATA_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data', 'player_game_statistics.csv'))
+DRIFT_WINDOW_SIZE = int(os.getenv('DRIFT_WINDOW_SIZE', '5000'))
+# Request features the drift monitor compares when the training data has them
+DRIFT_NUMERIC_FEATURES = ['age', 'total_games_played', 'win_ratio', 'total_moves', 'highest_score', 'rating']
+DRIFT_CATEGORICAL_FEATURES = ['player_level', 'country', 'gender']
+
+
+def _create_drift_monitor() -> Optional[DriftMonitor]:
+    try:
+        training = pd.read_csv(TRAINING_DATA_PATH)
+    except FileNotFoundError:
+        logger.warning(f"Training data not found at {TRAINING_DATA_PATH}; drift monitoring disabled")
+        return None
+
+    numeric = [feature for feature in DRIFT_NUMERIC_FEATURES if feature in training.columns]
+    categorical = [feature for feature in DRIFT_CATEGORICAL_FEATURES if feature in training.columns]
+    missing = sorted(set(DRIFT_NUMERIC_FEATURES + DRIFT_CATEGORICAL_FEATURES) - set(numeric + categorical))
+    if missing:
+        logger.info(f"Training data has no {', '.join(missing)}; not monitored for drift")
+    try:
+        return DriftMonitor(training, numeric, categorical, window_size=DRIFT_WINDOW_SIZE)
+    except (KeyError, ValueError) as e:
+        logger.warning(f"Unusable training data at {TRAINING_DATA_PATH} ({type(e).__name__}: {str(e)}); "
+                       f"drift monitoring disabled")
+        return None
+
+
+drift_monitor = _create_drift_monitor()
+
+
+@app.on_event("startup")
+def start_writer():
+    writer.start()
+
+
+@app.on_event("shutdown")
+def stop_writer():
+    writer.stop()
 
 
 def get_db():
@@ -24,70 +91,248 @@ def get_db():
         db.close()
 
 
+def _predict(engagements: List[GameEngagementCreate]) -> List[dict]:
+    """Predict a batch with one DataFrame and one model call, and queue the records for writing"""
+    features = pd.DataFrame([engagement.dict() for engagement in engagements], columns=FEATURE_COLUMNS)
+    predicted_durations = predictor.predict_batch(features)
+    timestamp = datetime.utcnow()
+    if drift_monitor is not None:
+        drift_monitor.observe(features)
+
+    records, responses = [], []
+    for engagement, predicted_duration in zip(engagements, predicted_durations):
+        prediction_id = uuid.uuid4()
+        records.append({
+            'prediction_id': prediction_id.bytes,
+            'player_id': uuid.UUID(engagement.player_id).bytes,
+            'game_id': uuid.UUID(engagement.game_id).bytes,
+            'engagement_duration': int(predicted_duration),
+            'prediction_timestamp': timestamp,
+            'model_version': predictor.version
+        })
+        responses.append({
+            **engagement.dict(),
+            'prediction_id': str(prediction_id),
+            'engagement_duration': int(predicted_duration),
+            'prediction_timestamp': timestamp
+        })
+
+    writer.submit(records)
+    return responses
+
+
 @app.post("/predict-engagement/", response_model=GameEngagementResponse)
-def predict_engagement(
-        engagement: GameEngagementCreate,
-        db: Session = Depends(get_db)
-):
-    # Prepare features for prediction
-    features = pd.DataFrame({
-        'age': [engagement.age],
-        'total_games_played': [engagement.total_games_played],
-        'win_ratio': [engagement.win_ratio],
-        'total_moves': [engagement.total_moves],
-        'highest_score': [engagement.highest_score],
-        'rating': [engagement.rating],
-        'player_level': [engagement.player_level],
-        'country': [engagement.country],
-        'gender': [engagement.gender]
-    })
-
-    # Get prediction
-    predicted_duration = predictor.predict(features)
-
-    # Create database record
-    db_engagement = models.GameEngagement(
-        player_id=uuid.UUID(engagement.player_id).bytes,
-        game_id=uuid.UUID(engagement.game_id).bytes,
-        engagement_duration=int(predicted_duration),
-        prediction_timestamp=datetime.utcnow()
-    )
-
-    db.add(db_engagement)
-    db.commit()
-    db.refresh(db_engagement)
+def predict_engagement(engagement: GameEngagementCreate):
+    return _predict([engagement])[0]
 
-    return db_engagement
+
+@app.post("/predict-engagement/batch", response_model=List[GameEngagementResponse])
+def predict_engagement_batch(engagements: List[GameEngagementCreate]):
+    if not engagements:
+        return []
+    if len(engagements) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} predictions per batch")
+    return _predict(engagements)
+
+
+def _encode_cursor(engagement: models.GameEngagement) -> str:
+    value = f"{engagement.prediction_timestamp.isoformat()}|{engagement.id}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        timestamp, engagement_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(engagement_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 @app.get("/engagements/{player_id}", response_model=List[GameEngagementResponse])
-def get_player_engagements(player_id: str, db: Session = Depends(get_db)):
+def get_player_engagements(
+        player_id: str,
+        response: Response,
+        limit: int = Query(50, gt=0, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        db: Session = Depends(get_db)
+):
+    """Newest predictions first; pass the X-Next-Cursor response header as cursor for the next page"""
     player_uuid = uuid.UUID(player_id).bytes
-    engagements = db.query(models.GameEngagement) \
-        .filter(models.GameEngagement.player_id == player_uuid) \
+    query = db.query(models.GameEngagement) \
+        .filter(models.GameEngagement.player_id == player_uuid)
+
+    if cursor:
+        # Keyset pagination: seek past the last row of the previous page on
+        # (player_id, prediction_timestamp) instead of counting through an OFFSET
+        timestamp, engagement_id = _decode_cursor(cursor)
+        query = query.filter(or_(
+            models.GameEngagement.prediction_timestamp < timestamp,
+            and_(models.GameEngagement.prediction_timestamp == timestamp,
+                 models.GameEngagement.id < engagement_id)
+        ))
+
+    engagements = query \
+        .order_by(models.GameEngagement.prediction_timestamp.desc(), models.GameEngagement.id.desc()) \
+        .limit(limit + 1) \
         .all()
 
-    if not engagements:
+    if not engagements and not cursor:
         raise HTTPException(status_code=404, detail="No engagement predictions found")
 
+    if len(engagements) > limit:
+        engagements = engagements[:limit]
+        response.headers['X-Next-Cursor'] = _encode_cursor(engagements[-1])
+
     return engagements
 
 
+def _resolve_ids(db: Session, actuals: List[ActualEngagement]) -> List[ActualEngagement]:
+    """Actuals keyed by game_engagement id; prediction_ids not written yet are left out"""
+    prediction_ids = [actual.id.bytes for actual in actuals if isinstance(actual.id, uuid.UUID)]
+    ids = {}
+    if prediction_ids:
+        ids = dict(db.query(models.GameEngagement.prediction_id, models.GameEngagement.id)
+                   .filter(models.GameEngagement.prediction_id.in_(prediction_ids))
+                   .all())
+    resolved = []
+    for actual in actuals:
+        if isinstance(actual.id, uuid.UUID):
+            if actual.id.bytes not in ids:
+                continue
+            actual = ActualEngagement(id=ids[actual.id.bytes], actual_duration=actual.actual_duration)
+        resolved.append(actual)
+    return resolved
+
+
+def _apply_actuals(db: Session, actuals: List[ActualEngagement]) -> int:
+    """
+    Store observed durations and their accuracy, and fold the errors into
+    engagement_accuracy, all set-wise. Each actual changes one aggregate row by
+    a delta, so re-reporting a record replaces its earlier contribution.
+    """
+    actuals = _resolve_ids(db, actuals)
+    if not actuals:
+        return 0
+    params = {}
+    rows = []
+    for i, actual in enumerate({actual.id: actual for actual in actuals}.values()):
+        params[f"id_{i}"] = actual.id
+        params[f"actual_{i}"] = actual.actual_duration
+        rows.append(f"SELECT :id_{i} AS id, :actual_{i} AS actual_duration")
+    actuals_table = ' UNION ALL '.join(rows)
+
+    # Must read the previous actual_duration/accuracy, so it runs before the UPDATE
+    db.execute(text(f"""
+        INSERT INTO engagement_accuracy (model_version, game_id, window_start, n_actuals, abs_error_sum, ape_sum)
+        SELECT COALESCE(ge.model_version, 'unknown'),
+               ge.game_id,
+               TIMESTAMP(DATE(ge.prediction_timestamp), MAKETIME(HOUR(ge.prediction_timestamp), 0, 0)),
+               SUM(ge.actual_duration IS NULL),
+               SUM(ABS(ge.engagement_duration - actuals.actual_duration)
+                   - COALESCE(ABS(ge.engagement_duration - ge.actual_duration), 0)),
+               SUM(ABS(ge.engagement_duration - actuals.actual_duration) / actuals.actual_duration * 100
+                   - COALESCE(ge.accuracy, 0))
+        FROM game_engagement ge
+        JOIN ({actuals_table}) actuals ON actuals.id = ge.id
+        GROUP BY 1, 2, 3
+        ON DUPLICATE KEY UPDATE
+            n_actuals = n_actuals + VALUES(n_actuals),
+            abs_error_sum = abs_error_sum + VALUES(abs_error_sum),
+            ape_sum = ape_sum + VALUES(ape_sum)
+    """), params)
+
+    result = db.execute(text(f"""
+        UPDATE game_engagement ge
+        JOIN ({actuals_table}) actuals ON actuals.id = ge.id
+        SET ge.actual_duration = actuals.actual_duration,
+            ge.accuracy = ABS(ge.engagement_duration - actuals.actual_duration) / actuals.actual_duration * 100
+    """), params)
+    db.commit()
+    return result.rowcount
+
+
+@app.put("/engagements/actual")
+def report_actual_engagements(actuals: List[ActualEngagement], db: Session = Depends(get_db)):
+    """Record many observed durations and their accuracy in one pass"""
+    if not actuals:
+        return {"updated": 0}
+    if len(actuals) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} actuals per request")
+
+    return {"updated": _apply_actuals(db, actuals)}
+
+
 @app.put("/engagements/{engagement_id}/actual")
 def update_actual_engagement(
-        engagement_id: int,
+        engagement_id: Union[int, uuid.UUID],
         actual_duration: int,
         db: Session = Depends(get_db)
 ):
-    engagement = db.query(models.GameEngagement) \
-        .filter(models.GameEngagement.id == engagement_id) \
-        .first()
+    """engagement_id is the game_engagement id or the prediction_id returned by the predict endpoints"""
+    if actual_duration <= 0:
+        raise HTTPException(status_code=422, detail="actual_duration must be positive")
+
+    actuals = _resolve_ids(db, [ActualEngagement(id=engagement_id, actual_duration=actual_duration)])
+    engagement = None
+    if actuals:
+        engagement = db.query(models.GameEngagement.id) \
+            .filter(models.GameEngagement.id == actuals[0].id) \
+            .first()
 
     if not engagement:
         raise HTTPException(status_code=404, detail="Engagement record not found")
 
-    engagement.actual_duration = actual_duration
-    engagement.accuracy = abs(engagement.engagement_duration - actual_duration) / actual_duration * 100
+    _apply_actuals(db, actuals)
+    return {"message": "Actual engagement duration updated"}
 
-    db.commit()
-    return {"message": "Actual engagement duration updated"}
\ No newline at end of file
+
+@app.get("/accuracy")
+def get_accuracy(
+        model_version: Optional[str] = None,
+        game_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        per_window: bool = False,
+        db: Session = Depends(get_db)
+):
+    """Running MAE (minutes) and MAPE (%) per model version and game, optionally per hour of prediction"""
+    accuracy = models.EngagementAccuracy
+    group_by = [accuracy.model_version, accuracy.game_id]
+    if per_window:
+        group_by.append(accuracy.window_start)
+
+    query = db.query(*group_by, func.sum(accuracy.n_actuals), func.sum(accuracy.abs_error_sum),
+                     func.sum(accuracy.ape_sum))
+    if model_version:
+        query = query.filter(accuracy.model_version == model_version)
+    if game_id:
+        query = query.filter(accuracy.game_id == uuid.UUID(game_id).bytes)
+    if since:
+        query = query.filter(accuracy.window_start >= since)
+    if until:
+        query = query.filter(accuracy.window_start < until)
+
+    results = []
+    for row in query.group_by(*group_by).order_by(*group_by).all():
+        n_actuals, abs_error_sum, ape_sum = row[-3:]
+        if not n_actuals:
+            continue
+        result = {
+            "model_version": row[0],
+            "game_id": str(uuid.UUID(bytes=row[1])),
+            "n_actuals": int(n_actuals),
+            "mae": round(abs_error_sum / n_actuals, 3),
+            "mape": round(ape_sum / n_actuals, 3),
+        }
+        if per_window:
+            result["window_start"] = row[2]
+        results.append(result)
+    return {"current_model_version": predictor.version, "accuracy": results}
+
+
+@app.get("/drift")
+def get_drift():
+    """PSI of the last DRIFT_WINDOW_SIZE request inputs against the training distribution"""
+    if drift_monitor is None:
+        raise HTTPException(status_code=503, detail="Drift monitoring is disabled: no usable training data")
+    return {"window_size": drift_monitor.window_size, "features": drift_monitor.report()}
@@ -1,15 +1,32 @@
+import hashlib
+import os
 
 import joblib
+import numpy as np
 import pandas as pd
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import StandardScaler
 
 
+MODEL_PATH = 'rf_engagement_model.pkl'
+
+
+def _fingerprint(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
 class EngagementPredictor:
     def __init__(self):
-        self.model = joblib.load('rf_engagement_model.pkl')
+        self.model = joblib.load(MODEL_PATH)
         self.scaler = joblib.load('scaler.pkl')
+        # Stored with each prediction so accuracy is tracked per model
+        self.version = os.getenv('MODEL_VERSION') or _fingerprint(MODEL_PATH)
 
-    def predict(self, features):
+    def predict_batch(self, features: pd.DataFrame) -> np.ndarray:
+        """Predicted durations for every row, from one scaler and one model call"""
         scaled_features = self.scaler.transform(features)
-        return self.model.predict(scaled_features)[0]
\ No newline at end of file
+        return self.model.predict(scaled_features)
+
+    def predict(self, features):
+        return self.predict_batch(features)[0]
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Enum
+from sqlalchemy import Column, Integer, String, Float, DateTime, Enum, Index
 from sqlalchemy.dialects.mysql import BINARY
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
@@ -22,11 +22,31 @@ class Gender(enum.Enum):
 
 class GameEngagement(Base):
     __tablename__ = "game_engagement"
+    __table_args__ = (
+        # Per-player history, newest first
+        Index('idx_game_engagement_player_time', 'player_id', 'prediction_timestamp'),
+        # Assigned when the prediction is made, before the row is written
+        Index('uq_game_engagement_prediction_id', 'prediction_id', unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    prediction_id = Column(BINARY(16), nullable=True)
     player_id = Column(BINARY(16))
     game_id = Column(BINARY(16))
     engagement_duration = Column(Integer)  # in minutes
     prediction_timestamp = Column(DateTime, default=datetime.utcnow)
     actual_duration = Column(Integer, nullable=True)
-    accuracy = Column(Float, nullable=True)
\ No newline at end of file
+    accuracy = Column(Float, nullable=True)
+    model_version = Column(String(64), nullable=True)
+
+
+class EngagementAccuracy(Base):
+    """Running error sums of reported actuals per model version, game and hour of prediction"""
+    __tablename__ = "engagement_accuracy"
+
+    model_version = Column(String(64), primary_key=True)
+    game_id = Column(BINARY(16), primary_key=True)
+    window_start = Column(DateTime, primary_key=True)
+    n_actuals = Column(Integer, nullable=False, default=0)
+    abs_error_sum = Column(Float, nullable=False, default=0)
+    ape_sum = Column(Float, nullable=False, default=0)  # sum of per-row accuracy (absolute % error)
\ No newline at end of file
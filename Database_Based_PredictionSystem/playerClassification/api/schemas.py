@@ -1,6 +1,7 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field, validator
+from typing import Optional, Union
 from datetime import datetime
+import uuid
 
 
 class GameEngagementBase(BaseModel):
@@ -22,9 +23,21 @@ class GameEngagementCreate(GameEngagementBase):
 
 
 class GameEngagementResponse(GameEngagementBase):
-    id: int
+    # Not known yet when the record is still queued for writing
+    id: Optional[int] = None
+    # Returned by the predict endpoints; report actuals with it
+    prediction_id: Optional[str] = None
     engagement_duration: int
     prediction_timestamp: datetime
 
+    @validator('prediction_id', pre=True)
+    def prediction_id_from_bytes(cls, value):
+        return str(uuid.UUID(bytes=value)) if isinstance(value, bytes) else value
+
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+
+class ActualEngagement(BaseModel):
+    id: Union[int, uuid.UUID] = Field(..., description="game_engagement id or the prediction_id of a prediction")
+    actual_duration: int = Field(..., gt=0, description="Observed engagement in minutes")
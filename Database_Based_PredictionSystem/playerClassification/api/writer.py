@@ -0,0 +1,99 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionWriter:
+    """
+    Writes prediction records from a background thread, so requests return
+    without waiting for a commit. Records are bulk-inserted in batches of up to
+    batch_size, at least every flush_interval seconds. When max_pending records
+    are waiting, submit blocks until the writer catches up.
+
+    A failed batch is retried up to max_attempts times with a growing delay,
+    then written one record at a time, so a single bad record or a short
+    outage does not lose the whole batch.
+    """
+
+    def __init__(self, session_factory, batch_size: int = 500, flush_interval: float = 0.5,
+                 max_pending: int = 100000, max_attempts: int = 3, retry_delay: float = 0.5):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._stop = object()
+        self._thread = threading.Thread(target=self._run, name='prediction-writer', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Write everything still queued, then stop the thread"""
+        self._queue.put(self._stop)
+        self._thread.join()
+
+    def submit(self, records: List[Dict[str, Any]]) -> None:
+        for record in records:
+            self._queue.put(record)
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if first is self._stop:
+                break
+
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is self._stop:
+                    stopping = True
+                    break
+                batch.append(record)
+            self._write(batch)
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        for attempt in range(1, self.max_attempts + 1):
+            error = self._insert(batch)
+            if error is None:
+                return
+            logger.warning(f"Failed to write {len(batch)} engagement predictions "
+                           f"(attempt {attempt}/{self.max_attempts}): {str(error)}")
+            if attempt < self.max_attempts:
+                time.sleep(self.retry_delay * attempt)
+
+        failed = 0
+        for record in batch:
+            error = self._insert([record])
+            if error is not None:
+                failed += 1
+                last_error = error
+        if failed:
+            logger.error(f"Dropped {failed} of {len(batch)} engagement predictions: {str(last_error)}")
+
+    def _insert(self, records: List[Dict[str, Any]]) -> Optional[Exception]:
+        db = self.session_factory()
+        try:
+            # One multi-row INSERT, no per-object identity map or refresh
+            db.bulk_insert_mappings(models.GameEngagement, records)
+            db.commit()
+            return None
+        except Exception as e:
+            db.rollback()
+            return e
+        finally:
+            db.close()
@@ -1,8 +1,12 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, Field
+import copy
+import os
 import pickle
 import numpy as np
-from typing import Dict
+from typing import Any, Dict, List
+
+from matchups import router as matchups_router
 
 app = FastAPI(
     title="Game Win Probability Prediction API",
@@ -34,6 +38,10 @@ class PlayerStats(BaseModel):
         }
 
 
+# Head-to-head win probabilities from the Glicko ratings
+app.include_router(matchups_router)
+
+
 # Load the saved model and scaler
 try:
     with open('win_probability_model.pkl', 'rb') as f:
@@ -43,6 +51,72 @@ try:
 except FileNotFoundError as e:
     raise RuntimeError("Model files not found. Please ensure model files are in the correct location.")
 
+MAX_BATCH_SIZE = 10000
+
+
+def _trees(estimator) -> list:
+    """Fitted decision trees of a tree or tree ensemble; empty for anything else"""
+    if hasattr(estimator, 'tree_'):
+        return [estimator]
+    estimators = getattr(estimator, 'estimators_', None)
+    if estimators is None:
+        return []
+    return [tree for tree in np.ravel(estimators) if hasattr(tree, 'tree_')]
+
+
+def fold_scaler(estimator, standard_scaler):
+    """
+    Copy of estimator that takes unscaled features, with the StandardScaler
+    folded into it: linear coefficients are divided by the scale and the
+    intercept absorbs the mean, tree split thresholds are mapped back to raw
+    units. Returns None for estimators it cannot fold.
+
+    Trees compare float32 inputs, so a row lying exactly on a split can land
+    on the other side than with transform + predict; probabilities otherwise match.
+    """
+    mean = standard_scaler.mean_ if standard_scaler.mean_ is not None else 0.0
+    scale = standard_scaler.scale_ if standard_scaler.scale_ is not None else 1.0
+    mean = np.broadcast_to(mean, (standard_scaler.n_features_in_,))
+    scale = np.broadcast_to(scale, (standard_scaler.n_features_in_,))
+
+    folded = copy.deepcopy(estimator)
+    if hasattr(folded, 'coef_') and hasattr(folded, 'intercept_'):
+        coef = np.asarray(estimator.coef_, dtype=float)
+        folded.coef_ = coef / scale
+        folded.intercept_ = estimator.intercept_ - (coef * mean / scale).sum(axis=-1)
+        return folded
+
+    trees = _trees(folded)
+    if not trees:
+        return None
+    for tree in trees:
+        # threshold is a view of the tree's node array; leaves have feature -2
+        features = tree.tree_.feature
+        split = features >= 0
+        tree.tree_.threshold[split] = tree.tree_.threshold[split] * scale[features[split]] + mean[features[split]]
+    return folded
+
+
+# FOLD_SCALER=true scores raw features with the folded model, skipping scaler.transform
+folded_model = fold_scaler(model, scaler) if os.getenv('FOLD_SCALER', 'false').lower() == 'true' else None
+
+
+def predict_win_probabilities(features: np.ndarray) -> np.ndarray:
+    """Win probability for each row of raw features, in one predict_proba call"""
+    if folded_model is not None:
+        return folded_model.predict_proba(features)[:, 1]
+    return model.predict_proba(scaler.transform(features))[:, 1]
+
+
+def build_features(players: List[PlayerStats]) -> np.ndarray:
+    features = np.array([
+        (p.avg_session_duration, p.historical_win_rate, p.avg_moves_per_game, p.total_games_played, p.age)
+        for p in players
+    ], dtype=float)
+    # games_experience (log transformed), for all rows at once
+    features[:, 3] = np.log1p(features[:, 3])
+    return features
+
 
 @app.get("/")
 async def root():
@@ -51,6 +125,8 @@ async def root():
         "status": "active",
         "endpoints": {
             "/predict": "POST - Get win probability prediction",
+            "/predict/batch": "POST - Win probabilities for many (player, game) rows, in request order",
+            "/predict/matchups": "POST - Head-to-head win probabilities for candidate pairings",
             "/health": "GET - Check API health"
         }
     }
@@ -61,30 +137,15 @@ async def health_check():
     return {
         "status": "healthy",
         "model_loaded": model is not None,
-        "scaler_loaded": scaler is not None
+        "scaler_loaded": scaler is not None,
+        "scaler_folded": folded_model is not None
     }
 
 
-@app.post("/predict", response_model=Dict[str, float])
+@app.post("/predict", response_model=Dict[str, Any])
 async def predict_win_probability(player_stats: PlayerStats):
     try:
-        # Calculate games_experience (log transformed)
-        games_experience = np.log1p(player_stats.total_games_played)
-
-        # Create feature array
-        features = np.array([[
-            player_stats.avg_session_duration,
-            player_stats.historical_win_rate,
-            player_stats.avg_moves_per_game,
-            games_experience,
-            player_stats.age
-        ]])
-
-        # Scale features
-        scaled_features = scaler.transform(features)
-
-        # Get prediction probability
-        win_probability = model.predict_proba(scaled_features)[0][1]
+        win_probability = predict_win_probabilities(build_features([player_stats]))[0]
 
         return {
             "player_id": player_stats.player_id,
@@ -99,6 +160,27 @@ async def predict_win_probability(player_stats: PlayerStats):
         )
 
 
+@app.post("/predict/batch", response_model=List[Dict[str, Any]])
+async def predict_win_probability_batch(players: List[PlayerStats]):
+    # A list rather than a map by player_id: one player may be scored for several games
+    if len(players) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} players per batch")
+    if not players:
+        return []
+    try:
+        win_probabilities = predict_win_probabilities(build_features(players))
+        return [
+            {"player_id": p.player_id, "game_name": p.game_name, "win_probability": float(probability)}
+            for p, probability in zip(players, win_probabilities)
+        ]
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error making prediction: {str(e)}"
+        )
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,124 @@
+"""
+Head-to-head win probabilities from the Glicko ratings in
+player_skill_ratings, which the analytics consumer updates after every
+game.over event.
+
+For ratings r1, r2 with deviations RD1, RD2, player 1 wins with probability
+1 / (1 + 10 ** (-g(sqrt(RD1² + RD2²)) * (r1 - r2) / 400)), so uncertain ratings
+give probabilities closer to 0.5. Players without a rating for the game start
+at 1500 with deviation 350. One query loads the ratings of every player in the request, and the
+probabilities for all pairs are computed as a single array expression.
+"""
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy import bindparam, create_engine, text
+
+load_dotenv()
+
+DB_USER = os.getenv('DB_USER')
+DB_PASSWORD = os.getenv('DB_PASSWORD')
+DB_HOST = os.getenv('DB_HOST', 'localhost')
+DB_PORT = os.getenv('DB_PORT', '3306')
+DB_NAME = os.getenv('DB_NAME', 'platform_analytics')
+
+DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4"
+engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+
+INITIAL_RATING = 1500.0
+INITIAL_DEVIATION = 350.0
+Q = np.log(10) / 400
+MAX_PAIRS = 100000
+# players x players matrix responses
+MAX_MATRIX_PLAYERS = 500
+
+router = APIRouter()
+
+
+class MatchupPair(BaseModel):
+    player1_id: str
+    player2_id: str
+
+
+class MatchupRequest(BaseModel):
+    game_name: str = Field(..., min_length=1, max_length=100)
+    pairs: List[MatchupPair] = Field(default_factory=list, description="Candidate pairings to score")
+    players: List[str] = Field(default_factory=list,
+                               description="Score every pairing among these players (matrix response)")
+
+
+def load_ratings(game_name: str, player_ids: List[str]) -> Dict[str, Tuple[float, float]]:
+    """(rating, deviation) keyed by the ids as given, for the players that have one"""
+    query = text("""
+        SELECT LOWER(HEX(r.player_id)), r.rating, r.rating_deviation
+        FROM player_skill_ratings r
+        JOIN games g ON g.game_id = r.game_id
+        WHERE g.name = :game_name AND r.player_id IN :player_ids
+    """).bindparams(bindparam('player_ids', expanding=True))
+
+    # Binary ids are built here rather than with UUID_TO_BIN per value in SQL
+    by_hex = {player_id.replace('-', '').lower(): player_id for player_id in player_ids}
+    binary_ids = [bytes.fromhex(hex_id) for hex_id in by_hex]
+    with engine.connect() as conn:
+        rows = conn.execute(query, {'game_name': game_name, 'player_ids': binary_ids}).fetchall()
+    return {by_hex[hex_id]: (float(rating), float(deviation)) for hex_id, rating, deviation in rows}
+
+
+def win_probabilities(ratings1: np.ndarray, deviations1: np.ndarray,
+                      ratings2: np.ndarray, deviations2: np.ndarray) -> np.ndarray:
+    """Probability that the first player wins, element-wise or broadcast"""
+    combined = np.sqrt(deviations1 ** 2 + deviations2 ** 2)
+    g = 1.0 / np.sqrt(1.0 + 3.0 * Q ** 2 * combined ** 2 / np.pi ** 2)
+    return 1.0 / (1.0 + np.power(10.0, -g * (ratings1 - ratings2) / 400.0))
+
+
+@router.post("/predict/matchups")
+def predict_matchups(request: MatchupRequest):
+    if not request.pairs and not request.players:
+        raise HTTPException(status_code=422, detail="Provide pairs or players")
+    if len(request.pairs) > MAX_PAIRS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_PAIRS} pairs per request")
+    if len(request.players) > MAX_MATRIX_PLAYERS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_MATRIX_PLAYERS} players per matrix")
+
+    player_ids = list(dict.fromkeys(
+        [pair.player1_id for pair in request.pairs] + [pair.player2_id for pair in request.pairs]
+        + request.players
+    ))
+    try:
+        known = load_ratings(request.game_name, player_ids)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Player ids must be UUIDs")
+
+    index = {player_id: i for i, player_id in enumerate(player_ids)}
+    unrated = (INITIAL_RATING, INITIAL_DEVIATION)
+    ratings, deviations = np.array([known.get(player_id, unrated) for player_id in player_ids]).reshape(-1, 2).T
+
+    response = {"game_name": request.game_name}
+    if request.pairs:
+        first = np.fromiter((index[pair.player1_id] for pair in request.pairs), dtype=np.int64)
+        second = np.fromiter((index[pair.player2_id] for pair in request.pairs), dtype=np.int64)
+        probabilities = win_probabilities(ratings[first], deviations[first], ratings[second], deviations[second])
+        response["pairs"] = [
+            {"player1_id": pair.player1_id, "player2_id": pair.player2_id,
+             "player1_win_probability": round(float(probability), 4)}
+            for pair, probability in zip(request.pairs, probabilities)
+        ]
+    if request.players:
+        selected = [index[player_id] for player_id in request.players]
+        rating, deviation = ratings[selected], deviations[selected]
+        # Row i, column j: probability that players[i] beats players[j]
+        response["players"] = request.players
+        response["matrix"] = np.round(win_probabilities(rating[:, None], deviation[:, None],
+                                                        rating[None, :], deviation[None, :]), 4).tolist()
+
+    response["ratings"] = {
+        player_id: {"rating": float(ratings[index[player_id]]),
+                    "rating_deviation": float(deviations[index[player_id]])}
+        for player_id in player_ids
+    }
+    return response
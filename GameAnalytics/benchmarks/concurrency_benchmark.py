@@ -0,0 +1,95 @@
+"""
+Concurrency benchmark for the Player Statistics API.
+
+Runs N concurrent clients against one or more endpoints for a fixed duration and
+reports throughput and latency percentiles. Start the API with the response cache
+disabled to measure the database path rather than cache hits:
+
+    STATS_CACHE_ENABLED=false uvicorn player_statistics_API_new:app --port 8001
+    python benchmarks/concurrency_benchmark.py --concurrency 100 --duration 30
+
+Requires httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+from typing import List
+
+import httpx
+
+DEFAULT_PATHS = [
+    "/api/stats/players",
+    "/api/stats/most-played-games",
+    "/api/stats/top-players",
+    "/api/stats/top-players/battleship",
+]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def client_loop(client: httpx.AsyncClient, paths: List[str], deadline: float,
+                      latencies: List[float], statuses: Counter, offset: int):
+    i = offset
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            response = await client.get(path)
+            statuses[response.status_code] += 1
+        except httpx.HTTPError as e:
+            statuses[type(e).__name__] += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(base_url: str, paths: List[str], concurrency: int, duration: float, timeout: float):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        # Warm up the connection pools on both sides
+        await asyncio.gather(*(client.get(path) for path in paths))
+
+        latencies: List[float] = []
+        statuses: Counter = Counter()
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(
+            client_loop(client, paths, deadline, latencies, statuses, offset)
+            for offset in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"\nTarget:       {base_url}")
+    print(f"Endpoints:    {', '.join(paths)}")
+    print(f"Concurrency:  {concurrency} clients for {elapsed:.1f}s")
+    print(f"Requests:     {len(latencies)} completed")
+    print(f"Throughput:   {len(latencies) / elapsed:.1f} req/s")
+    print(f"Latency p50:  {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"Latency p95:  {percentile(latencies, 95) * 1000:.1f} ms")
+    print(f"Latency p99:  {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"Latency max:  {(latencies[-1] if latencies else 0) * 1000:.1f} ms")
+    print(f"Status codes: {dict(statuses)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrency benchmark for the Player Statistics API")
+    parser.add_argument("--url", default="http://localhost:8001", help="Base URL of the API")
+    parser.add_argument("--path", action="append", dest="paths",
+                        help="Endpoint path to request (repeatable, defaults to the main stats endpoints)")
+    parser.add_argument("--concurrency", type=int, default=100, help="Number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=30, help="Benchmark duration in seconds")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.url, args.paths or DEFAULT_PATHS, args.concurrency, args.duration, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
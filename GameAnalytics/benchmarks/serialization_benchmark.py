@@ -0,0 +1,120 @@
+"""
+Serialization benchmark for the Player Statistics API.
+
+Compares the response time of the original serialization path (row dicts
+re-validated through response_model=List[PlayerStats]) and of row dicts
+encoded by orjson against RowEncoder, which encodes the row tuples without
+building dicts, for synthetic result sets shaped like the player_game_stats
+query. All variants are mounted on an in-process FastAPI app, so the timings
+include FastAPI's own response handling but no database or network time.
+
+Run from the GameAnalytics directory with the API requirements plus httpx:
+
+    python benchmarks/serialization_benchmark.py --rows 10000 --repeat 20
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from decimal import Decimal
+from typing import List
+
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from player_statistics_API_new import PlayerStats  # noqa: E402
+from row_encoder import RowEncoder, dumps  # noqa: E402
+
+COLUMNS = list(getattr(PlayerStats, 'model_fields', None) or PlayerStats.__fields__)
+GAMES = ['battleship', 'chess', 'checkers', 'reversi', 'connect four']
+COUNTRIES = ['USA', 'Japan', 'Brazil', 'Canada', 'South Korea', 'Belgium']
+GENDERS = ['Male', 'Female', 'Non-Binary']
+
+
+def make_rows(count: int, seed: int = 42) -> List[tuple]:
+    """Rows as the MySQL driver returns them (DECIMAL win_ratio, int counters)"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        games = rng.randint(1, 300)
+        wins = rng.randint(0, games)
+        rows.append((
+            f"Player {i}",
+            rng.choice(GAMES),
+            games,
+            wins,
+            games - wins,
+            games * rng.randint(20, 60),
+            games * rng.randint(10, 40),
+            Decimal(f"{wins * 100 / games:.2f}"),
+            rng.randint(13, 70),
+            rng.choice(GENDERS),
+            rng.choice(COUNTRIES),
+        ))
+    return rows
+
+
+def build_app(rows: List[tuple]) -> FastAPI:
+    app = FastAPI()
+    encoder = RowEncoder.for_model(PlayerStats)
+
+    @app.get("/validated", response_model=List[PlayerStats])
+    async def validated():
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    @app.get("/dicts", response_model=List[PlayerStats])
+    async def dicts():
+        return Response(content=dumps([dict(zip(COLUMNS, row)) for row in rows]), media_type="application/json")
+
+    @app.get("/encoded", response_model=List[PlayerStats])
+    async def encoded():
+        chunks = [rows[i:i + 1000] for i in range(0, len(rows), 1000)]
+        return Response(content=encoder.encode(COLUMNS, chunks).body, media_type="application/json")
+
+    return app
+
+
+def time_endpoint(client: TestClient, path: str, repeat: int) -> List[float]:
+    client.get(path)  # warm-up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(path)
+        timings.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Statistics API serialization paths")
+    parser.add_argument("--rows", type=int, default=10000, help="Rows per response")
+    parser.add_argument("--repeat", type=int, default=20, help="Requests per variant")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    client = TestClient(build_app(rows))
+
+    # All paths must produce the same document
+    expected = client.get("/validated").json()
+    assert client.get("/dicts").json() == expected
+    assert client.get("/encoded").json() == expected
+
+    print(f"Response time for {args.rows} rows over {args.repeat} requests:")
+    results = {}
+    for name, path in (("pydantic + jsonable_encoder", "/validated"), ("row dicts + orjson", "/dicts"),
+                       ("RowEncoder + orjson", "/encoded")):
+        timings = time_endpoint(client, path, args.repeat)
+        results[name] = statistics.median(timings)
+        print(f"  {name:<28} median {results[name] * 1000:8.1f} ms   "
+              f"min {min(timings) * 1000:8.1f} ms   max {max(timings) * 1000:8.1f} ms")
+
+    baseline, dicts, fast = results.values()
+    print(f"Speed-up: {baseline / fast:.1f}x over pydantic, {dicts / fast:.2f}x over row dicts")
+
+
+if __name__ == "__main__":
+    main()
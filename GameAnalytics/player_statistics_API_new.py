@@ -1,13 +1,18 @@
-from fastapi import FastAPI, HTTPException, Query, Depends
+from fastapi import FastAPI, HTTPException, Query, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import Session
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
 import os
+import ssl
 from dotenv import load_dotenv
 
+from profiling import install_profiling
+from row_encoder import RowEncoder
+from stats_cache import StatsCache, GLOBAL_SCOPE, ROSTER_SCOPE, game_scope, player_scope
+
 # Load environment variables
 load_dotenv()
 
@@ -17,15 +22,44 @@ DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_HOST = os.getenv('DB_HOST', 'localhost')
 DB_PORT = os.getenv('DB_PORT', '3306')
 DB_NAME = 'platform_analytics'
-SSL_CA = os.getenv('SSL_CA', '/etc/ssl/certs/ca-certificates.crt')
+# CA bundle of the MySQL server; unset to connect without TLS (local MySQL)
+SSL_CA = os.getenv('SSL_CA', '')
+
+# Connection pool sizing, shared by all requests on this worker
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+# Recycle before Azure MySQL drops idle connections
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+
+
+
+def build_ssl_context(ca_path: str) -> Optional[ssl.SSLContext]:
+    """TLS context for aiomysql, or None when no CA bundle is configured"""
+    if not ca_path:
+        return None
+    if not os.path.isfile(ca_path):
+        raise RuntimeError(f"SSL_CA={ca_path} does not exist; point it at the MySQL server's CA bundle "
+                           f"or unset it to connect without TLS")
+    try:
+        return ssl.create_default_context(cafile=ca_path)
+    except (ssl.SSLError, OSError) as e:
+        raise RuntimeError(f"SSL_CA={ca_path} is not a readable PEM CA bundle: {e}") from e
+
 
-# Build database URL with SSL configuration(remove the SSL configuration when running the api locally)
-DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?ssl_ca={SSL_CA}&ssl_verify_cert=true"
+# Build async database URL, SSL is passed to aiomysql as a context
+DATABASE_URL = f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ssl_context = build_ssl_context(SSL_CA)
 
-# Create engine
-engine = create_engine(
+# Create async engine so queries no longer block the event loop
+engine = create_async_engine(
     DATABASE_URL,
-    pool_pre_ping=True
+    pool_pre_ping=True,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    connect_args={"ssl": ssl_context} if ssl_context is not None else {}
 )
 
 app = FastAPI(
@@ -51,8 +85,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# Opt-in sampling profiler (PROFILING_TOKEN)
+install_profiling(app)
+
+# Response cache invalidated by the analytics consumer through stats_cache_versions
+stats_cache = StatsCache()
+
 # Updated Pydantic model
 class PlayerStats(BaseModel):
     player_name: str
@@ -70,13 +111,23 @@ class PlayerStats(BaseModel):
     class Config:
         from_attributes = True
 
+# Rows are encoded straight from the cursor in PlayerStats field order; the
+# response_model declarations still document the schema in OpenAPI
+player_stats_encoder = RowEncoder.for_model(PlayerStats)
+
+def like_pattern(term: str, prefix: bool = False) -> str:
+    """
+    LIKE pattern for names containing term, or starting with it when prefix is
+    set; only prefix patterns can use the read model's name indexes. The name
+    columns are case-insensitive and wildcards typed by the user match literally.
+    """
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%' if prefix else '%' + escaped + '%'
+
 # Database dependency
-def get_db():
-    db = Session(engine)
-    try:
+async def get_db():
+    async with AsyncSession(engine) as db:
         yield db
-    finally:
-        db.close()
 
 # Updated API Endpoints
 @app.get("/")
@@ -95,80 +146,85 @@ async def root():
     }
 
 @app.get("/api/stats/players", response_model=List[PlayerStats])
-async def get_all_player_stats(db: Session = Depends(get_db)):
+async def get_all_player_stats(request: Request, db: AsyncSession = Depends(get_db)):
     """
     Get statistics for all players.
     """
     try:
+        cached = await stats_cache.lookup(request, db)
+        if cached is not None:
+            return cached
+
         query = text("""
-            SELECT 
-                CONCAT(p.firstname, ' ', p.lastname) as player_name,
-                g.name as game_name,
-                pgs.total_games_played,
-                pgs.total_wins,
-                pgs.total_losses,
-                pgs.total_moves,
-                pgs.total_time_played_minutes,
-                pgs.win_ratio,
-                TIMESTAMPDIFF(YEAR, p.birthdate, CURRENT_DATE) as age,
-                p.gender,
-                p.country
-            FROM player_game_stats pgs
-            JOIN players p ON pgs.player_id = p.player_id
-            JOIN games g ON pgs.game_id = g.game_id
-            ORDER BY pgs.last_played DESC
+            SELECT
+                player_name,
+                game_name,
+                total_games_played,
+                total_wins,
+                total_losses,
+                total_moves,
+                total_time_played_minutes,
+                win_ratio,
+                age,
+                gender,
+                country
+            FROM player_game_stats_view
+            ORDER BY last_played DESC
         """)
 
-        result = db.execute(query)
-        stats = [dict(zip(result.keys(), row)) for row in result.fetchall()]
+        result = await db.stream(query)
+        stats = await player_stats_encoder.encode_stream(result)
 
-        if not stats:
+        if not stats.row_count:
             raise HTTPException(status_code=404, detail="No player statistics found")
 
-        return stats
+        return stats_cache.respond_raw(request, stats.body, [GLOBAL_SCOPE])
     except Exception as e:
         print(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail="Error retrieving player statistics")
 
 @app.get("/api/stats/game/{game_name}", response_model=List[PlayerStats])
 async def get_game_stats(
+        request: Request,
         game_name: str,
-        db: Session = Depends(get_db)
+        prefix: bool = Query(False, description="Only match game names starting with game_name"),
+        db: AsyncSession = Depends(get_db)
 ):
     """
-    Get all player statistics for a specific game.
+    Get all player statistics for the games whose name contains game_name (case-insensitive).
     """
     try:
-        # Convert search term to lowercase for consistent matching
-        search_term = game_name.lower()
+        cached = await stats_cache.lookup(request, db)
+        if cached is not None:
+            return cached
 
         query = text("""
-                SELECT 
-                    CONCAT(p.firstname, ' ', p.lastname) as player_name,
-                    g.name as game_name,
-                    pgs.total_games_played,
-                    pgs.total_wins,
-                    pgs.total_losses,
-                    pgs.total_moves,
-                    pgs.total_time_played_minutes,
-                    pgs.win_ratio,
-                    TIMESTAMPDIFF(YEAR, p.birthdate, CURRENT_DATE) as age,
-                    p.gender,
-                    p.country
-                FROM player_game_stats pgs
-                JOIN players p ON pgs.player_id = p.player_id
-                JOIN games g ON pgs.game_id = g.game_id
-                WHERE LOWER(g.name) LIKE :search_term
-                ORDER BY pgs.win_ratio DESC, pgs.total_games_played DESC
+                SELECT
+                    player_name,
+                    game_name,
+                    total_games_played,
+                    total_wins,
+                    total_losses,
+                    total_moves,
+                    total_time_played_minutes,
+                    win_ratio,
+                    age,
+                    gender,
+                    country
+                FROM player_game_stats_view
+                WHERE game_name LIKE :search_term
+                ORDER BY win_ratio DESC, total_games_played DESC
             """)
 
-        result = db.execute(query, {"search_term": f"%{search_term}%"})
-        stats = [dict(zip(result.keys(), row)) for row in result.fetchall()]
+        result = await db.stream(query, {"search_term": like_pattern(game_name, prefix)})
+        stats = await player_stats_encoder.encode_stream(result, collect="game_name")
 
-        if not stats:
+        if not stats.row_count:
             raise HTTPException(status_code=404, detail=f"No games found matching '{game_name}'")
 
-        return stats
+        scopes = {game_scope(name) for name in stats.collected}
+        scopes.add(ROSTER_SCOPE)
+        return stats_cache.respond_raw(request, stats.body, scopes)
     except Exception as e:
         print(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail="Error retrieving game statistics")
@@ -176,170 +232,184 @@ async def get_game_stats(
 
 @app.get("/api/stats/search/player/{player_name}", response_model=List[PlayerStats])
 async def search_by_player_name(
+        request: Request,
         player_name: str,
-        db: Session = Depends(get_db)
+        prefix: bool = Query(False, description="Only match player names starting with player_name"),
+        db: AsyncSession = Depends(get_db)
 ):
     """
-    Search players by player name (case sensitive).
+    Search players whose name contains player_name (case-insensitive).
     """
     try:
-        # Convert search term to lowercase for consistent matching
-        search_term = player_name.lower()
+        cached = await stats_cache.lookup(request, db)
+        if cached is not None:
+            return cached
 
         query = text("""
-            SELECT 
-                CONCAT(p.firstname, ' ', p.lastname) as player_name,
-                g.name as game_name,
-                pgs.total_games_played,
-                pgs.total_wins,
-                pgs.total_losses,
-                pgs.total_moves,
-                pgs.total_time_played_minutes,
-                pgs.win_ratio,
-                TIMESTAMPDIFF(YEAR, p.birthdate, CURRENT_DATE) as age,
-                p.gender,
-                p.country
-            FROM player_game_stats pgs
-            JOIN players p ON pgs.player_id = p.player_id
-            JOIN games g ON pgs.game_id = g.game_id
-            WHERE LOWER(CONCAT(p.firstname, ' ', p.lastname)) LIKE :search_term
-            ORDER BY pgs.win_ratio DESC, pgs.total_games_played DESC
+            SELECT
+                player_name,
+                game_name,
+                total_games_played,
+                total_wins,
+                total_losses,
+                total_moves,
+                total_time_played_minutes,
+                win_ratio,
+                age,
+                gender,
+                country,
+                BIN_TO_UUID(player_id) AS player_id
+            FROM player_game_stats_view
+            WHERE player_name LIKE :search_term
+            ORDER BY win_ratio DESC, total_games_played DESC
         """)
 
-        result = db.execute(query, {"search_term": f"%{search_term}%"})
-        stats = [dict(zip(result.keys(), row)) for row in result.fetchall()]
+        result = await db.stream(query, {"search_term": like_pattern(player_name, prefix)})
+        # player_id is not part of the response, only collected for the cache scopes
+        stats = await player_stats_encoder.encode_stream(result, collect="player_id")
 
-        if not stats:
+        if not stats.row_count:
             raise HTTPException(status_code=404, detail=f"No players found matching '{player_name}'")
 
-        return stats
+        scopes = {player_scope(player_id) for player_id in stats.collected}
+        scopes.add(ROSTER_SCOPE)
+        return stats_cache.respond_raw(request, stats.body, scopes)
     except Exception as e:
         print(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail="Error searching for player")
 @app.get("/api/stats/most-played-games")
 async def get_most_played_games(
+    request: Request,
     limit: int = Query(10, ge=1, le=50, description="Number of games to return"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get the most played games ranked by total matches played.
     """
     try:
+        cached = await stats_cache.lookup(request, db)
+        if cached is not None:
+            return cached
+
         query = text("""
-            SELECT 
-                g.name as game_name,
-                COUNT(DISTINCT pgs.player_id) as unique_players,
-                SUM(pgs.total_games_played) as total_matches,
-                AVG(pgs.win_ratio) as average_win_ratio
-            FROM player_game_stats pgs
-            JOIN games g ON pgs.game_id = g.game_id
-            GROUP BY g.name
+            SELECT
+                game_name,
+                COUNT(DISTINCT player_id) as unique_players,
+                SUM(total_games_played) as total_matches,
+                AVG(win_ratio) as average_win_ratio
+            FROM player_game_stats_view
+            GROUP BY game_name
             ORDER BY total_matches DESC
             LIMIT :limit
         """)
 
-        result = db.execute(query, {"limit": limit})
+        result = await db.execute(query, {"limit": limit})
         games = [dict(zip(result.keys(), row)) for row in result.fetchall()]
 
         if not games:
             raise HTTPException(status_code=404, detail="No games found")
 
-        return games
+        return stats_cache.respond(request, games, [GLOBAL_SCOPE])
     except Exception as e:
         print(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail="Error retrieving most played games")
 
 @app.get("/api/stats/top-players/{game_name}", response_model=List[PlayerStats])
 async def get_top_players_by_game(
+    request: Request,
     game_name: str,
     limit: int = Query(3, ge=1, le=10, description="Number of top players to return"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get the top players for a specific game, ranked by win ratio and total games played.
     """
     try:
+        cached = await stats_cache.lookup(request, db)
+        if cached is not None:
+            return cached
+
         query = text("""
-            SELECT 
-                CONCAT(p.firstname, ' ', p.lastname) as player_name,
-                g.name as game_name,
-                pgs.total_games_played,
-                pgs.total_wins,
-                pgs.total_losses,
-                pgs.total_moves,
-                pgs.total_time_played_minutes,
-                pgs.win_ratio,
-                TIMESTAMPDIFF(YEAR, p.birthdate, CURRENT_DATE) as age,
-                p.gender,
-                p.country
-            FROM player_game_stats pgs
-            JOIN players p ON pgs.player_id = p.player_id
-            JOIN games g ON pgs.game_id = g.game_id
-            WHERE g.name = :game_name
-            ORDER BY pgs.total_games_played DESC, pgs.win_ratio DESC
+            SELECT
+                player_name,
+                game_name,
+                total_games_played,
+                total_wins,
+                total_losses,
+                total_moves,
+                total_time_played_minutes,
+                win_ratio,
+                age,
+                gender,
+                country
+            FROM player_game_stats_view
+            WHERE game_name = :game_name
+            ORDER BY total_games_played DESC, win_ratio DESC
             LIMIT :limit
         """)
 
-        result = db.execute(query, {"game_name": game_name, "limit": limit})
-        players = [dict(zip(result.keys(), row)) for row in result.fetchall()]
+        result = await db.stream(query, {"game_name": game_name, "limit": limit})
+        players = await player_stats_encoder.encode_stream(result)
 
-        if not players:
+        if not players.row_count:
             raise HTTPException(status_code=404, detail=f"No players found for game {game_name}")
 
-        return players
+        return stats_cache.respond_raw(request, players.body, [game_scope(game_name)])
     except Exception as e:
         print(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail="Error retrieving top players")
 
 
 @app.get("/api/stats/top-players")
-async def get_top_three_players_per_game(db: Session = Depends(get_db)):
+async def get_top_three_players_per_game(request: Request, db: AsyncSession = Depends(get_db)):
     """
     Get the top 3 players for each game in the database.
     """
     try:
+        cached = await stats_cache.lookup(request, db)
+        if cached is not None:
+            return cached
+
         query = text("""
             WITH RankedPlayers AS (
                 SELECT 
-                    CONCAT(p.firstname, ' ', p.lastname) as player_name,
-                    g.name as game_name,
-                    pgs.total_games_played,
-                    pgs.total_wins,
-                    pgs.total_losses,
-                    pgs.win_ratio,
+                    player_name,
+                    game_name,
+                    total_games_played,
+                    total_wins,
+                    total_losses,
+                    win_ratio,
                     -- Calculate weighted score for ranking
                     (
-                        (pgs.win_ratio * 0.40) +  -- 40% weight to win ratio
-                        (LEAST(100, (pgs.total_games_played / 2)) * 0.25) +  -- 25% weight to games played (capped at 100)
+                        (win_ratio * 0.40) +  -- 40% weight to win ratio
+                        (LEAST(100, (total_games_played / 2)) * 0.25) +  -- 25% weight to games played (capped at 100)
                         (CASE  -- 20% weight to recent performance
-                            WHEN DATEDIFF(CURRENT_TIMESTAMP, pgs.last_played) < 30 THEN 100
-                            WHEN DATEDIFF(CURRENT_TIMESTAMP, pgs.last_played) < 60 THEN 75
-                            WHEN DATEDIFF(CURRENT_TIMESTAMP, pgs.last_played) < 90 THEN 50
+                            WHEN DATEDIFF(CURRENT_TIMESTAMP, last_played) < 30 THEN 100
+                            WHEN DATEDIFF(CURRENT_TIMESTAMP, last_played) < 60 THEN 75
+                            WHEN DATEDIFF(CURRENT_TIMESTAMP, last_played) < 90 THEN 50
                             ELSE 25
                         END * 0.20) +
-                        (LEAST(100, (pgs.total_time_played_minutes / 60)) * 0.15)  -- 15% weight to time invested
+                        (LEAST(100, (total_time_played_minutes / 60)) * 0.15)  -- 15% weight to time invested
                     ) as player_score,
                     ROW_NUMBER() OVER (
-                        PARTITION BY g.game_id 
+                        PARTITION BY game_id 
                         ORDER BY 
                             (
-                                (pgs.win_ratio * 0.40) +
-                                (LEAST(100, (pgs.total_games_played / 2)) * 0.25) +
+                                (win_ratio * 0.40) +
+                                (LEAST(100, (total_games_played / 2)) * 0.25) +
                                 (CASE 
-                                    WHEN DATEDIFF(CURRENT_TIMESTAMP, pgs.last_played) < 30 THEN 100
-                                    WHEN DATEDIFF(CURRENT_TIMESTAMP, pgs.last_played) < 60 THEN 75
-                                    WHEN DATEDIFF(CURRENT_TIMESTAMP, pgs.last_played) < 90 THEN 50
+                                    WHEN DATEDIFF(CURRENT_TIMESTAMP, last_played) < 30 THEN 100
+                                    WHEN DATEDIFF(CURRENT_TIMESTAMP, last_played) < 60 THEN 75
+                                    WHEN DATEDIFF(CURRENT_TIMESTAMP, last_played) < 90 THEN 50
                                     ELSE 25
                                 END * 0.20) +
-                                (LEAST(100, (pgs.total_time_played_minutes / 60)) * 0.15)
+                                (LEAST(100, (total_time_played_minutes / 60)) * 0.15)
                             ) DESC
                     ) as player_rank
-                FROM player_game_stats pgs
-                JOIN players p ON pgs.player_id = p.player_id
-                JOIN games g ON pgs.game_id = g.game_id
+                FROM player_game_stats_view
                 WHERE 
-                    pgs.total_games_played >= 10  -- Minimum games threshold
-                    AND DATEDIFF(CURRENT_TIMESTAMP, pgs.last_played) <= 90  -- Active in last 90 days
+                    total_games_played >= 10  -- Minimum games threshold
+                    AND last_played >= CURRENT_DATE - INTERVAL 90 DAY  -- Active in last 90 days
             )
             SELECT 
                 player_name,
@@ -355,7 +425,7 @@ async def get_top_three_players_per_game(db: Session = Depends(get_db)):
             ORDER BY game_name, player_rank;
         """)
 
-        result = db.execute(query)
+        result = await db.execute(query)
         rows = result.fetchall()
 
         if not rows:
@@ -378,7 +448,7 @@ async def get_top_three_players_per_game(db: Session = Depends(get_db)):
             }
             top_players[game_name].append(player_data)
 
-        return {
+        return stats_cache.respond(request, {
             "games": [
                 {
                     "game_name": game,
@@ -386,7 +456,7 @@ async def get_top_three_players_per_game(db: Session = Depends(get_db)):
                 }
                 for game, players in top_players.items()
             ]
-        }
+        }, [GLOBAL_SCOPE])
 
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -0,0 +1,153 @@
+"""
+Opt-in sampling profiler for the FastAPI services.
+
+Enabled only when PROFILING_TOKEN is set; every call must send it in the
+X-Profiling-Token header, otherwise the endpoints answer 404.
+
+    # Whole process for 10 seconds, one sample every 5 ms
+    curl -H "X-Profiling-Token: $TOKEN" "localhost:8001/admin/profile?seconds=10&interval_ms=5" > out.folded
+
+    # A single request; the response carries X-Profile-Id
+    curl -i -H "X-Profiling-Token: $TOKEN" -H "X-Profile: 1" localhost:8001/api/stats/players
+    curl -H "X-Profiling-Token: $TOKEN" localhost:8001/admin/profiles/<id> > request.folded
+
+Both return collapsed stacks ("frame;frame;frame count" per line) that
+flamegraph.pl, speedscope or inferno read directly. A background thread
+samples sys._current_frames(), so nothing is traced and the profiled code runs
+at full speed apart from the sampler's share of the GIL.
+
+Request profiles sample the event loop thread, where the async endpoints run.
+Other requests that are handled at the same time show up in them too.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+DEFAULT_INTERVAL_MS = float(os.getenv('PROFILING_INTERVAL_MS', '5'))
+# Finer by default so that requests of a few milliseconds still get samples
+REQUEST_INTERVAL_MS = float(os.getenv('PROFILING_REQUEST_INTERVAL_MS', '1'))
+MAX_SECONDS = 120
+# Request profiles kept for /admin/profiles/{id}
+MAX_STORED_PROFILES = 50
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def collapse_stack(frame) -> str:
+    """Root-first, semicolon-separated frame names"""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler:
+    """Counts the stacks of the sampled threads every interval seconds"""
+
+    def __init__(self, interval: float, thread_id: Optional[int] = None):
+        self.interval = interval
+        # None samples every thread except the sampler itself
+        self.thread_id = thread_id
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            if self.thread_id is not None:
+                frame = frames.get(self.thread_id)
+                if frame is not None:
+                    self.counts[collapse_stack(frame)] += 1
+            else:
+                for thread_id, frame in frames.items():
+                    if thread_id != own_id:
+                        self.counts[collapse_stack(frame)] += 1
+            self.samples += 1
+
+    def start(self) -> 'SamplingProfiler':
+        self._thread.start()
+        return self
+
+    def stop(self) -> str:
+        self._stopped.set()
+        self._thread.join()
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return ''.join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+def _check_token(request: Request) -> None:
+    if not PROFILING_TOKEN or request.headers.get('X-Profiling-Token') != PROFILING_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+def install_profiling(app: FastAPI) -> None:
+    """Add /admin/profile, /admin/profiles/{id} and the X-Profile request trigger when PROFILING_TOKEN is set"""
+    if not PROFILING_TOKEN:
+        return
+
+    # One process-wide profile at a time
+    lock = threading.Lock()
+    profiles: 'OrderedDict[str, str]' = OrderedDict()
+
+    @app.get("/admin/profile", response_class=PlainTextResponse, include_in_schema=False)
+    async def profile(request: Request,
+                      seconds: float = Query(10, gt=0, le=MAX_SECONDS),
+                      interval_ms: float = Query(DEFAULT_INTERVAL_MS, ge=1, le=1000)):
+        _check_token(request)
+        if not lock.acquire(blocking=False):
+            raise HTTPException(status_code=409, detail="A profile is already running")
+        try:
+            profiler = SamplingProfiler(interval_ms / 1000).start()
+            try:
+                # The loop keeps serving traffic while the profile is taken
+                await asyncio.sleep(seconds)
+            finally:
+                collapsed = profiler.stop()
+        finally:
+            lock.release()
+        return PlainTextResponse(collapsed, headers={'X-Profile-Samples': str(profiler.samples)})
+
+    @app.get("/admin/profiles/{profile_id}", response_class=PlainTextResponse, include_in_schema=False)
+    async def stored_profile(profile_id: str, request: Request):
+        _check_token(request)
+        if profile_id not in profiles:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return PlainTextResponse(profiles[profile_id])
+
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        if 'X-Profile' not in request.headers or request.headers.get('X-Profiling-Token') != PROFILING_TOKEN:
+            return await call_next(request)
+
+        profiler = SamplingProfiler(REQUEST_INTERVAL_MS / 1000, thread_id=threading.get_ident()).start()
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            collapsed = profiler.stop()
+        profile_id = uuid.uuid4().hex
+        profiles[profile_id] = collapsed
+        while len(profiles) > MAX_STORED_PROFILES:
+            profiles.popitem(last=False)
+        response.headers['X-Profile-Id'] = profile_id
+        response.headers['X-Profile-Samples'] = str(profiler.samples)
+        response.headers['X-Profile-Seconds'] = f"{time.perf_counter() - start:.4f}"
+        return response
@@ -0,0 +1,247 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import text
+
+from row_encoder import dumps
+
+# Cache configuration
+CACHE_ENABLED = os.getenv('STATS_CACHE_ENABLED', 'true').lower() == 'true'
+CACHE_TTL_SECONDS = float(os.getenv('STATS_CACHE_TTL_SECONDS', '300'))
+CACHE_MAX_ENTRIES = int(os.getenv('STATS_CACHE_MAX_ENTRIES', '512'))
+VERSION_POLL_SECONDS = float(os.getenv('STATS_CACHE_VERSION_POLL_SECONDS', '1'))
+# Optional directory shared by all workers on the same host
+SHARED_CACHE_DIR = os.getenv('STATS_CACHE_DIR', '')
+
+# Scope bumped by the analytics consumer for every committed match
+GLOBAL_SCOPE = 'global'
+# Scope bumped by refresh_player_game_stats_view when a (player, game) pair gets
+# its first read-model row, e.g. with a new game's or a new player's first match.
+# Name searches depend on it: such a row can match a search cached without it.
+ROSTER_SCOPE = 'roster'
+
+
+def game_scope(game_name: str) -> str:
+    """Scope bumped by the analytics consumer when a match of this game is committed"""
+    return f"game:{game_name.lower()}"
+
+
+def player_scope(player_id: str) -> str:
+    """Scope bumped by the analytics consumer when a match of this player is committed"""
+    return f"player:{player_id.lower()}"
+
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    etag: str
+    versions: Dict[str, int]
+    expires_at: float
+
+
+class VersionTracker:
+    """
+    Keeps a recent snapshot of the stats_cache_versions table.
+
+    The table is small (one row per game and per active player plus the global
+    and roster scopes), so it is re-read at most once every VERSION_POLL_SECONDS
+    instead of running the endpoint query.
+    """
+
+    def __init__(self, poll_seconds: float):
+        self.poll_seconds = poll_seconds
+        self.versions: Dict[str, int] = {}
+        self.last_poll = 0.0
+        self.available = False
+        self.lock = threading.Lock()
+
+    async def snapshot(self, db) -> Optional[Dict[str, int]]:
+        """Return the current versions, or None when they cannot be read"""
+        now = time.monotonic()
+        if now - self.last_poll >= self.poll_seconds:
+            # Claim the poll before awaiting so concurrent requests reuse the old snapshot
+            self.last_poll = now
+            try:
+                result = await db.execute(text("SELECT scope, version FROM stats_cache_versions"))
+                versions = {row[0]: int(row[1]) for row in result.fetchall()}
+                with self.lock:
+                    self.versions = versions
+                    self.available = True
+            except Exception as e:
+                print(f"Cache version poll failed, bypassing cache: {str(e)}")
+                with self.lock:
+                    self.available = False
+
+        with self.lock:
+            return dict(self.versions) if self.available else None
+
+
+class SharedDiskCache:
+    """Second cache tier stored as one pickle file per key, shared between workers"""
+
+    def __init__(self, directory: str, ttl_seconds: float):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.entry')
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"Error writing shared cache entry: {str(e)}")
+            return
+
+        self.writes += 1
+        if self.writes % 100 == 0:
+            self._prune()
+
+    def _prune(self) -> None:
+        """Remove entries that have outlived the TTL"""
+        cutoff = time.time() - self.ttl_seconds
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+class StatsCache:
+    """
+    TTL + LRU cache of serialized endpoint responses.
+
+    Each entry records the versions of the scopes it was built from. The analytics
+    consumer bumps those versions in stats_cache_versions when it commits a match,
+    so an entry is served only while none of its scopes has changed.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: float = CACHE_TTL_SECONDS,
+                 poll_seconds: float = VERSION_POLL_SECONDS, shared_dir: str = SHARED_CACHE_DIR,
+                 enabled: bool = CACHE_ENABLED):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.version_tracker = VersionTracker(poll_seconds)
+        self.shared = SharedDiskCache(shared_dir, ttl_seconds) if shared_dir else None
+
+    @staticmethod
+    def _key(request: Request) -> str:
+        query = '&'.join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        return f"{request.url.path}?{query}"
+
+    @staticmethod
+    def _is_fresh(entry: CacheEntry, versions: Dict[str, int]) -> bool:
+        if entry.expires_at < time.time():
+            return False
+        return all(versions.get(scope, 0) == version for scope, version in entry.versions.items())
+
+    @staticmethod
+    def _etag_matches(request: Request, etag: str) -> bool:
+        if_none_match = request.headers.get('if-none-match')
+        if not if_none_match:
+            return False
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in candidates or etag in candidates or f"W/{etag}" in candidates
+
+    def _build_response(self, request: Request, entry: CacheEntry, cache_status: str) -> Response:
+        headers = {
+            'ETag': entry.etag,
+            'Cache-Control': 'no-cache',
+            'X-Cache': cache_status
+        }
+        if self._etag_matches(request, entry.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type='application/json', headers=headers)
+
+    def _get(self, key: str, versions: Dict[str, int]) -> Optional[CacheEntry]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if self._is_fresh(entry, versions):
+                    self.entries.move_to_end(key)
+                    return entry
+                del self.entries[key]
+
+        if self.shared is not None:
+            entry = self.shared.get(key)
+            if entry is not None and self._is_fresh(entry, versions):
+                self._put_local(key, entry)
+                return entry
+        return None
+
+    def _put_local(self, key: str, entry: CacheEntry) -> None:
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    async def lookup(self, request: Request, db) -> Optional[Response]:
+        """
+        Return the cached response for this request, or None on a miss.
+
+        The version snapshot used for the check is kept on the request so that
+        respond() tags the new entry with versions read before the query ran.
+        """
+        request.state.cache_versions = None
+        if not self.enabled:
+            return None
+
+        versions = await self.version_tracker.snapshot(db)
+        if versions is None:
+            return None
+        request.state.cache_versions = versions
+
+        entry = self._get(self._key(request), versions)
+        if entry is None:
+            return None
+        return self._build_response(request, entry, 'HIT')
+
+    def respond(self, request: Request, payload: Any, scopes: Iterable[str]) -> Response:
+        """Serialize the payload, cache it under the given scopes and build the response"""
+        return self.respond_raw(request, dumps(payload), scopes)
+
+    def respond_raw(self, request: Request, body: bytes, scopes: Iterable[str]) -> Response:
+        """Cache an already encoded JSON body under the given scopes and build the response"""
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+
+        versions = getattr(request.state, 'cache_versions', None)
+        entry = CacheEntry(
+            body=body,
+            etag=etag,
+            versions={scope: versions.get(scope, 0) for scope in scopes} if versions is not None else {},
+            expires_at=time.time() + self.ttl_seconds
+        )
+
+        if versions is not None:
+            key = self._key(request)
+            self._put_local(key, entry)
+            if self.shared is not None:
+                self.shared.set(key, entry)
+
+        return self._build_response(request, entry, 'MISS')
@@ -1,113 +1,169 @@
-import pika
 import json
 import logging
-from datetime import datetime
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import mysql.connector
+
+# Run with communication/ on the import path, see communication/consumer_runtime.py
+from analytics_consumer import DBConfig, DatabaseConnection
+from consumer_metrics import start_metrics_server
+from consumer_runtime import ConsumerRuntime, Delivery, Subscription
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SHIPS = 5
+BATCH_SIZE = int(os.getenv('BATTLESHIP_BATCH_SIZE', '200'))
+BATCH_TIMEOUT_SECONDS = float(os.getenv('BATTLESHIP_BATCH_TIMEOUT_SECONDS', '1'))
+
+
+def _parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def match_metrics(match_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Derived metrics of one match.completed event; raises KeyError / ValueError for malformed ones"""
+    player1_id = str(uuid.UUID(match_data['player1Id']))
+    player2_id = str(uuid.UUID(match_data['player2Id']))
+    winner_id = str(uuid.UUID(match_data['winnerId']))
+    if winner_id not in (player1_id, player2_id):
+        raise ValueError(f"Winner {winner_id} did not play match {match_data['matchId']}")
+
+    start_time = _parse_time(match_data['startTime'])
+    end_time = _parse_time(match_data['endTime'])
+    player1_moves = int(match_data['player1MoveCounts'])
+    player2_moves = int(match_data['player2MoveCounts'])
+    winner_moves = player1_moves if winner_id == player1_id else player2_moves
+
+    return {
+        'match_id': str(uuid.UUID(match_data['matchId'])),
+        'game_id': str(uuid.UUID(match_data['gameId'])),
+        'player1_id': player1_id,
+        'player2_id': player2_id,
+        'winner_id': winner_id,
+        'start_time': start_time,
+        'end_time': end_time,
+        'duration_seconds': (end_time - start_time).total_seconds(),
+        'player1_moves': player1_moves,
+        'player2_moves': player2_moves,
+        'winner_moves_per_ship': winner_moves / SHIPS,
+    }
+
+
+def player_deltas(metrics: List[Dict[str, Any]]) -> List[tuple]:
+    """battleship_player_stats increments per player, sorted by player id so concurrent batches lock in one order"""
+    deltas: Dict[str, List] = {}
+    for match in metrics:
+        for player_id in (match['player1_id'], match['player2_id']):
+            delta = deltas.setdefault(player_id, [0, 0, 0.0, 0.0, match['end_time']])
+            delta[0] += 1
+            delta[2] += match['duration_seconds']
+            delta[4] = max(delta[4], match['end_time'])
+        winner = deltas[match['winner_id']]
+        winner[1] += 1
+        winner[3] += match['winner_moves_per_ship']
+    return [(player_id, *deltas[player_id]) for player_id in sorted(deltas)]
+
 
 class BattleshipMatchSubscriber:
-    def __init__(self):
+    def __init__(self, db_connection: DatabaseConnection):
         self.queue_name = 'battleship_queue'
         self.exchange_name = 'battleship_exchange'
         self.routing_key = 'match.completed'
-        self.connection = None
-        self.channel = None
-
-    def connect(self):
-        try:
-            credentials = pika.PlainCredentials('guest', 'guest')
-            parameters = pika.ConnectionParameters(
-                host='localhost',
-                port=5672,
-                credentials=credentials
-            )
-            self.connection = pika.BlockingConnection(parameters)
-            self.channel = self.connection.channel()
-
-            # Setup exchange and queue
-            self.channel.exchange_declare(
-                exchange=self.exchange_name,
-                exchange_type='direct',
-                durable=True
-            )
-
-            self.channel.queue_declare(
-                queue=self.queue_name,
-                durable=True
-            )
-
-            self.channel.queue_bind(
-                queue=self.queue_name,
-                exchange=self.exchange_name,
-                routing_key=self.routing_key
-            )
-
-            logger.info("Successfully connected to RabbitMQ")
-        except Exception as e:
-            logger.error(f"Error connecting to RabbitMQ: {str(e)}")
-            raise
-
-    def process_match_data(self, ch, method, properties, body):
-        try:
-            match_data = json.loads(body)
-
-            # Calculate game duration
-            start_time = datetime.fromisoformat(match_data['startTime'].replace('Z', '+00:00'))
-            end_time = datetime.fromisoformat(match_data['endTime'].replace('Z', '+00:00'))
-            duration = end_time - start_time
-
-            # Analyze and log match data
-            logger.info("Match Analysis:")
-            logger.info(f"Match ID: {match_data['matchId']}")
-            logger.info(f"Game ID: {match_data['gameId']}")
-            logger.info(f"Duration: {duration}")
-            logger.info(f"Winner: {match_data['winnerId']}")
-            logger.info(f"Player 1 moves: {match_data['player1MoveCounts']}")
-            logger.info(f"Player 2 moves: {match_data['player2MoveCounts']}")
-
-            # Calculate efficiency (moves per ship sunk - assuming 5 ships)
-            winner_moves = (match_data['player1MoveCounts']
-                            if match_data['winnerId'] == match_data['player1Id']
-                            else match_data['player2MoveCounts'])
-            efficiency = winner_moves / 5  # 5 ships
-            logger.info(f"Winner's moves per ship: {efficiency:.2f}")
-
-            # Acknowledge the message
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-
-        except Exception as e:
-            logger.error(f"Error processing match data: {str(e)}")
-            ch.basic_nack(delivery_tag=method.delivery_tag)
-
-    def start_consuming(self):
+        self.db = db_connection
+
+    def subscription(self) -> Subscription:
+        return Subscription(self.routing_key, self.queue_name, self.exchange_name, self.process_matches,
+                            batch_size=BATCH_SIZE, batch_timeout=BATCH_TIMEOUT_SECONDS, durable=True)
+
+    def process_matches(self, deliveries: List[Delivery]):
+        metrics = {}
+        for delivery in deliveries:
+            try:
+                match = match_metrics(json.loads(delivery.body))
+            except (json.JSONDecodeError, KeyError, ValueError, TypeError) as e:
+                # Would fail the same way on redelivery
+                logger.error(f"Invalid match data: {type(e).__name__}: {str(e)}")
+                delivery.nack(requeue=False)
+                continue
+            # Redeliveries of one match within a batch count once
+            metrics[match['match_id']] = match
+            logger.debug(f"Match {match['match_id']}: duration {match['duration_seconds']:.0f}s, "
+                         f"winner's moves per ship {match['winner_moves_per_ship']:.2f}")
+
+        if metrics:
+            stored = self.store(list(metrics.values()))
+            logger.info(f"Stored metrics of {stored} matches ({len(metrics) - stored} already stored)")
+
+    def store(self, metrics: List[Dict[str, Any]]) -> int:
+        """Insert the matches not stored yet and add them to the player aggregates in one transaction"""
+        with self.db.get_connection() as conn:
+            for attempt in range(2):
+                try:
+                    return self._store(conn, metrics)
+                except mysql.connector.Error as e:
+                    conn.rollback()
+                    # Another worker stored one of these matches between the SELECT and the
+                    # INSERT; the second attempt's SELECT sees it and leaves it out
+                    if e.errno != mysql.connector.errorcode.ER_DUP_ENTRY or attempt:
+                        raise
+                    logger.info("Batch overlaps matches stored concurrently, retrying")
+
+    @staticmethod
+    def _store(conn, metrics: List[Dict[str, Any]]) -> int:
+        cursor = conn.cursor()
         try:
-            self.channel.basic_qos(prefetch_count=1)
-            self.channel.basic_consume(
-                queue=self.queue_name,
-                on_message_callback=self.process_match_data
+            placeholders = ', '.join(['UUID_TO_BIN(%s)'] * len(metrics))
+            cursor.execute(
+                f"SELECT BIN_TO_UUID(match_id) FROM battleship_match_metrics WHERE match_id IN ({placeholders})",
+                [match['match_id'] for match in metrics]
             )
-
-            logger.info("Started consuming messages. Waiting for match data...")
-            self.channel.start_consuming()
-
-        except KeyboardInterrupt:
-            logger.info("Stopping consumer...")
-            self.channel.stop_consuming()
-        except Exception as e:
-            logger.error(f"Error in consumer: {str(e)}")
+            existing = {row[0] for row in cursor.fetchall()}
+            new = [match for match in metrics if match['match_id'] not in existing]
+            if not new:
+                return 0
+
+            cursor.executemany("""
+                INSERT INTO battleship_match_metrics (
+                    match_id, game_id, player1_id, player2_id, winner_id, start_time, end_time,
+                    duration_seconds, player1_moves, player2_moves, winner_moves_per_ship
+                ) VALUES (
+                    UUID_TO_BIN(%s), UUID_TO_BIN(%s), UUID_TO_BIN(%s), UUID_TO_BIN(%s), UUID_TO_BIN(%s),
+                    %s, %s, %s, %s, %s, %s
+                )
+            """, [(m['match_id'], m['game_id'], m['player1_id'], m['player2_id'], m['winner_id'],
+                   m['start_time'], m['end_time'], m['duration_seconds'], m['player1_moves'],
+                   m['player2_moves'], m['winner_moves_per_ship']) for m in new])
+
+            cursor.executemany("""
+                INSERT INTO battleship_player_stats (
+                    player_id, matches_played, wins, duration_seconds_sum, moves_per_ship_sum, last_match_at
+                ) VALUES (UUID_TO_BIN(%s), %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    matches_played = matches_played + VALUES(matches_played),
+                    wins = wins + VALUES(wins),
+                    duration_seconds_sum = duration_seconds_sum + VALUES(duration_seconds_sum),
+                    moves_per_ship_sum = moves_per_ship_sum + VALUES(moves_per_ship_sum),
+                    last_match_at = GREATEST(COALESCE(last_match_at, VALUES(last_match_at)), VALUES(last_match_at))
+            """, player_deltas(new))
+            conn.commit()
+            return len(new)
         finally:
-            if self.connection and not self.connection.is_closed:
-                self.connection.close()
+            cursor.close()
 
 
 if __name__ == "__main__":
-    subscriber = BattleshipMatchSubscriber()
+    start_metrics_server()
+    runtime = ConsumerRuntime()
+    db = DatabaseConnection(DBConfig(pool_name="battleship_pool", pool_size=runtime.concurrency))
+    runtime.register(BattleshipMatchSubscriber(db).subscription())
     try:
-        subscriber.connect()
-        subscriber.start_consuming()
-    except KeyboardInterrupt:
-        logger.info("Application stopped by user")
+        runtime.run()
     except Exception as e:
-        logger.error(f"Application error: {str(e)}")
\ No newline at end of file
+        logger.error(f"Application error: {str(e)}")
@@ -0,0 +1,241 @@
+"""
+Inference benchmark for the trained model artifacts.
+
+For every *_model.pkl under PredictionSystem/models/ and
+Database_Based_PredictionSystem/*/model/ this measures single-row latency,
+batch throughput at several batch sizes, size on disk and the resident memory
+the loaded model adds. Each model is benchmarked in its own fresh process so
+memory numbers are not polluted by the models loaded before it.
+
+Inputs are synthetic rows drawn around the paired *_scaler.pkl statistics and
+go through scaler.transform + predict_proba (or predict), as in the prediction
+APIs.
+
+Run from the repository root with the PredictionSystem requirements:
+
+    python PredictionSystem/benchmarks/model_benchmark.py --output report.json
+    python PredictionSystem/benchmarks/model_benchmark.py --update-baseline
+    python PredictionSystem/benchmarks/model_benchmark.py --threshold 0.25   # exits 1 on a regression
+"""
+import argparse
+import glob
+import json
+import os
+import pickle
+import platform
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+
+import numpy as np
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_PATTERNS = [
+    'PredictionSystem/models/*_model.pkl',
+    'Database_Based_PredictionSystem/*/model/*_model.pkl',
+]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_baseline.json')
+BATCH_SIZES = [1, 32, 256, 4096]
+
+# Compared against the baseline; for all of them a larger value is a regression
+TRACKED_METRICS = ('single_row_p50_ms', 'single_row_p95_ms', 'size_bytes', 'rss_bytes')
+
+
+def _rss_bytes() -> int:
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    return 0
+
+
+def _load(path: str):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _synthetic_rows(scaler, n_features: int, count: int, seed: int) -> np.ndarray:
+    """Rows around the training distribution when the scaler is known, standard normal otherwise"""
+    rng = np.random.RandomState(seed)
+    rows = rng.standard_normal((count, n_features))
+    if scaler is not None:
+        rows = rows * scaler.scale_ + scaler.mean_
+    return rows
+
+
+def benchmark_model(model_path: str, repeat: int, seed: int) -> Dict:
+    """Benchmark one artifact; runs inside a dedicated worker process"""
+    rss_before = _rss_bytes()
+    start = time.perf_counter()
+    model = _load(model_path)
+    scaler_path = model_path.replace('_model.pkl', '_scaler.pkl')
+    scaler = _load(scaler_path) if os.path.exists(scaler_path) else None
+    load_seconds = time.perf_counter() - start
+    # Memory held by the loaded artifacts, before any prediction buffers
+    rss_bytes = max(0, _rss_bytes() - rss_before)
+
+    n_features = getattr(model, 'n_features_in_', None)
+    if n_features is None:
+        return {'error': f"{type(model).__name__} does not expose n_features_in_"}
+    if scaler is not None and getattr(scaler, 'n_features_in_', n_features) != n_features:
+        scaler = None
+
+    method = 'predict_proba' if hasattr(model, 'predict_proba') else 'predict'
+    predict = getattr(model, method)
+
+    def run(rows):
+        return predict(scaler.transform(rows) if scaler is not None else rows)
+
+    rows = _synthetic_rows(scaler, n_features, max(BATCH_SIZES), seed)
+    run(rows[:1])  # warm-up
+
+    single = []
+    for i in range(repeat):
+        row = rows[i % len(rows):i % len(rows) + 1]
+        start = time.perf_counter()
+        run(row)
+        single.append((time.perf_counter() - start) * 1000)
+    single.sort()
+
+    throughput = {}
+    for batch_size in BATCH_SIZES:
+        batch = rows[:batch_size]
+        timings = []
+        for _ in range(max(3, repeat // 20)):
+            start = time.perf_counter()
+            run(batch)
+            timings.append(time.perf_counter() - start)
+        throughput[str(batch_size)] = round(batch_size / statistics.median(timings), 1)
+
+    size_bytes = os.path.getsize(model_path)
+    if scaler is not None:
+        size_bytes += os.path.getsize(scaler_path)
+
+    return {
+        'estimator': type(model).__name__,
+        'method': method,
+        'n_features': int(n_features),
+        'scaled': scaler is not None,
+        'load_seconds': round(load_seconds, 4),
+        'single_row_p50_ms': round(single[len(single) // 2], 4),
+        'single_row_p95_ms': round(single[int(len(single) * 0.95) - 1], 4),
+        'throughput_rows_per_second': throughput,
+        'size_bytes': size_bytes,
+        'rss_bytes': rss_bytes,
+    }
+
+
+def discover(patterns: List[str]) -> List[str]:
+    paths = set()
+    for pattern in patterns:
+        paths.update(glob.glob(os.path.join(REPO_ROOT, pattern)))
+    return sorted(paths)
+
+
+def run_benchmarks(paths: List[str], repeat: int, seed: int) -> Dict:
+    import sklearn
+
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'sklearn': sklearn.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'models': {},
+    }
+    for path in paths:
+        name = os.path.relpath(path, REPO_ROOT)
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+            try:
+                report['models'][name] = pool.submit(benchmark_model, path, repeat, seed).result()
+            except Exception as e:
+                report['models'][name] = {'error': str(e)}
+        print(f"{name}: {json.dumps(report['models'][name])}")
+    return report
+
+
+def _metrics(result: Dict) -> Dict[str, float]:
+    values = {metric: result[metric] for metric in TRACKED_METRICS if metric in result}
+    for batch_size, rows_per_second in result.get('throughput_rows_per_second', {}).items():
+        # Tracked as time per row so that larger is worse, like the other metrics
+        values[f'batch_{batch_size}_us_per_row'] = 1e6 / rows_per_second if rows_per_second else float('inf')
+    return values
+
+
+def compare(report: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Return a line per metric that got worse than the baseline by more than threshold"""
+    regressions = []
+    for name, result in report['models'].items():
+        base = baseline.get('models', {}).get(name)
+        if base is None or 'error' in base:
+            continue
+        if 'error' in result:
+            regressions.append(f"{name}: {result['error']}")
+            continue
+        current, previous = _metrics(result), _metrics(base)
+        for metric, value in current.items():
+            old = previous.get(metric)
+            if not old:
+                continue
+            change = (value - old) / old
+            if change > threshold:
+                regressions.append(f"{name}: {metric} {old:.4g} -> {value:.4g} (+{change:.0%})")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark inference cost of the trained models")
+    parser.add_argument("--models", nargs="+", default=DEFAULT_PATTERNS,
+                        help="Glob patterns of *_model.pkl files, relative to the repository root")
+    parser.add_argument("--repeat", type=int, default=200, help="Single-row predictions per model")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed relative regression per metric before failing (0.2 = 20%%)")
+    parser.add_argument("--update-baseline", action="store_true", help="Store this run as the new baseline")
+    args = parser.parse_args(argv)
+
+    paths = discover(args.models)
+    if not paths:
+        print("No model artifacts found")
+        return 1
+
+    report = run_benchmarks(paths, args.repeat, args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"No regressions above {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
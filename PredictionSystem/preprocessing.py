@@ -1,37 +1,41 @@
+import os
 import pickle
 import pandas as pd
 from typing import Dict, Optional
 
+# Directory with the *_model.pkl / *_scaler.pkl / *_encoders.pkl artifacts,
+# e.g. a versioned models/<version> directory written by `python -m training`
+MODEL_DIR = os.getenv('MODEL_DIR', 'models')
 
 # Load all models and components
 try:
     # Load all models as before...
-    with open('models/churn_model.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'churn_model.pkl'), 'rb') as f:
         churn_model = pickle.load(f)
-    with open('models/churn_scaler.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'churn_scaler.pkl'), 'rb') as f:
         churn_scaler = pickle.load(f)
-    with open('models/churn_encoders.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'churn_encoders.pkl'), 'rb') as f:
         churn_encoder = pickle.load(f)
 
-    with open('models/win_probability_model.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'win_probability_model.pkl'), 'rb') as f:
         win_model = pickle.load(f)
-    with open('models/win_probability_scaler.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'win_probability_scaler.pkl'), 'rb') as f:
         win_scaler = pickle.load(f)
-    with open('models/win_probability_encoders.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'win_probability_encoders.pkl'), 'rb') as f:
         win_encoder = pickle.load(f)
 
-    with open('models/engagement_model.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'engagement_model.pkl'), 'rb') as f:
         engagement_model = pickle.load(f)
-    with open('models/engagement_scaler.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'engagement_scaler.pkl'), 'rb') as f:
         engagement_scaler = pickle.load(f)
-    with open('models/engagement_encoders.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'engagement_encoders.pkl'), 'rb') as f:
         engagement_encoder = pickle.load(f)
 
-    with open('models/player_classification_model.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'player_classification_model.pkl'), 'rb') as f:
         classification_model = pickle.load(f)
-    with open('models/player_classification_scaler.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'player_classification_scaler.pkl'), 'rb') as f:
         classification_scaler = pickle.load(f)
-    with open('models/player_classification_encoders.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'player_classification_encoders.pkl'), 'rb') as f:
         classification_encoder = pickle.load(f)
 
 except Exception as e:
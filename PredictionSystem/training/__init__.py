@@ -0,0 +1 @@
+"""Reproducible training for the churn, win probability, engagement and player classification models."""
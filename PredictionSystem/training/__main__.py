@@ -0,0 +1,52 @@
+"""
+Train the prediction models from the command line.
+
+Run from the PredictionSystem directory:
+
+    python -m training --data player_game_statistics.csv
+    python -m training --data ../data/player_game_stats --models churn engagement --promote
+    python -m training --data ../data/player_game_stats --search halving --budget-seconds 600
+"""
+import argparse
+import logging
+
+from .models import MODEL_SPECS
+from .pipeline import run
+from .search import SearchConfig
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Train the player prediction models")
+    parser.add_argument("--data", default="player_game_statistics.csv",
+                        help="CSV/Parquet file or exported Parquet dataset directory")
+    parser.add_argument("--models", nargs="+", choices=list(MODEL_SPECS), help="Models to train (default: all)")
+    parser.add_argument("--output", default="models", help="Models directory; each run writes a version subdirectory")
+    parser.add_argument("--cache-dir", default=".training_cache", help="Directory for cached feature matrices")
+    parser.add_argument("--workers", type=int, help="Model worker processes (default: one per model up to the CPU count, 1 with --search)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for splits and estimators")
+    parser.add_argument("--promote", action="store_true",
+                        help="Also copy the new artifacts to the top-level models directory")
+    parser.add_argument("--search", choices=["halving", "random"],
+                        help="Tune hyperparameters with successive halving or randomized search")
+    parser.add_argument("--n-candidates", type=int, default=24, help="Configurations sampled per estimator")
+    parser.add_argument("--factor", type=int, default=3, help="Successive halving reduction factor")
+    parser.add_argument("--cv-folds", type=int, default=5, help="Cross-validation folds")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Parallel fold fits per search (-1 = all CPUs)")
+    parser.add_argument("--budget-seconds", type=float, help="Wall-clock search budget per model")
+    args = parser.parse_args()
+
+    search = None
+    if args.search:
+        search = SearchConfig(method=args.search, n_candidates=args.n_candidates, factor=args.factor,
+                              cv_folds=args.cv_folds, n_jobs=args.n_jobs, budget_seconds=args.budget_seconds)
+
+    run(args.data, args.models, args.output, args.cache_dir, args.workers, args.seed, args.promote, search)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Training data loading from the exported CSV or Parquet dataset."""
+import hashlib
+import os
+
+import pandas as pd
+
+
+def load_dataset(path: str) -> pd.DataFrame:
+    """
+    Load player game statistics from a CSV file or a dataset directory written by
+    dataExport/player_stats_export.py (Parquet, partitioned by game_name).
+    """
+    if os.path.isdir(path):
+        import pyarrow.dataset as ds
+
+        df = ds.dataset(path, format='parquet', partitioning='hive').to_table().to_pandas()
+        df['game_name'] = df['game_name'].astype(str)
+        # Incremental exports append newer versions of changed rows
+        if 'last_played' in df.columns:
+            df = (df.sort_values('last_played')
+                    .drop_duplicates(subset=['player_id', 'game_id'], keep='last'))
+        return df.reset_index(drop=True)
+
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def fingerprint(df: pd.DataFrame) -> str:
+    """Content hash of the data, used to key cached feature matrices and artifacts"""
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    digest = hashlib.sha1(row_hashes.tobytes())
+    digest.update(','.join(df.columns).encode())
+    return digest.hexdigest()[:16]
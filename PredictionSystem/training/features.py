@@ -0,0 +1,68 @@
+"""Feature engineering shared by all prediction models."""
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder
+
+# Bump when the encoding below changes so cached feature matrices are rebuilt
+FEATURE_VERSION = 1
+
+# Categorical column -> (encoder key in the *_encoders.pkl dict, encoded feature name)
+CATEGORICAL_COLUMNS = {
+    'gender': ('gender_encoder', 'gender_encoded'),
+    'country': ('country_encoder', 'country_encoded'),
+    'game_name': ('game_encoder', 'game_encoded'),
+}
+
+
+def add_derived_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Add the ratio features the models expect when the source data lacks them"""
+    df = df.copy()
+    if 'win_ratio' not in df.columns:
+        df['win_ratio'] = (df['total_wins'] / df['total_games_played']) * 100
+    return df
+
+
+def fit_encoders(df: pd.DataFrame, include_level: bool = False) -> Dict[str, LabelEncoder]:
+    """
+    Fit one LabelEncoder per categorical column.
+
+    As in the notebooks, 'unknown' is added to every vocabulary so unseen values
+    at prediction time still map to a known index.
+    """
+    encoders = {}
+    for column, (key, _) in CATEGORICAL_COLUMNS.items():
+        encoder = LabelEncoder()
+        encoder.fit(list(df[column].astype(str).unique()) + ['unknown'])
+        encoders[key] = encoder
+
+    if include_level:
+        level_encoder = LabelEncoder()
+        level_encoder.fit(df['player_level'].astype(str))
+        encoders['level_encoder'] = level_encoder
+    return encoders
+
+
+def safe_transform(encoder: LabelEncoder, series: pd.Series) -> np.ndarray:
+    """
+    Vectorized equivalent of the notebooks' safe_transform: known values map to
+    their index, anything else to the last class index.
+    """
+    mapping = {value: index for index, value in enumerate(encoder.classes_)}
+    unknown_value = len(encoder.classes_) - 1
+    return series.astype(str).map(mapping).fillna(unknown_value).astype(np.int64).to_numpy()
+
+
+def encode_frame(df: pd.DataFrame, encoders: Dict[str, LabelEncoder]) -> pd.DataFrame:
+    """Add the *_encoded columns used as model inputs"""
+    df = df.copy()
+    for column, (key, encoded_column) in CATEGORICAL_COLUMNS.items():
+        df[encoded_column] = safe_transform(encoders[key], df[column])
+    if 'level_encoder' in encoders and 'player_level' in df.columns:
+        df['player_level_encoded'] = safe_transform(encoders['level_encoder'], df['player_level'])
+    return df
+
+
+def feature_matrix(df: pd.DataFrame, features: List[str]) -> np.ndarray:
+    return df[features].to_numpy(dtype=np.float64)
@@ -0,0 +1,113 @@
+"""Definitions of the four prediction models trained by the pipeline."""
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from sklearn.ensemble import (GradientBoostingClassifier, GradientBoostingRegressor,
+                              RandomForestClassifier, RandomForestRegressor)
+from sklearn.linear_model import LinearRegression, LogisticRegression
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.svm import SVC, SVR
+
+
+@dataclass
+class ModelSpec:
+    name: str
+    # Artifacts are written as <artifact_prefix>_model.pkl / _scaler.pkl / _encoders.pkl
+    artifact_prefix: str
+    task: str  # 'classification' or 'regression'
+    features: List[str]
+    target: str
+    # Candidate estimators by display name, built from the random seed
+    candidates: Dict[str, Callable[[int], object]]
+    include_level_encoder: bool = False
+    # Encode the target with the level encoder (player classification)
+    encode_target: bool = False
+    # Oversample the minority class with SMOTE, within each CV fold and for the final fit (churn)
+    balance_classes: bool = False
+    # cross_val_score scoring, None uses the estimator's default (accuracy / R2)
+    scoring: Optional[str] = None
+    stratified_cv: bool = False
+    # Hyperparameter search space per candidate name (see search.py); candidates
+    # without an entry are trained with their default parameters
+    param_spaces: Dict[str, Dict[str, list]] = field(default_factory=dict)
+
+
+# Search spaces, taken from the notebooks' GridSearchCV grids
+FOREST_SPACE = {'n_estimators': [100, 200, 300], 'max_depth': [None, 10, 20], 'min_samples_split': [2, 5, 10]}
+BOOSTING_SPACE = {'n_estimators': [100, 200], 'learning_rate': [0.01, 0.1, 0.2], 'max_depth': [3, 5, 7]}
+LOGISTIC_SPACE = {'C': [0.1, 1, 10], 'solver': ['liblinear', 'lbfgs']}
+SVM_SPACE = {'C': [0.1, 1, 10], 'kernel': ['linear', 'rbf']}
+KNN_SPACE = {'n_neighbors': [3, 5, 7, 11], 'weights': ['uniform', 'distance']}
+
+
+MODEL_SPECS: Dict[str, ModelSpec] = {
+    'churn': ModelSpec(
+        name='churn',
+        artifact_prefix='churn',
+        task='classification',
+        features=['total_games_played', 'win_ratio', 'total_time_played_minutes', 'total_moves',
+                  'gender_encoded', 'country_encoded', 'game_encoded', 'age'],
+        target='is_churned',
+        candidates={
+            'Random Forest': lambda seed: RandomForestClassifier(random_state=seed, class_weight='balanced'),
+            'Gradient Boosting': lambda seed: GradientBoostingClassifier(random_state=seed),
+            'Logistic Regression': lambda seed: LogisticRegression(random_state=seed, class_weight='balanced'),
+            # probability=True because the prediction API calls predict_proba
+            'SVM': lambda seed: SVC(random_state=seed, class_weight='balanced', probability=True),
+        },
+        balance_classes=True,
+        stratified_cv=True,
+        param_spaces={'Random Forest': FOREST_SPACE, 'Gradient Boosting': BOOSTING_SPACE,
+                      'Logistic Regression': LOGISTIC_SPACE, 'SVM': SVM_SPACE},
+    ),
+    'win_probability': ModelSpec(
+        name='win_probability',
+        artifact_prefix='win_probability',
+        task='regression',
+        features=['total_games_played', 'total_moves', 'total_wins', 'total_losses',
+                  'player_level_encoded', 'gender_encoded', 'country_encoded', 'age', 'game_encoded'],
+        target='win_probability',
+        candidates={
+            'Random Forest': lambda seed: RandomForestRegressor(random_state=seed),
+            'Gradient Boosting': lambda seed: GradientBoostingRegressor(random_state=seed),
+            'Linear Regression': lambda seed: LinearRegression(),
+            'SVR': lambda seed: SVR(kernel='rbf'),
+        },
+        include_level_encoder=True,
+        scoring='r2',
+        param_spaces={'Random Forest': FOREST_SPACE, 'Gradient Boosting': BOOSTING_SPACE, 'SVR': SVM_SPACE},
+    ),
+    'engagement': ModelSpec(
+        name='engagement',
+        artifact_prefix='engagement',
+        task='regression',
+        features=['total_games_played', 'win_ratio', 'gender_encoded', 'country_encoded', 'age', 'game_encoded'],
+        target='total_time_played_minutes',
+        candidates={
+            'Random Forest': lambda seed: RandomForestRegressor(random_state=seed),
+            'Gradient Boosting': lambda seed: GradientBoostingRegressor(random_state=seed),
+            'Linear Regression': lambda seed: LinearRegression(),
+            'SVR': lambda seed: SVR(kernel='rbf'),
+        },
+        scoring='r2',
+        param_spaces={'Random Forest': FOREST_SPACE, 'Gradient Boosting': BOOSTING_SPACE, 'SVR': SVM_SPACE},
+    ),
+    'player_classification': ModelSpec(
+        name='player_classification',
+        artifact_prefix='player_classification',
+        task='classification',
+        features=['total_games_played', 'total_moves', 'total_wins', 'total_losses', 'win_ratio',
+                  'total_time_played_minutes', 'gender_encoded', 'country_encoded', 'age', 'game_encoded'],
+        target='player_level',
+        candidates={
+            'Random Forest': lambda seed: RandomForestClassifier(random_state=seed),
+            'Gradient Boosting': lambda seed: GradientBoostingClassifier(random_state=seed),
+            'SVM': lambda seed: SVC(random_state=seed),
+            'KNN': lambda seed: KNeighborsClassifier(n_neighbors=5),
+        },
+        include_level_encoder=True,
+        encode_target=True,
+        param_spaces={'Random Forest': FOREST_SPACE, 'Gradient Boosting': BOOSTING_SPACE,
+                      'SVM': SVM_SPACE, 'KNN': KNN_SPACE},
+    ),
+}
@@ -0,0 +1,294 @@
+"""
+Training pipeline: cached feature matrices, parallel model training, optional
+hyperparameter search and versioned artifacts.
+
+Each run writes models/<version>/ with the same <prefix>_model.pkl /
+_scaler.pkl / _encoders.pkl files the prediction API loads, plus a
+manifest.json with the data fingerprint and evaluation metrics.
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sklearn import metrics
+from sklearn.model_selection import cross_val_score, train_test_split
+from sklearn.preprocessing import StandardScaler
+
+from .data import fingerprint, load_dataset
+from .features import FEATURE_VERSION, add_derived_features, encode_frame, feature_matrix, fit_encoders
+from .models import MODEL_SPECS, ModelSpec
+from .search import SearchConfig, cached_folds, default_scoring, successive_halving
+
+logger = logging.getLogger(__name__)
+
+TEST_SIZE = 0.2
+CV_FOLDS = 5
+MANIFEST_FILE = 'manifest.json'
+
+
+def _write_pickle(path: str, obj) -> None:
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+
+
+def feature_cache_key(spec: ModelSpec, data_fingerprint: str, seed: int) -> str:
+    """Cached matrices are reused only for the same data, features, target and split"""
+    key = json.dumps({
+        'data': data_fingerprint,
+        'features': spec.features,
+        'target': spec.target,
+        'include_level_encoder': spec.include_level_encoder,
+        'encode_target': spec.encode_target,
+        'seed': seed,
+        'test_size': TEST_SIZE,
+        'feature_version': FEATURE_VERSION,
+    }, sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def build_feature_cache(spec: ModelSpec, df: pd.DataFrame, data_fingerprint: str,
+                        cache_dir: str, seed: int) -> str:
+    """
+    Encode the features of one model, split train/test and store the result on
+    disk. Returns the cache file path; an existing file is reused as is.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{spec.name}-{feature_cache_key(spec, data_fingerprint, seed)}.pkl")
+    if os.path.exists(path):
+        logger.info(f"{spec.name}: using cached feature matrices {path}")
+        return path
+
+    encoders = fit_encoders(df, include_level=spec.include_level_encoder)
+    encoded = encode_frame(df, encoders)
+    X = feature_matrix(encoded, spec.features)
+    if spec.encode_target:
+        y = encoders['level_encoder'].transform(df[spec.target].astype(str))
+    else:
+        y = df[spec.target].to_numpy()
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=TEST_SIZE, random_state=seed)
+    _write_pickle(path, {
+        'X_train': X_train,
+        'X_test': X_test,
+        'y_train': y_train,
+        'y_test': y_test,
+        'encoders': encoders,
+    })
+    logger.info(f"{spec.name}: cached {len(X_train)} train / {len(X_test)} test rows in {path}")
+    return path
+
+
+def oversampled(factory: Callable[[int], object]) -> Callable[[int], object]:
+    """
+    Estimator factory that oversamples with SMOTE inside every fit, so
+    cross-validation resamples each fold's training rows only and scores on
+    untouched validation rows. The estimator's parameters get a 'model__' prefix.
+    """
+    from imblearn.over_sampling import SMOTE
+    from imblearn.pipeline import Pipeline
+
+    return lambda seed: Pipeline([('smote', SMOTE(random_state=seed)), ('model', factory(seed))])
+
+
+def evaluate(spec: ModelSpec, y_true: np.ndarray, y_pred: np.ndarray) -> Dict[str, float]:
+    if spec.task == 'classification':
+        return {
+            'accuracy': float(metrics.accuracy_score(y_true, y_pred)),
+            'f1_macro': float(metrics.f1_score(y_true, y_pred, average='macro')),
+        }
+    return {
+        'rmse': float(np.sqrt(metrics.mean_squared_error(y_true, y_pred))),
+        'mae': float(metrics.mean_absolute_error(y_true, y_pred)),
+        'r2': float(metrics.r2_score(y_true, y_pred)),
+    }
+
+
+def train_model(spec_name: str, cache_path: str, output_dir: str, seed: int,
+                search: Optional[SearchConfig] = None) -> Dict:
+    """
+    Worker entry point: fit every candidate of one model, keep the one with the
+    best mean cross-validation score and write its artifacts to output_dir.
+
+    With a SearchConfig, candidates that have a search space are tuned first and
+    refit with their best parameters; the model's budget is shared evenly
+    between the candidates still to be searched.
+    """
+    spec = MODEL_SPECS[spec_name]
+    with open(cache_path, 'rb') as f:
+        cached = pickle.load(f)
+
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(cached['X_train'])
+    X_test = scaler.transform(cached['X_test'])
+    y_train, y_test = cached['y_train'], cached['y_test']
+
+    # Cross-validation and search run on the original training rows; with
+    # balance_classes only the final fit sees the SMOTE-resampled set
+    cv_factories = dict(spec.candidates)
+    param_prefix = ''
+    X_fit, y_fit = X_train, y_train
+    if spec.balance_classes:
+        from imblearn.over_sampling import SMOTE
+
+        cv_factories = {name: oversampled(factory) for name, factory in spec.candidates.items()}
+        param_prefix = 'model__'
+        X_fit, y_fit = SMOTE(random_state=seed).fit_resample(X_train, y_train)
+
+    scoring = default_scoring(spec.task, spec.scoring)
+    folds = cached_folds(cache_path, X_train, y_train, search.cv_folds if search else CV_FOLDS,
+                         spec.stratified_cv, seed)
+    n_jobs = search.n_jobs if search else 1
+    deadline = None
+    if search is not None and search.budget_seconds is not None:
+        deadline = time.perf_counter() + search.budget_seconds
+
+    results = {}
+    fitted = {}
+    for position, (name, factory) in enumerate(spec.candidates.items()):
+        start = time.perf_counter()
+        params = {}
+        search_result = None
+        space = spec.param_spaces.get(name) if search is not None else None
+        if space:
+            budget = None
+            if deadline is not None:
+                budget = max(0.0, (deadline - time.perf_counter()) / (len(spec.candidates) - position))
+            search_result = successive_halving(cv_factories[name],
+                                               {param_prefix + key: values for key, values in space.items()},
+                                               X_train, y_train, folds, scoring, search, seed, budget)
+            params = {key[len(param_prefix):]: value for key, value in search_result['best_params'].items()}
+
+        model = factory(seed).set_params(**params)
+        model.fit(X_fit, y_fit)
+
+        if search_result is not None and search_result['best_resources'] == search_result['full_resources']:
+            cv_mean, cv_std = search_result['best_score'], None
+        else:
+            # Not searched, or the budget stopped the search before a full-size round
+            cv_model = cv_factories[name](seed).set_params(
+                **{param_prefix + key: value for key, value in params.items()})
+            cv_scores = cross_val_score(cv_model, X_train, y_train, cv=folds, scoring=scoring, n_jobs=n_jobs)
+            cv_mean, cv_std = float(cv_scores.mean()), float(cv_scores.std())
+
+        results[name] = {
+            'params': params,
+            'cv_mean': cv_mean,
+            'cv_std': cv_std,
+            'test': evaluate(spec, y_test, model.predict(X_test)),
+            'seconds': round(time.perf_counter() - start, 3),
+        }
+        if search_result is not None:
+            results[name]['search'] = search_result
+        fitted[name] = model
+
+    best = max(results, key=lambda name: results[name]['cv_mean'])
+    prefix = os.path.join(output_dir, spec.artifact_prefix)
+    _write_pickle(f"{prefix}_model.pkl", fitted[best])
+    _write_pickle(f"{prefix}_scaler.pkl", scaler)
+    _write_pickle(f"{prefix}_encoders.pkl", cached['encoders'])
+
+    return {
+        'model': spec.name,
+        'best_estimator': best,
+        'train_rows': int(len(y_train)),
+        'test_rows': int(len(y_test)),
+        'scoring': scoring,
+        'candidates': results,
+    }
+
+
+def log_search_report(result: Dict) -> None:
+    """Log best score against time spent for every searched candidate of one model"""
+    for name, candidate in result['candidates'].items():
+        search_result = candidate.get('search')
+        if search_result is None:
+            continue
+        progress = ', '.join(f"{step['elapsed_seconds']:.1f}s: {step['best_score']:.4f} "
+                             f"({step['candidates']} x {step['resources']} rows)"
+                             for step in search_result['trace'])
+        logger.info(f"{result['model']} / {name} ({result['scoring']}): {progress}; "
+                    f"best {search_result['best_params']}")
+
+
+def promote(version_dir: str, models_dir: str) -> None:
+    """Copy a version's artifacts to the top-level models directory the API loads by default"""
+    for name in os.listdir(version_dir):
+        if name.endswith('.pkl'):
+            shutil.copy2(os.path.join(version_dir, name), os.path.join(models_dir, name))
+    with open(os.path.join(models_dir, 'CURRENT_VERSION'), 'w') as f:
+        f.write(os.path.basename(version_dir) + '\n')
+
+
+def run(data_path: str, model_names: Optional[List[str]] = None, models_dir: str = 'models',
+        cache_dir: str = '.training_cache', workers: Optional[int] = None, seed: int = 42,
+        promote_artifacts: bool = False, search: Optional[SearchConfig] = None) -> str:
+    """Train the requested models and return the versioned artifact directory"""
+    model_names = model_names or list(MODEL_SPECS)
+    unknown = [name for name in model_names if name not in MODEL_SPECS]
+    if unknown:
+        raise ValueError(f"Unknown models: {', '.join(unknown)}")
+
+    df = add_derived_features(load_dataset(data_path))
+    data_fingerprint = fingerprint(df)
+    logger.info(f"Loaded {len(df)} rows from {data_path} (fingerprint {data_fingerprint})")
+
+    cache_paths = {
+        name: build_feature_cache(MODEL_SPECS[name], df, data_fingerprint, cache_dir, seed)
+        for name in model_names
+    }
+    del df
+
+    version = datetime.now().strftime('%Y%m%d-%H%M%S') + f"-{data_fingerprint[:8]}"
+    version_dir = os.path.join(models_dir, version)
+    os.makedirs(version_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    results = {}
+    if workers is None:
+        # A search parallelises across folds itself, so models then train one at a time
+        workers = 1 if search is not None else min(len(model_names), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(train_model, name, cache_paths[name], version_dir, seed, search): name
+            for name in model_names
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            results[result['model']] = result
+            best = result['candidates'][result['best_estimator']]
+            logger.info(f"{result['model']}: best {result['best_estimator']} "
+                        f"(cv {best['cv_mean']:.4f}, test {best['test']})")
+            if search is not None:
+                log_search_report(result)
+
+    manifest = {
+        'version': version,
+        'created_at': datetime.now().isoformat(),
+        'data_path': os.path.abspath(data_path),
+        'data_fingerprint': data_fingerprint,
+        'feature_version': FEATURE_VERSION,
+        'seed': seed,
+        'search': asdict(search) if search is not None else None,
+        'training_seconds': round(time.perf_counter() - start, 3),
+        'models': {name: results[name] for name in model_names},
+    }
+    with open(os.path.join(version_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    if promote_artifacts:
+        promote(version_dir, models_dir)
+        logger.info(f"Promoted {version} to {models_dir}")
+
+    logger.info(f"Artifacts written to {version_dir}")
+    return version_dir
@@ -0,0 +1,154 @@
+"""
+Budgeted hyperparameter search.
+
+Replaces the notebooks' exhaustive GridSearchCV with successive halving
+(sample many configurations, score them on a small share of the training rows
+and keep only the best 1/factor for the next, larger round) or plain randomized
+search (a single full-size round). Every (configuration, fold) fit of a round
+runs in parallel through joblib, fold splits are cached on disk next to the
+feature matrices, and the search stops starting new rounds once its wall-clock
+budget is used up. The trace records the best score reached against the time
+spent, which ends up in the run manifest.
+"""
+import hashlib
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import KFold, ParameterSampler, StratifiedKFold
+
+Folds = List[Tuple[np.ndarray, np.ndarray]]
+
+
+@dataclass
+class SearchConfig:
+    method: str = 'halving'  # 'halving' or 'random'
+    n_candidates: int = 24
+    factor: int = 3
+    cv_folds: int = 5
+    n_jobs: int = -1
+    # Wall-clock budget per model in seconds, None for no limit
+    budget_seconds: Optional[float] = None
+    # Training rows per fold in the first halving round, None to derive it
+    min_resources: Optional[int] = None
+
+
+def cached_folds(cache_path: str, X: np.ndarray, y: np.ndarray, n_splits: int,
+                 stratified: bool, seed: int) -> Folds:
+    """
+    Cross-validation folds for one model's training matrix, stored next to its
+    feature cache so repeated searches and retrains reuse the same splits.
+    """
+    digest = hashlib.sha1(np.ascontiguousarray(y).tobytes())
+    digest.update(f"{X.shape}-{n_splits}-{stratified}-{seed}".encode())
+    path = f"{os.path.splitext(cache_path)[0]}-folds-{digest.hexdigest()[:12]}.npz"
+
+    if os.path.exists(path):
+        with np.load(path) as data:
+            return [(data[f'train_{i}'], data[f'test_{i}']) for i in range(n_splits)]
+
+    splitter = (StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed) if stratified
+                else KFold(n_splits=n_splits, shuffle=True, random_state=seed))
+    folds = list(splitter.split(X, y))
+    arrays = {}
+    for i, (train_index, test_index) in enumerate(folds):
+        arrays[f'train_{i}'] = train_index
+        arrays[f'test_{i}'] = test_index
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(path + '.tmp', path)
+    return folds
+
+
+def _fit_and_score(estimator, params: Dict, X: np.ndarray, y: np.ndarray,
+                   train_index: np.ndarray, test_index: np.ndarray, scorer) -> float:
+    model = clone(estimator).set_params(**params)
+    try:
+        model.fit(X[train_index], y[train_index])
+        return float(scorer(model, X[test_index], y[test_index]))
+    except ValueError:
+        # e.g. a subsample without every class, or an invalid parameter combination
+        return float('-inf')
+
+
+def successive_halving(estimator_factory: Callable[[int], object], space: Dict[str, list],
+                       X: np.ndarray, y: np.ndarray, folds: Folds, scoring: str,
+                       config: SearchConfig, seed: int, budget_seconds: Optional[float] = None) -> Dict:
+    """
+    Search one estimator's parameter space and return the best parameters,
+    their mean CV score and the quality-versus-time trace.
+    """
+    start = time.perf_counter()
+    estimator = estimator_factory(seed)
+    scorer = get_scorer(scoring)
+    candidates = list(ParameterSampler(space, n_iter=config.n_candidates, random_state=seed))
+
+    if config.method == 'random' or len(candidates) == 1:
+        rounds = 1
+    else:
+        rounds = max(1, math.ceil(math.log(len(candidates), config.factor)))
+
+    train_size = min(len(train_index) for train_index, _ in folds)
+    if rounds == 1:
+        resources = train_size
+    else:
+        resources = config.min_resources or max(train_size // config.factor ** (rounds - 1), 20 * config.factor)
+
+    # A fixed shuffled order per fold, so each round's subsample extends the previous one
+    rng = np.random.RandomState(seed)
+    shuffled = [(rng.permutation(train_index), test_index) for train_index, test_index in folds]
+
+    best_params, best_score, best_resources = candidates[0], float('-inf'), 0
+    trace = []
+    fits = 0
+    with Parallel(n_jobs=config.n_jobs) as parallel:
+        for round_number in range(rounds):
+            elapsed = time.perf_counter() - start
+            if round_number > 0 and budget_seconds is not None and elapsed >= budget_seconds:
+                break
+
+            n_resources = train_size if round_number == rounds - 1 else min(resources, train_size)
+            scores = parallel(
+                delayed(_fit_and_score)(estimator, params, X, y, train_index[:n_resources], test_index, scorer)
+                for params in candidates
+                for train_index, test_index in shuffled
+            )
+            mean_scores = np.asarray(scores, dtype=np.float64).reshape(len(candidates), len(folds)).mean(axis=1)
+            fits += len(scores)
+
+            order = np.argsort(mean_scores)[::-1]
+            best_params, best_score, best_resources = candidates[order[0]], float(mean_scores[order[0]]), n_resources
+            trace.append({
+                'round': round_number,
+                'candidates': len(candidates),
+                'resources': int(n_resources),
+                'fits': fits,
+                'best_score': best_score,
+                'elapsed_seconds': round(time.perf_counter() - start, 3),
+            })
+
+            keep = max(1, len(candidates) // config.factor)
+            candidates = [candidates[i] for i in order[:keep]]
+            resources *= config.factor
+
+    return {
+        'best_params': best_params,
+        'best_score': best_score,
+        # Below the full fold size when the budget ran out before the last round
+        'best_resources': int(best_resources),
+        'full_resources': int(train_size),
+        'seconds': round(time.perf_counter() - start, 3),
+        'trace': trace,
+    }
+
+
+def default_scoring(task: str, scoring: Optional[str]) -> str:
+    if scoring:
+        return scoring
+    return 'accuracy' if task == 'classification' else 'r2'
@@ -1,11 +1,19 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from pydantic import BaseModel, Field
 import pandas as pd
 import numpy as np
+import os
 import pickle
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+from starlette.routing import Match
+
+from profiling import install_profiling
 
 app = FastAPI(title="Player Analytics API",
               description="Unified API for comprehensive player predictions and analytics")
@@ -26,35 +34,132 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-stage latency: histograms on /metrics plus a Server-Timing response header.
+# With PREDICTION_TIMING=false spans are a shared no-op context and no middleware runs.
+TIMING_ENABLED = os.getenv('PREDICTION_TIMING', 'true').lower() in ('1', 'true', 'yes')
+
+STAGE_SECONDS = Histogram(
+    'prediction_stage_seconds', 'Time per prediction stage',
+    ['model', 'stage'],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+)
+# path is the route template, or "unmatched" for URLs no route serves
+REQUEST_SECONDS = Histogram(
+    'prediction_request_seconds', 'Total request time', ['path'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+
+
+_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar('request_timings', default=None)
+_NO_SPAN = nullcontext()
+
+
+def _record(model: str, stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(model, stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.spans.append((f"{model}-{stage}", seconds))
+
+
+@contextmanager
+def _timed_span(model: str, stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(model, stage, time.perf_counter() - start)
+
+
+def span(model: str, stage: str):
+    """Time a stage of one model's prediction"""
+    return _timed_span(model, stage) if TIMING_ENABLED else _NO_SPAN
+
+
+def mark_request_parsed() -> None:
+    """Record body parsing and validation, i.e. everything before the endpoint runs"""
+    timings = _request_timings.get()
+    if timings is not None:
+        _record('request', 'parse', time.perf_counter() - timings.start)
+
+
+def route_label(request: Request) -> str:
+    """Route template of the request, so that paths with ids or unknown URLs do not each get a series"""
+    route = request.scope.get('route')
+    if route is None:
+        route = next((r for r in app.router.routes if r.matches(request.scope)[0] == Match.FULL), None)
+    return getattr(route, 'path', None) or 'unmatched'
+
+
+if TIMING_ENABLED:
+    @app.middleware("http")
+    async def timing_middleware(request: Request, call_next):
+        timings = RequestTimings()
+        token = _request_timings.set(timings)
+        try:
+            response = await call_next(request)
+        finally:
+            _request_timings.reset(token)
+        total = time.perf_counter() - timings.start
+        REQUEST_SECONDS.labels(route_label(request)).observe(total)
+
+        durations: Dict[str, float] = {}
+        for name, seconds in timings.spans:
+            durations[name] = durations.get(name, 0.0) + seconds
+        durations['total'] = total
+        response.headers['Server-Timing'] = ', '.join(
+            f"{name};dur={seconds * 1000:.3f}" for name, seconds in durations.items()
+        )
+        return response
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+# Opt-in sampling profiler (PROFILING_TOKEN)
+install_profiling(app)
+
+
+# Directory with the *_model.pkl / *_scaler.pkl / *_encoders.pkl artifacts,
+# e.g. a versioned models/<version> directory written by `python -m training`
+MODEL_DIR = os.getenv('MODEL_DIR', 'models')
+
 # Load all models and components
 try:
     # Load all models as before...
-    with open('models/churn_model.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'churn_model.pkl'), 'rb') as f:
         churn_model = pickle.load(f)
-    with open('models/churn_scaler.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'churn_scaler.pkl'), 'rb') as f:
         churn_scaler = pickle.load(f)
-    with open('models/churn_encoders.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'churn_encoders.pkl'), 'rb') as f:
         churn_encoder = pickle.load(f)
 
-    with open('models/win_probability_model.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'win_probability_model.pkl'), 'rb') as f:
         win_model = pickle.load(f)
-    with open('models/win_probability_scaler.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'win_probability_scaler.pkl'), 'rb') as f:
         win_scaler = pickle.load(f)
-    with open('models/win_probability_encoders.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'win_probability_encoders.pkl'), 'rb') as f:
         win_encoder = pickle.load(f)
 
-    with open('models/engagement_model.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'engagement_model.pkl'), 'rb') as f:
         engagement_model = pickle.load(f)
-    with open('models/engagement_scaler.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'engagement_scaler.pkl'), 'rb') as f:
         engagement_scaler = pickle.load(f)
-    with open('models/engagement_encoders.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'engagement_encoders.pkl'), 'rb') as f:
         engagement_encoder = pickle.load(f)
 
-    with open('models/player_classification_model.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'player_classification_model.pkl'), 'rb') as f:
         classification_model = pickle.load(f)
-    with open('models/player_classification_scaler.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'player_classification_scaler.pkl'), 'rb') as f:
         classification_scaler = pickle.load(f)
-    with open('models/player_classification_encoders.pkl', 'rb') as f:
+    with open(os.path.join(MODEL_DIR, 'player_classification_encoders.pkl'), 'rb') as f:
         classification_encoder = pickle.load(f)
 
 except Exception as e:
@@ -116,82 +221,102 @@ def safe_transform(encoder, series):
 
 def get_churn_prediction(data: pd.DataFrame) -> dict:
     """Get churn prediction using only required features"""
-    # Calculate win ratio if needed
-    if 'win_ratio' not in data.columns:
-        data['win_ratio'] = (data['total_wins'] / data['total_games_played']) * 100
+    with span('churn', 'dataframe'):
+        # Calculate win ratio if needed
+        if 'win_ratio' not in data.columns:
+            data['win_ratio'] = (data['total_wins'] / data['total_games_played']) * 100
 
-    churn_data = prepare_features(data, CHURN_FEATURES)
+        churn_data = prepare_features(data, CHURN_FEATURES)
 
     # Encode categorical variables
-    churn_data['gender_encoded'] = safe_transform(churn_encoder['gender_encoder'], churn_data['gender'])
-    churn_data['country_encoded'] = safe_transform(churn_encoder['country_encoder'], churn_data['country'])
-    churn_data['game_encoded'] = safe_transform(churn_encoder['game_encoder'], churn_data['game_name'])
+    with span('churn', 'encode'):
+        churn_data['gender_encoded'] = safe_transform(churn_encoder['gender_encoder'], churn_data['gender'])
+        churn_data['country_encoded'] = safe_transform(churn_encoder['country_encoder'], churn_data['country'])
+        churn_data['game_encoded'] = safe_transform(churn_encoder['game_encoder'], churn_data['game_name'])
 
     # Prepare final features for scaling
     final_features = ['total_games_played', 'win_ratio', 'total_time_played_minutes', 'total_moves',
                       'gender_encoded', 'country_encoded', 'game_encoded', 'age']
-    X = churn_data[final_features]
-    X_scaled = churn_scaler.transform(X)
+    with span('churn', 'scale'):
+        X = churn_data[final_features]
+        X_scaled = churn_scaler.transform(X)
 
-    prediction = churn_model.predict(X_scaled)[0]
-    probability = churn_model.predict_proba(X_scaled)[0][1]
+    with span('churn', 'predict'):
+        prediction = churn_model.predict(X_scaled)[0]
+        probability = churn_model.predict_proba(X_scaled)[0][1]
+
+    with span('churn', 'advice'):
+        advice = get_churn_advice(probability, data['win_ratio'].iloc[0], data['total_games_played'].iloc[0])
 
     return {
         "result": "Yes" if prediction else "No",
         "probability": f"{float(probability)}",
-        "advice": get_churn_advice(probability, data['win_ratio'].iloc[0], data['total_games_played'].iloc[0])
+        "advice": advice
     }
 
 
 def get_win_probability(data: pd.DataFrame) -> dict:
     """Get win probability using only required features"""
-    win_data = prepare_features(data, WIN_PROB_FEATURES)
+    with span('win_probability', 'dataframe'):
+        win_data = prepare_features(data, WIN_PROB_FEATURES)
 
-    # Add player level (could be derived from other features in a more sophisticated implementation)
-    win_data['player_level'] = 'intermediate'
+        # Add player level (could be derived from other features in a more sophisticated implementation)
+        win_data['player_level'] = 'intermediate'
 
     # Encode categorical variables
-    win_data['gender_encoded'] = safe_transform(win_encoder['gender_encoder'], win_data['gender'])
-    win_data['country_encoded'] = safe_transform(win_encoder['country_encoder'],win_data['country'])
-    win_data['game_encoded'] = safe_transform(win_encoder['game_encoder'], win_data['game_name'])
-    win_data['player_level_encoded'] = win_encoder['level_encoder'].transform(win_data['player_level'])
+    with span('win_probability', 'encode'):
+        win_data['gender_encoded'] = safe_transform(win_encoder['gender_encoder'], win_data['gender'])
+        win_data['country_encoded'] = safe_transform(win_encoder['country_encoder'],win_data['country'])
+        win_data['game_encoded'] = safe_transform(win_encoder['game_encoder'], win_data['game_name'])
+        win_data['player_level_encoded'] = win_encoder['level_encoder'].transform(win_data['player_level'])
 
     # Prepare final features for scaling
     final_features = ['total_games_played', 'total_moves', 'total_wins', 'total_losses',
                       'player_level_encoded', 'gender_encoded', 'country_encoded', 'age', 'game_encoded']
-    X = win_data[final_features]
-    X_scaled = win_scaler.transform(X)
+    with span('win_probability', 'scale'):
+        X = win_data[final_features]
+        X_scaled = win_scaler.transform(X)
 
-    prediction = float(np.clip(win_model.predict(X_scaled)[0], 0, 1))
+    with span('win_probability', 'predict'):
+        prediction = float(np.clip(win_model.predict(X_scaled)[0], 0, 1))
 
     prediction_percentage = round(prediction * 100, 1)  # Convert to percentage and round to 1 decimal
 
+    with span('win_probability', 'advice'):
+        advice = get_win_probability_advice(prediction, win_data['player_level'].iloc[0])
+
     return {
         "probability": f"{prediction} ----> {prediction_percentage}%",
-        "advice": get_win_probability_advice(prediction, win_data['player_level'].iloc[0])
+        "advice": advice
     }
 
 
 def get_engagement_prediction(data: pd.DataFrame) -> dict:
     """Get engagement prediction using only required features"""
-    # Calculate win ratio if needed
-    if 'win_ratio' not in data.columns:
-        data['win_ratio'] = (data['total_wins'] / data['total_games_played']) * 100
+    with span('engagement', 'dataframe'):
+        # Calculate win ratio if needed
+        if 'win_ratio' not in data.columns:
+            data['win_ratio'] = (data['total_wins'] / data['total_games_played']) * 100
 
-    engagement_data = prepare_features(data, ENGAGEMENT_FEATURES)
+        engagement_data = prepare_features(data, ENGAGEMENT_FEATURES)
 
     # Encode categorical variables
-    engagement_data['gender_encoded'] = safe_transform(engagement_encoder['gender_encoder'], engagement_data['gender'])
-    engagement_data['country_encoded'] = safe_transform(engagement_encoder['country_encoder'], engagement_data['country'])
-    engagement_data['game_encoded'] = safe_transform(engagement_encoder['game_encoder'], engagement_data['game_name'])
+    with span('engagement', 'encode'):
+        engagement_data['gender_encoded'] = safe_transform(engagement_encoder['gender_encoder'], engagement_data['gender'])
+        engagement_data['country_encoded'] = safe_transform(engagement_encoder['country_encoder'], engagement_data['country'])
+        engagement_data['game_encoded'] = safe_transform(engagement_encoder['game_encoder'], engagement_data['game_name'])
 
     # Prepare final features for scaling
     final_features = ['total_games_played', 'win_ratio', 'gender_encoded', 'country_encoded', 'age', 'game_encoded']
-    X = engagement_data[final_features]
-    X_scaled = engagement_scaler.transform(X)
+    with span('engagement', 'scale'):
+        X = engagement_data[final_features]
+        X_scaled = engagement_scaler.transform(X)
 
-    prediction = float(engagement_model.predict(X_scaled)[0])
-    predicted_minutes = float(engagement_model.predict(X_scaled)[0])
+    with span('engagement', 'predict'):
+        predicted_minutes = float(engagement_model.predict(X_scaled)[0])
+
+    with span('engagement', 'advice'):
+        advice = get_engagement_advice(predicted_minutes, data['total_games_played'].iloc[0])
 
     # Calculate monthly stats
     monthly_hours = int(predicted_minutes // 60)
@@ -208,33 +333,40 @@ def get_engagement_prediction(data: pd.DataFrame) -> dict:
             "daily_average": f"{daily_hours} hours {daily_mins} minutes per day"
         },
         "raw_minutes": round(predicted_minutes, 2),
-        "advice": get_engagement_advice(predicted_minutes, data['total_games_played'].iloc[0])
+        "advice": advice
     }
 
 
 
 def get_classification_prediction(data: pd.DataFrame) -> dict:
     """Get skill classification using only required features"""
-    classification_data = prepare_features(data, CLASSIFICATION_FEATURES)
+    with span('player_classification', 'dataframe'):
+        classification_data = prepare_features(data, CLASSIFICATION_FEATURES)
 
-    # Calculate win ratio
-    classification_data['win_ratio'] = (classification_data['total_wins'] /
-                                        classification_data['total_games_played'] * 100)
+        # Calculate win ratio
+        classification_data['win_ratio'] = (classification_data['total_wins'] /
+                                            classification_data['total_games_played'] * 100)
 
     # Encode categorical variables
-    classification_data['gender_encoded'] = safe_transform(classification_encoder['gender_encoder'], classification_data['gender'])
-    classification_data['country_encoded'] = safe_transform(classification_encoder['country_encoder'], classification_data['country'])
-    classification_data['game_encoded'] = safe_transform(classification_encoder['game_encoder'], classification_data['game_name'])
+    with span('player_classification', 'encode'):
+        classification_data['gender_encoded'] = safe_transform(classification_encoder['gender_encoder'], classification_data['gender'])
+        classification_data['country_encoded'] = safe_transform(classification_encoder['country_encoder'], classification_data['country'])
+        classification_data['game_encoded'] = safe_transform(classification_encoder['game_encoder'], classification_data['game_name'])
 
     # Prepare final features for scaling
     final_features = ['total_games_played', 'total_moves', 'total_wins', 'total_losses',
                       'win_ratio', 'total_time_played_minutes', 'gender_encoded',
                       'country_encoded', 'age', 'game_encoded']
-    X = classification_data[final_features]
-    X_scaled = classification_scaler.transform(X)
+    with span('player_classification', 'scale'):
+        X = classification_data[final_features]
+        X_scaled = classification_scaler.transform(X)
+
+    with span('player_classification', 'predict'):
+        prediction = classification_model.predict(X_scaled)[0]
+        predicted_level = classification_encoder['level_encoder'].inverse_transform([prediction])[0]
 
-    prediction = classification_model.predict(X_scaled)[0]
-    predicted_level = classification_encoder['level_encoder'].inverse_transform([prediction])[0]
+    with span('player_classification', 'advice'):
+        advice = get_skill_advice(predicted_level, data['win_ratio'].iloc[0])
 
     return {
         "predicted_level": str(predicted_level),
@@ -243,7 +375,7 @@ def get_classification_prediction(data: pd.DataFrame) -> dict:
             "win_rate": float(round(data['win_ratio'].iloc[0], 2)),
             "total_playtime": int(data['total_time_played_minutes'].iloc[0])
         },
-        "advice": get_skill_advice(predicted_level, data['win_ratio'].iloc[0])
+        "advice": advice
     }
 
 
@@ -291,12 +423,14 @@ def get_win_probability_advice(win_prob: float, current_level: str) -> str:
 
 @app.post("/api/predictions", response_model=UnifiedPredictionResponse)
 async def get_player_predictions(request: PlayerPredictionRequest):
+    mark_request_parsed()
     try:
-        # Create input DataFrame
-        input_data = pd.DataFrame([request.dict()])
+        with span('request', 'dataframe'):
+            # Create input DataFrame
+            input_data = pd.DataFrame([request.dict()])
 
-        # Calculate win ratio once for all models that need it
-        input_data['win_ratio'] = (input_data['total_wins'] / input_data['total_games_played']) * 100
+            # Calculate win ratio once for all models that need it
+            input_data['win_ratio'] = (input_data['total_wins'] / input_data['total_games_played']) * 100
 
         # Make all predictions
         # Get predictions from each model using only required features
@@ -1,16 +1,23 @@
 import json
 import logging
 import os
+import sqlite3
+import threading
+import time
 import uuid
+from collections import OrderedDict
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 import mysql.connector
-import pika
 from dotenv import load_dotenv
-import backoff
-from pika.exceptions import StreamLostError, AMQPConnectionError
+
+from consumer_metrics import (EVENT_LAG_SECONDS, PARKED_MATCHES, POOL_WAIT_SECONDS, PROCESSING_SECONDS,
+                              start_metrics_server)
+from consumer_runtime import (ERROR_HEADER, ORIGINAL_ROUTING_KEY_HEADER, RETRY_COUNT_HEADER, ConsumerRuntime,
+                              Delivery, RabbitMQConnection, Subscription, declare_consumer_queue)
+from ratings import update_skill_ratings
 
 # Load environment variables
 load_dotenv()
@@ -22,6 +29,30 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Retry / dead-letter topology. A failed message is republished to a delay queue
+# for its attempt; when the TTL expires the broker dead-letters it back onto the
+# queue it came from. Once the delays are used up it goes to the dead-letter queue.
+RETRY_EXCHANGE = 'analytics_retry_exchange'
+DEAD_LETTER_EXCHANGE = 'analytics_dead_letter_exchange'
+DEAD_LETTER_QUEUE = 'analytics_dead_letter_q'
+RETRY_DELAYS_MS = [int(delay) for delay in os.getenv('RETRY_DELAYS_MS', '5000,30000,120000,600000').split(',')]
+
+# Consumed queue and the exchange it is bound to for each routing key
+CONSUMED_QUEUES = {'game.over': 'data_analytics_q', 'user.signup': 'user_signup_q'}
+EXCHANGES = {'game.over': 'data_analytics_exchange', 'user.signup': 'user_signup_exchange'}
+
+
+# Game events waiting for their players' signups
+PARKING_DB_PATH = os.getenv('PARKING_DB_PATH', 'parked_matches.db')
+PARKING_MEMORY_SIZE = int(os.getenv('PARKING_MEMORY_SIZE', '1000'))
+PARKING_MAX_SIZE = int(os.getenv('PARKING_MAX_SIZE', '100000'))
+PARKING_MAX_AGE_SECONDS = float(os.getenv('PARKING_MAX_AGE_SECONDS', '86400'))
+PARKING_SWEEP_SECONDS = 60
+
+
+def retry_queue_name(queue: str, delay_ms: int) -> str:
+    return f"{queue}.retry.{delay_ms}ms"
+
 
 @dataclass
 class DBConfig:
@@ -95,158 +126,187 @@ class DatabaseConnection:
         return self.pool.get_connection()
 
 
-class RabbitMQConnection:
-    def __init__(self):
-        self.connection = None
-        self.channel = None
-        self.host = os.getenv('RABBITMQ_HOST', 'localhost')
-        self.port = int(os.getenv('RABBITMQ_PORT', '5672'))
-        self.username = os.getenv('RABBITMQ_USERNAME', 'guest')
-        self.password = os.getenv('RABBITMQ_PASSWORD', 'guest')
-        self.connection_parameters = None
-
-        logger.info(f"RabbitMQ Configuration - Host: {self.host}, Port: {self.port}, Username: {self.username}")
-
-    def _create_connection_parameters(self):
-        """Create connection parameters with robust settings"""
-        if not self.username or not self.password:
-            raise ValueError("RabbitMQ credentials not properly configured!")
-
-        credentials = pika.PlainCredentials(
-            username=self.username,
-            password=self.password
-        )
-
-        return pika.ConnectionParameters(
-            host=self.host,
-            port=self.port,
-            credentials=credentials,
-            heartbeat=60,  # 60 second heartbeat
-            blocked_connection_timeout=300,
-            connection_attempts=3,
-            retry_delay=5,
-            socket_timeout=10,
-            stack_timeout=15
-        )
-
-    def _safe_declare_exchange(self, exchange_name: str, exchange_type: str):
-        """Safely declare an exchange, handling existing exchanges."""
-        try:
-            self.channel.exchange_declare(
-                exchange=exchange_name,
-                exchange_type=exchange_type,
-                durable=True
-            )
-            logger.info(f"Successfully declared exchange: {exchange_name}")
-        except pika.exceptions.ChannelClosedByBroker as e:
-            if e.args[0] == 406:  # PRECONDITION_FAILED
-                logger.warning(f"Exchange {exchange_name} exists with different settings. Attempting to recreate...")
-                self.channel = self.connection.channel()
-                try:
-                    self.channel.exchange_delete(exchange=exchange_name)
-                    logger.info(f"Deleted existing exchange: {exchange_name}")
-                    self.channel = self.connection.channel()
-                    self.channel.exchange_declare(
-                        exchange=exchange_name,
-                        exchange_type=exchange_type,
-                        durable=True
-                    )
-                    logger.info(f"Successfully recreated exchange: {exchange_name}")
-                except Exception as inner_e:
-                    logger.error(f"Failed to recreate exchange {exchange_name}: {str(inner_e)}")
-                    raise
-
-    def _safe_declare_queue(self, queue_name: str):
-        """Safely declare a queue, handling existing queues."""
-        try:
-            self.channel.queue_declare(queue=queue_name, durable=False)
-            logger.info(f"Successfully declared queue: {queue_name}")
-        except pika.exceptions.ChannelClosedByBroker as e:
-            if e.args[0] == 406:  # PRECONDITION_FAILED
-                logger.warning(f"Queue {queue_name} exists with different settings. Attempting to recreate...")
-                self.channel = self.connection.channel()
-                try:
-                    self.channel.queue_delete(queue=queue_name)
-                    logger.info(f"Deleted existing queue: {queue_name}")
-                    self.channel = self.connection.channel()
-                    self.channel.queue_declare(queue=queue_name, durable=False)
-                    logger.info(f"Successfully recreated queue: {queue_name}")
-                except Exception as inner_e:
-                    logger.error(f"Failed to recreate queue {queue_name}: {str(inner_e)}")
-                    raise
-
-    @backoff.on_exception(backoff.expo,
-                          (AMQPConnectionError, StreamLostError),
-                          max_tries=5,
-                          max_time=300)
-
-    def connect(self):
-        """Connect to RabbitMQ with exponential backoff retry"""
-        try:
-            logger.info(f"Attempting to connect to RabbitMQ at {self.host}:{self.port}")
+def declare_analytics_topology(rmq: RabbitMQConnection) -> None:
+    """Consumed queues with their retry and dead-letter queues (also used by backfill.py --queue)"""
+    for routing_key, queue in CONSUMED_QUEUES.items():
+        rmq.declare_exchange(EXCHANGES[routing_key], 'direct')
+        declare_consumer_queue(rmq, queue)
+        rmq.channel.queue_bind(exchange=EXCHANGES[routing_key], queue=queue, routing_key=routing_key)
+
+    rmq.declare_exchange(RETRY_EXCHANGE, 'direct')
+    rmq.declare_exchange(DEAD_LETTER_EXCHANGE, 'direct')
+
+    rmq.declare_queue(DEAD_LETTER_QUEUE, durable=True)
+    rmq.channel.queue_bind(exchange=DEAD_LETTER_EXCHANGE, queue=DEAD_LETTER_QUEUE, routing_key=DEAD_LETTER_QUEUE)
+
+    for queue in CONSUMED_QUEUES.values():
+        for delay_ms in RETRY_DELAYS_MS:
+            name = retry_queue_name(queue, delay_ms)
+            # Nothing consumes these: expired messages go back to the source
+            # queue through the default exchange
+            rmq.declare_queue(name, durable=True, arguments={
+                'x-message-ttl': delay_ms,
+                'x-dead-letter-exchange': '',
+                'x-dead-letter-routing-key': queue
+            })
+            rmq.channel.queue_bind(exchange=RETRY_EXCHANGE, queue=name, routing_key=name)
+    logger.info(f"Declared retry queues with delays {RETRY_DELAYS_MS} ms and {DEAD_LETTER_QUEUE}")
 
-            if self.connection and not self.connection.is_closed:
-                logger.info("Closing existing connection before reconnecting...")
-                self.connection.close()
 
-            self.connection_parameters = self._create_connection_parameters()
-            self.connection = pika.BlockingConnection(self.connection_parameters)
-            self.channel = self.connection.channel()
+class RecentIds:
+    """Bounded set of recently processed IDs; the least recently seen are evicted first"""
 
-            # Set QoS
-            self.channel.basic_qos(prefetch_count=1)
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
 
-            logger.info("Successfully connected to RabbitMQ")
+    def __contains__(self, key: str) -> bool:
+        return key in self._ids
 
-            # Safely declare exchanges
-            self._safe_declare_exchange('data_analytics_exchange', 'direct')
-            self._safe_declare_exchange('user_signup_exchange', 'direct')
+    def add(self, key: str) -> None:
+        with self._lock:
+            self._ids[key] = None
+            self._ids.move_to_end(key)
+            if len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
 
-            # Safely declare queues
-            self._safe_declare_queue('data_analytics_q')
-            self._safe_declare_queue('user_signup_q')
 
-            # Bind queues
-            try:
-                self.channel.queue_bind(
-                    exchange='data_analytics_exchange',
-                    queue='data_analytics_q',
-                    routing_key='game.over'
-                )
-                self.channel.queue_bind(
-                    exchange='user_signup_exchange',
-                    queue='user_signup_q',
-                    routing_key='user.signup'
-                )
-                logger.info("Successfully bound queues to exchanges")
-            except Exception as e:
-                logger.error(f"Error binding queues: {str(e)}")
-                raise
+class MissingPlayersError(Exception):
+    """A game event references players whose user.signup has not been processed yet"""
 
-        except pika.exceptions.ProbableAuthenticationError as auth_error:
-            logger.error(f"RabbitMQ Authentication Error: {str(auth_error)}")
-            raise
-        except pika.exceptions.AMQPConnectionError as conn_error:
-            logger.error(f"RabbitMQ Connection Error: {str(conn_error)}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error connecting to RabbitMQ: {str(e)}")
-            raise
+    def __init__(self, match_id: str, player_ids: List[str]):
+        super().__init__(f"Match {match_id} is waiting for players {', '.join(player_ids)}")
+        self.match_id = match_id
+        self.player_ids = player_ids
 
-    def close(self):
-        """Safely close the RabbitMQ connection"""
-        try:
-            if self.connection and not self.connection.is_closed:
-                self.connection.close()
-                logger.info("RabbitMQ connection closed")
-        except Exception as e:
-            logger.error(f"Error closing RabbitMQ connection: {str(e)}")
 
+@dataclass
+class ParkedMatch:
+    match_id: str
+    body: bytes
+    player_ids: List[str]
+    parked_at: float
+
+
+class ParkingBuffer:
+    """
+    Game events parked until the user.signup of their missing players arrives,
+    indexed by missing player id.
+
+    The newest max_memory matches are kept in memory; older ones spill to a
+    SQLite file, which also keeps them across restarts. Beyond max_size matches
+    the oldest are evicted, and matches older than max_age_seconds expire; the
+    caller dead-letters both. Not thread-safe: callers serialize access.
+    """
+
+    def __init__(self, path: str, max_memory: int, max_size: int, max_age_seconds: float):
+        self.max_memory = max_memory
+        self.max_size = max_size
+        self.max_age_seconds = max_age_seconds
+        self.memory: "OrderedDict[str, ParkedMatch]" = OrderedDict()  # oldest first
+        self.by_player: Dict[str, set] = {}
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS parked_matches (
+                match_id TEXT NOT NULL,
+                player_id TEXT NOT NULL,
+                body BLOB NOT NULL,
+                parked_at REAL NOT NULL,
+                PRIMARY KEY (match_id, player_id)
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_parked_player ON parked_matches (player_id)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_parked_at ON parked_matches (parked_at)")
+        self.db.commit()
+        self.disk_count = self.db.execute("SELECT COUNT(DISTINCT match_id) FROM parked_matches").fetchone()[0]
+        if self.disk_count:
+            logger.info(f"{self.disk_count} parked matches loaded from {path}")
+
+    def __len__(self) -> int:
+        return len(self.memory) + self.disk_count
+
+    def _drop_from_memory(self, match_id: str) -> ParkedMatch:
+        entry = self.memory.pop(match_id)
+        for player_id in entry.player_ids:
+            waiting = self.by_player.get(player_id)
+            if waiting is not None:
+                waiting.discard(match_id)
+                if not waiting:
+                    del self.by_player[player_id]
+        return entry
+
+    def _take_from_disk(self, where: str, params: tuple) -> List[ParkedMatch]:
+        rows = self.db.execute(f"""
+            SELECT match_id, player_id, body, parked_at FROM parked_matches
+            WHERE match_id IN (SELECT match_id FROM parked_matches WHERE {where})
+            ORDER BY parked_at
+        """, params).fetchall()
+        entries: Dict[str, ParkedMatch] = {}
+        for match_id, player_id, body, parked_at in rows:
+            entry = entries.setdefault(match_id, ParkedMatch(match_id, bytes(body), [], parked_at))
+            entry.player_ids.append(player_id)
+        if entries:
+            self.db.executemany("DELETE FROM parked_matches WHERE match_id = ?", [(m,) for m in entries])
+            self.db.commit()
+            self.disk_count -= len(entries)
+        return list(entries.values())
+
+    def _spill(self) -> None:
+        while len(self.memory) > self.max_memory:
+            entry = self._drop_from_memory(next(iter(self.memory)))
+            self.db.executemany(
+                "INSERT OR REPLACE INTO parked_matches (match_id, player_id, body, parked_at) VALUES (?, ?, ?, ?)",
+                [(entry.match_id, player_id, entry.body, entry.parked_at) for player_id in entry.player_ids]
+            )
+            self.disk_count += 1
+        self.db.commit()
+
+    def park(self, entry: ParkedMatch) -> List[ParkedMatch]:
+        """Park a match; returns the matches evicted to stay within max_size"""
+        if entry.match_id in self.memory:
+            self._drop_from_memory(entry.match_id)
+        if self.disk_count:
+            self._take_from_disk("match_id = ?", (entry.match_id,))
+
+        self.memory[entry.match_id] = entry
+        for player_id in entry.player_ids:
+            self.by_player.setdefault(player_id, set()).add(entry.match_id)
+        self._spill()
+
+        evicted = []
+        while len(self) > self.max_size:
+            if self.disk_count:
+                # Spilled matches are the oldest
+                evicted.extend(self._take_from_disk(
+                    "parked_at = (SELECT MIN(parked_at) FROM parked_matches)", ()))
+            else:
+                evicted.append(self._drop_from_memory(next(iter(self.memory))))
+        return evicted
+
+    def release(self, player_id: str) -> List[ParkedMatch]:
+        """Remove and return every match waiting for this player"""
+        released = [self._drop_from_memory(match_id) for match_id in list(self.by_player.get(player_id, ()))]
+        if self.disk_count:
+            released.extend(self._take_from_disk("player_id = ?", (player_id,)))
+        return released
+
+    def expire(self, now: float) -> List[ParkedMatch]:
+        """Remove and return the matches parked for longer than max_age_seconds"""
+        cutoff = now - self.max_age_seconds
+        expired = []
+        while self.memory and next(iter(self.memory.values())).parked_at < cutoff:
+            expired.append(self._drop_from_memory(next(iter(self.memory))))
+        if self.disk_count:
+            expired.extend(self._take_from_disk("parked_at < ?", (cutoff,)))
+        return expired
 
 
 class AnalyticsEventProcessor:
     def __init__(self, db_connection: DatabaseConnection):
         self.db = db_connection
+        # Redelivered game.over events are dropped here without touching the database
+        self.recent_match_ids = RecentIds(int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '100000')))
 
     def _parse_datetime(self, datetime_str: str) -> datetime:
         """Parse datetime string and truncate microseconds"""
@@ -257,14 +317,52 @@ class AnalyticsEventProcessor:
             logger.error(f"Error parsing datetime {datetime_str}: {str(e)}")
             raise
 
+    def _get_connection(self):
+        start = time.perf_counter()
+        conn = self.db.get_connection()
+        POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+        return conn
+
+    def _commit(self, conn, routing_key: str, db_start: float) -> None:
+        commit_start = time.perf_counter()
+        PROCESSING_SECONDS.labels(routing_key, 'db').observe(commit_start - db_start)
+        conn.commit()
+        PROCESSING_SECONDS.labels(routing_key, 'commit').observe(time.perf_counter() - commit_start)
+
+    def _bump_cache_versions(self, cursor, game_name: str, player_ids: List[str]) -> None:
+        """Invalidate the Statistics API cache entries that depend on this game's or these players' stats"""
+        cache_version_query = """
+        INSERT INTO stats_cache_versions (scope, version) VALUES (%s, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1
+        """
+        # Same scope names as GameAnalytics/stats_cache.py, always bumped in this order
+        scopes = ['global', f"game:{game_name.lower()}"]
+        scopes += [f"player:{player_id.lower()}" for player_id in sorted(set(player_ids))]
+        for scope in scopes:
+            cursor.execute(cache_version_query, (scope,))
+
+    def _missing_players(self, cursor, event_data: Dict[str, Any]) -> List[str]:
+        player_ids = [event_data["player1Id"], event_data["player2Id"]]
+        cursor.execute(
+            "SELECT BIN_TO_UUID(player_id) FROM players WHERE player_id IN (UUID_TO_BIN(%s), UUID_TO_BIN(%s))",
+            player_ids
+        )
+        known = {row[0] for row in cursor.fetchall()}
+        return [player_id for player_id in dict.fromkeys(player_ids) if player_id not in known]
+
     def process_game_event(self, event_data: Dict[str, Any]) -> None:
+        if event_data['matchId'] in self.recent_match_ids:
+            logger.info(f"Match {event_data['matchId']} already processed, skipping redelivery")
+            return
+
         try:
             logger.info(f"Processing game event for match {event_data['matchId']}")
 
-            with self.db.get_connection() as conn:
+            with self._get_connection() as conn:
+                db_start = time.perf_counter()
                 cursor = conn.cursor()
 
-                cursor.execute("SELECT game_id FROM games WHERE name = %s", (event_data["game"],))
+                cursor.execute("SELECT game_id, name FROM games WHERE name = %s", (event_data["game"],))
                 game_result = cursor.fetchone()
                 if not game_result:
                     raise Exception(f"Game {event_data['game']} not found")
@@ -283,20 +381,38 @@ class AnalyticsEventProcessor:
                 end_time = self._parse_datetime(event_data["endTime"])
                 duration = int((end_time - start_time).total_seconds() / 60)
 
-                cursor.execute(match_history_query, (
-                    event_data["matchId"],
-                    game_result[0],
-                    event_data["player1Id"],
-                    event_data["player2Id"],
-                    event_data["winnerId"],
-                    start_time,
-                    end_time,
-                    duration,
-                    'win' if event_data["winnerId"] else 'draw'
-                ))
+                try:
+                    cursor.execute(match_history_query, (
+                        event_data["matchId"],
+                        game_result[0],
+                        event_data["player1Id"],
+                        event_data["player2Id"],
+                        event_data["winnerId"],
+                        start_time,
+                        end_time,
+                        duration,
+                        'win' if event_data["winnerId"] else 'draw'
+                    ))
+                except mysql.connector.IntegrityError as e:
+                    if e.errno == mysql.connector.errorcode.ER_NO_REFERENCED_ROW_2:
+                        conn.rollback()
+                        missing = self._missing_players(cursor, event_data)
+                        if missing:
+                            raise MissingPlayersError(event_data["matchId"], missing) from e
+                        raise
+                    if e.errno != mysql.connector.errorcode.ER_DUP_ENTRY:
+                        raise
+                    # Stored by an earlier delivery whose ack was lost: nothing left to do.
+                    # (A plain INSERT rather than INSERT IGNORE, which would also hide
+                    # foreign key failures for unknown players.)
+                    conn.rollback()
+                    self.recent_match_ids.add(event_data["matchId"])
+                    logger.info(f"Match {event_data['matchId']} already stored, skipping redelivery")
+                    return
 
+                # The unique (match_id, player_id) key makes a repeated moves row a no-op
                 moves_query = """
-                INSERT INTO match_moves (move_id, match_id, player_id, moves_count)
+                INSERT IGNORE INTO match_moves (move_id, match_id, player_id, moves_count)
                 VALUES (UUID_TO_BIN(%s), UUID_TO_BIN(%s), UUID_TO_BIN(%s), %s)
                 """
 
@@ -313,6 +429,7 @@ class AnalyticsEventProcessor:
                     event_data["player2MoveCounts"]
                 ))
 
+                # Also refreshes the Statistics API read model
                 stats_query = """
                 CALL update_player_game_stats(UUID_TO_BIN(%s), %s)
                 """
@@ -320,9 +437,19 @@ class AnalyticsEventProcessor:
                 for player_id in [event_data["player1Id"], event_data["player2Id"]]:
                     cursor.execute(stats_query, (player_id, game_result[0]))
 
-                conn.commit()
+                update_skill_ratings(cursor, game_result[0], event_data["player1Id"],
+                                     event_data["player2Id"], event_data["winnerId"], end_time)
+
+                self._bump_cache_versions(cursor, game_result[1],
+                                          [event_data["player1Id"], event_data["player2Id"]])
+
+                self._commit(conn, 'game.over', db_start)
+                self.recent_match_ids.add(event_data["matchId"])
+                EVENT_LAG_SECONDS.observe(max(0.0, (datetime.now() - end_time).total_seconds()))
                 logger.info(f"Successfully processed game event for match {event_data['matchId']}")
 
+        except MissingPlayersError:
+            raise
         except Exception as e:
             logger.error(f"Error processing game event: {str(e)}")
             raise
@@ -330,7 +457,8 @@ class AnalyticsEventProcessor:
     def process_user_event(self, event_data: Dict[str, Any]) -> None:
         try:
             logger.info(f"Processing user event for {event_data['username']}")
-            with self.db.get_connection() as conn:
+            with self._get_connection() as conn:
+                db_start = time.perf_counter()
                 cursor = conn.cursor()
 
                 # First check if user exists
@@ -364,7 +492,7 @@ class AnalyticsEventProcessor:
                     event_data["country"]
                 ))
 
-                conn.commit()
+                self._commit(conn, 'user.signup', db_start)
                 logger.info(f"Successfully processed user event for {event_data['username']}")
 
         except Exception as e:
@@ -373,89 +501,194 @@ class AnalyticsEventProcessor:
 
 
 
+def game_event_from_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """game.* messages carry the event either as an eventBody JSON string or directly"""
+    if 'eventBody' in message:
+        return json.loads(message['eventBody'])
+    return message
+
+
+def user_event_from_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a user.signup message to the players columns"""
+    return {
+        'player_id': message.get('userId'),
+        'username': message.get('username'),
+        'firstname': message.get('firstName'),
+        'lastname': message.get('lastName'),
+        'email': f"{message.get('username')}@example.com",  # Generate email if not provided
+        'birthdate': f"{message['birthDate'][0]}-{str(message['birthDate'][1]).zfill(2)}-{str(message['birthDate'][2]).zfill(2)}",
+        'gender': message.get('gender'),
+        'country': message.get('country')
+    }
+
+
 class AnalyticsConsumer:
-    def __init__(self):
-        self.db_config = DBConfig()
+    """game.over and user.signup handlers on the shared consumer runtime"""
+
+    def __init__(self, runtime: Optional[ConsumerRuntime] = None):
+        self.runtime = runtime or ConsumerRuntime()
+        # One pooled connection per worker, plus one for replays of parked matches
+        self.db_config = DBConfig(pool_size=max(DBConfig.pool_size, self.runtime.concurrency + 1))
         self.db_connection = DatabaseConnection(self.db_config)
-        self.rmq_connection = RabbitMQConnection()
         self.processor = AnalyticsEventProcessor(self.db_connection)
-
-    def process_message(self, ch, method, properties, body):
+        self.parking = ParkingBuffer(PARKING_DB_PATH, PARKING_MEMORY_SIZE, PARKING_MAX_SIZE, PARKING_MAX_AGE_SECONDS)
+        # Serializes parking with the replays after signups, see _process_game_event
+        self.parking_lock = threading.RLock()
+
+        for routing_key, queue in CONSUMED_QUEUES.items():
+            self.runtime.register(Subscription(routing_key, queue, EXCHANGES[routing_key], self.process_message))
+        self.runtime.on_connect(declare_analytics_topology)
+        self.runtime.monitor_queue(DEAD_LETTER_QUEUE)
+        # Dead-letter parked matches whose players never signed up
+        self.runtime.every(PARKING_SWEEP_SECONDS, self._expire_parked)
+
+    def process_message(self, delivery: Delivery):
+        routing_key = delivery.routing_key
+        message = None
         try:
-            logger.info(f"Raw message received: {body}")
-            message = json.loads(body)
-            routing_key = method.routing_key
-            logger.info(f"Received message with routing key: {routing_key}")
-            logger.info(f"Decoded message content: {message}")
+            parse_start = time.perf_counter()
+            message = json.loads(delivery.body)
+            logger.debug(f"Received message with routing key: {routing_key}")
 
             if routing_key.startswith('game.'):
-                logger.info("Processing as game event")
-                # Parse the eventBody which is a JSON string
-                if 'eventBody' in message:
-                    event_data = json.loads(message['eventBody'])
-                    self.processor.process_game_event(event_data)
-                else:
-                    # Handle direct message format
-                    self.processor.process_game_event(message)
+                event = game_event_from_message(message)
+                PROCESSING_SECONDS.labels(routing_key, 'parse').observe(time.perf_counter() - parse_start)
+                processed = self._process_game_event(event, delivery.body)
+                delivery.ack('acked' if processed else 'parked')
             elif routing_key == 'user.signup':
-                logger.info("Processing as user signup event")
-                # Map the user signup data to expected format
-                user_data = {
-                    'player_id': message.get('userId'),
-                    'username': message.get('username'),
-                    'firstname': message.get('firstName'),
-                    'lastname': message.get('lastName'),
-                    'email': f"{message.get('username')}@example.com",  # Generate email if not provided
-                    'birthdate': f"{message['birthDate'][0]}-{str(message['birthDate'][1]).zfill(2)}-{str(message['birthDate'][2]).zfill(2)}",
-                    'gender': message.get('gender'),
-                    'country': message.get('country')
-                }
-                self.processor.process_user_event(user_data)
-
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-            logger.info("Message processed successfully")
+                user_event = user_event_from_message(message)
+                PROCESSING_SECONDS.labels(routing_key, 'parse').observe(time.perf_counter() - parse_start)
+                self.processor.process_user_event(user_event)
+                delivery.ack()
+                self._replay_parked(user_event['player_id'])
+            else:
+                delivery.ack()
+            logger.debug("Message processed successfully")
 
         except json.JSONDecodeError as e:
             logger.error(f"JSON Decode Error: {str(e)}")
-            logger.error(f"Problematic message: {body}")
-            ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
-        except KeyError as e:
-            logger.error(f"Missing required field: {str(e)}")
+            logger.error(f"Problematic message: {delivery.body}")
+            self._dead_letter(delivery, e)
+        except (KeyError, ValueError, TypeError) as e:
+            # Malformed event: another attempt would fail the same way
+            logger.error(f"Invalid message: {type(e).__name__}: {str(e)}")
             logger.error(f"Message content: {message}")
-            ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+            self._dead_letter(delivery, e)
         except Exception as e:
+            # Database errors get delayed retries
             logger.error(f"Error processing message: {str(e)}")
-            if "foreign key constraint fails" in str(e):
-                logger.error("Foreign key constraint failed - discarding message")
-                ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
-            else:
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            self._retry(delivery, e)
 
-    def start(self):
+    def _process_game_event(self, event: Dict[str, Any], body: bytes) -> bool:
+        """False when the match was parked to wait for its players' signups"""
         try:
-            logger.info("Starting Analytics Consumer...")
-            self.rmq_connection.connect()
-
-            # Set up consumers
-            self.rmq_connection.channel.basic_consume(
-                queue='data_analytics_q',
-                on_message_callback=self.process_message
-            )
-            self.rmq_connection.channel.basic_consume(
-                queue='user_signup_q',
-                on_message_callback=self.process_message
-            )
+            self.processor.process_game_event(event)
+            return True
+        except MissingPlayersError:
+            pass
+        # Tried again under the lock that signups replay under: a signup committed
+        # on another worker since the first attempt is either seen now, or its
+        # replay runs after the match is parked
+        with self.parking_lock:
+            try:
+                self.processor.process_game_event(event)
+                return True
+            except MissingPlayersError as e:
+                logger.info(str(e))
+                self._park(body, e)
+                return False
+
+    def _park(self, body: bytes, error: MissingPlayersError) -> None:
+        evicted = self.parking.park(ParkedMatch(error.match_id, body, error.player_ids, time.time()))
+        for entry in evicted:
+            self._dead_letter_parked(entry, "Parking buffer full")
+        PARKED_MATCHES.set(len(self.parking))
+        logger.info(f"Parked match {error.match_id} ({len(self.parking)} parked)")
+
+    def _replay_parked(self, player_id: str) -> None:
+        """Process the matches that were waiting for this player's signup"""
+        with self.parking_lock:
+            for entry in self.parking.release(player_id):
+                logger.info(f"Replaying parked match {entry.match_id}")
+                try:
+                    self.processor.process_game_event(game_event_from_message(json.loads(entry.body)))
+                except MissingPlayersError as e:
+                    # Still waiting for the other player
+                    self._park(entry.body, e)
+                except Exception as e:
+                    logger.error(f"Replay of match {entry.match_id} failed: {str(e)}")
+                    try:
+                        self.runtime.publish(RETRY_EXCHANGE,
+                                             retry_queue_name('data_analytics_q', RETRY_DELAYS_MS[0]),
+                                             entry.body, {
+                                                 RETRY_COUNT_HEADER: 1,
+                                                 ORIGINAL_ROUTING_KEY_HEADER: 'game.over',
+                                                 ERROR_HEADER: str(e)[:1000]
+                                             })
+                    except Exception as publish_error:
+                        logger.error(f"Could not schedule retry of match {entry.match_id}: {str(publish_error)}")
+            PARKED_MATCHES.set(len(self.parking))
+
+    def _dead_letter_parked(self, entry: ParkedMatch, reason: str) -> None:
+        logger.error(f"{reason}: moving parked match {entry.match_id} to {DEAD_LETTER_QUEUE}")
+        try:
+            self.runtime.publish(DEAD_LETTER_EXCHANGE, DEAD_LETTER_QUEUE, entry.body, {
+                ORIGINAL_ROUTING_KEY_HEADER: 'game.over',
+                ERROR_HEADER: f"{reason}; waiting for players {', '.join(entry.player_ids)}"
+            })
+        except Exception as e:
+            logger.error(f"Could not dead-letter parked match {entry.match_id}: {str(e)}")
+
+    def _expire_parked(self) -> None:
+        with self.parking_lock:
+            for entry in self.parking.expire(time.time()):
+                self._dead_letter_parked(entry, "Parked for too long")
+            PARKED_MATCHES.set(len(self.parking))
+
+    def _republish(self, delivery: Delivery, exchange: str, routing_key: str,
+                   headers: Dict[str, Any], outcome: str) -> None:
+        """Publish a copy with extra headers, then ack the original; requeue it if the copy is not confirmed"""
+        merged = dict(delivery.headers)
+        merged.update(headers)
+        content_type = delivery.properties.content_type if delivery.properties else None
+        try:
+            self.runtime.publish(exchange, routing_key, delivery.body, merged, content_type=content_type)
+        except Exception as e:
+            logger.error(f"Could not republish message to {exchange}: {str(e)}")
+            delivery.nack(requeue=True)
+            return
+        delivery.ack(outcome)
+
+    def _retry(self, delivery: Delivery, error: Exception) -> None:
+        retry_count = int(delivery.headers.get(RETRY_COUNT_HEADER, 0))
+        if retry_count >= len(RETRY_DELAYS_MS):
+            self._dead_letter(delivery, error)
+            return
+
+        delay_ms = RETRY_DELAYS_MS[retry_count]
+        queue = CONSUMED_QUEUES.get(delivery.routing_key, 'data_analytics_q')
+        logger.warning(f"Retrying message in {delay_ms} ms (attempt {retry_count + 1}/{len(RETRY_DELAYS_MS)})")
+        self._republish(delivery, RETRY_EXCHANGE, retry_queue_name(queue, delay_ms), {
+            RETRY_COUNT_HEADER: retry_count + 1,
+            ORIGINAL_ROUTING_KEY_HEADER: delivery.routing_key,
+            ERROR_HEADER: str(error)[:1000]
+        }, 'retried')
+
+    def _dead_letter(self, delivery: Delivery, error: Exception) -> None:
+        logger.error(f"Moving message to {DEAD_LETTER_QUEUE}")
+        self._republish(delivery, DEAD_LETTER_EXCHANGE, DEAD_LETTER_QUEUE, {
+            ORIGINAL_ROUTING_KEY_HEADER: delivery.routing_key,
+            ERROR_HEADER: str(error)[:1000]
+        }, 'dead_lettered')
 
-            logger.info("Consumer ready, waiting for messages...")
-            self.rmq_connection.channel.start_consuming()
+    def start(self):
+        logger.info("Starting Analytics Consumer...")
+        PARKED_MATCHES.set(len(self.parking))
+        self.runtime.run()
 
-        except KeyboardInterrupt:
-            logger.info("Shutting down consumer...")
-            self.rmq_connection.channel.stop_consuming()
-        finally:
-            self.rmq_connection.close()
 
 def main():
+    start_metrics_server()
     consumer = AnalyticsConsumer()
     consumer.start()
 
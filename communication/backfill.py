@@ -0,0 +1,296 @@
+"""
+Bulk backfill / replay of game.over and user.signup events.
+
+Loads historical or recovered events straight into players, match_history and
+match_moves with large multi-row inserts instead of pushing each one through
+AnalyticsConsumer.process_message. The match_history triggers are suspended
+for the loading session (@suspend_stats_triggers), and player_game_stats and
+the Statistics API read model are rebuilt once at the end with set-based
+procedures. Ratings are replayed from match_history by ratings.py. The rebuild
+runs even when every match was already loaded, so rerunning an interrupted
+backfill brings the derived tables up to date.
+
+Sources:
+    python backfill.py --jsonl events.jsonl        # one message body per line
+    python backfill.py --parquet matches.parquet   # one event per row, game.over columns (needs pyarrow)
+    python backfill.py --queue                     # drain user_signup_q and data_analytics_q
+
+Messages use the same formats as the consumer: game events directly or wrapped
+in eventBody, user.signup messages with userId/birthDate. Stop the consumer
+before --queue so it does not compete for the messages; they are acked only
+after the batch holding them is committed. Skipped matches are never acked:
+they go back to the queue when backfill disconnects, for the consumer to park
+until their players sign up. Malformed messages are moved to
+analytics_dead_letter_q, so they cannot stop later runs.
+
+Replays are idempotent: matches already in match_history and players that
+already exist are skipped. Matches whose players or game are unknown are
+skipped and counted. Game names match case-insensitively, like the consumer's
+lookup.
+"""
+import argparse
+import json
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import pika
+
+from analytics_consumer import (DEAD_LETTER_EXCHANGE, DEAD_LETTER_QUEUE, ERROR_HEADER, ORIGINAL_ROUTING_KEY_HEADER,
+                                DBConfig, DatabaseConnection, RabbitMQConnection, declare_analytics_topology,
+                                game_event_from_message, user_event_from_message)
+from ratings import rebuild_skill_ratings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+
+# (kind, event, delivery tag or None); kind is 'game' or 'user'
+Event = Tuple[str, Dict[str, Any], Optional[int]]
+
+
+def _classify(message: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    if 'userId' in message:
+        return 'user', user_event_from_message(message)
+    return 'game', game_event_from_message(message)
+
+
+def read_jsonl(path: str) -> Iterator[Event]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                kind, event = _classify(json.loads(line))
+                yield kind, event, None
+
+
+def read_parquet(path: str) -> Iterator[Event]:
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches():
+        for row in batch.to_pylist():
+            kind, event = _classify(row)
+            yield kind, event, None
+
+
+def drain_queue(rmq: RabbitMQConnection, counts: Dict[str, int]) -> Iterator[Event]:
+    """
+    Signups first, so the players of the drained matches exist before they are
+    loaded. Malformed messages are moved to the dead-letter queue and counted as
+    skipped instead of stopping the backfill.
+    """
+    for queue, kind in (('user_signup_q', 'user'), ('data_analytics_q', 'game')):
+        while True:
+            method, properties, body = rmq.channel.basic_get(queue=queue, auto_ack=False)
+            if method is None:
+                break
+            try:
+                message = json.loads(body)
+                event = user_event_from_message(message) if kind == 'user' else game_event_from_message(message)
+            except (KeyError, ValueError, TypeError) as e:
+                # Would fail the same way on every later run
+                logger.error(f"Invalid message in {queue}: {type(e).__name__}: {str(e)}")
+                dead_letter(rmq, method, properties, body, e)
+                counts['skipped'] += 1
+                continue
+            yield kind, event, method.delivery_tag
+
+
+def dead_letter(rmq: RabbitMQConnection, method, properties, body: bytes, error: Exception) -> None:
+    """Move a message to the analytics dead-letter queue, like the consumer does with malformed ones"""
+    headers = dict((properties.headers if properties else None) or {})
+    headers.update({ORIGINAL_ROUTING_KEY_HEADER: method.routing_key, ERROR_HEADER: str(error)[:1000]})
+    # The channel is in confirm mode, so the copy is on the broker before the original is acked
+    rmq.channel.basic_publish(exchange=DEAD_LETTER_EXCHANGE, routing_key=DEAD_LETTER_QUEUE, body=body,
+                              properties=pika.BasicProperties(
+                                  headers=headers,
+                                  content_type=properties.content_type if properties else None,
+                                  delivery_mode=2))
+    rmq.channel.basic_ack(delivery_tag=method.delivery_tag)
+
+
+def ack_deliveries(rmq: RabbitMQConnection, tags: List[int]) -> None:
+    """One ack per message: a multiple ack would also ack the skipped ones below it"""
+    for tag in tags:
+        rmq.channel.basic_ack(delivery_tag=tag)
+
+
+def _parse_datetime(value: str) -> datetime:
+    return datetime.strptime(value.split('.')[0], "%Y-%m-%dT%H:%M:%S")
+
+
+class Backfill:
+    def __init__(self, conn, batch_size: int = DEFAULT_BATCH_SIZE,
+                 on_commit: Optional[Callable[[List[int]], None]] = None):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.batch_size = batch_size
+        # Called with the delivery tags of a batch once it is committed, except those of skipped matches
+        self.on_commit = on_commit
+        self.users: List[Dict[str, Any]] = []
+        self.games: List[Dict[str, Any]] = []
+        self.tags: List[int] = []
+        self.match_tags: Dict[str, List[int]] = {}
+        self.skipped_tags: set = set()
+        self.counts = {'players': 0, 'matches': 0, 'duplicates': 0, 'skipped': 0}
+
+        # games.name has a case-insensitive collation
+        self.cursor.execute("SELECT name, game_id FROM games")
+        self.game_ids = {name.lower(): game_id for name, game_id in self.cursor.fetchall()}
+        self.cursor.execute("SET @suspend_stats_triggers = 1")
+
+    def add(self, kind: str, event: Dict[str, Any], delivery_tag: Optional[int] = None) -> None:
+        (self.users if kind == 'user' else self.games).append(event)
+        if delivery_tag is not None:
+            self.tags.append(delivery_tag)
+            if kind == 'game':
+                self.match_tags.setdefault(event['matchId'], []).append(delivery_tag)
+        if len(self.users) + len(self.games) >= self.batch_size:
+            self.flush()
+
+    def _existing(self, query: str, ids: List[str]) -> set:
+        if not ids:
+            return set()
+        placeholders = ', '.join(['UUID_TO_BIN(%s)'] * len(ids))
+        self.cursor.execute(query.format(placeholders=placeholders), ids)
+        return {row[0] for row in self.cursor.fetchall()}
+
+    def _insert_users(self) -> None:
+        users = list({user['player_id']: user for user in self.users}.values())
+        existing = self._existing(
+            "SELECT BIN_TO_UUID(player_id) FROM players WHERE player_id IN ({placeholders})",
+            [user['player_id'] for user in users]
+        )
+        rows = [
+            (user['player_id'], user['username'], user['firstname'], user['lastname'],
+             user['email'], user['birthdate'], user['gender'], user['country'])
+            for user in users if user['player_id'] not in existing
+        ]
+        if rows:
+            # executemany rewrites a plain INSERT ... VALUES into one multi-row statement
+            self.cursor.executemany("""
+                INSERT IGNORE INTO players (
+                    player_id, username, firstname, lastname,
+                    email, birthdate, gender, country
+                ) VALUES (UUID_TO_BIN(%s), %s, %s, %s, %s, %s, %s, %s)
+            """, rows)
+        self.counts['players'] += len(rows)
+
+    def _insert_games(self) -> None:
+        games = list({event['matchId']: event for event in self.games}.values())
+        existing_matches = self._existing(
+            "SELECT BIN_TO_UUID(match_id) FROM match_history WHERE match_id IN ({placeholders})",
+            [event['matchId'] for event in games]
+        )
+        player_ids = list({player_id for event in games for player_id in (event['player1Id'], event['player2Id'])})
+        known_players = self._existing(
+            "SELECT BIN_TO_UUID(player_id) FROM players WHERE player_id IN ({placeholders})", player_ids
+        )
+
+        matches, moves = [], []
+        for event in games:
+            if event['matchId'] in existing_matches:
+                self.counts['duplicates'] += 1
+                continue
+            game_id = self.game_ids.get(str(event['game']).lower())
+            if (game_id is None or event['player1Id'] not in known_players
+                    or event['player2Id'] not in known_players):
+                self.counts['skipped'] += 1
+                self.skipped_tags.update(self.match_tags.get(event['matchId'], []))
+                continue
+
+            start_time = _parse_datetime(event['startTime'])
+            end_time = _parse_datetime(event['endTime'])
+            matches.append((
+                event['matchId'], game_id, event['player1Id'], event['player2Id'], event['winnerId'],
+                start_time, end_time, int((end_time - start_time).total_seconds() / 60),
+                'win' if event['winnerId'] else 'draw'
+            ))
+            moves.append((event['matchId'], event['player1Id'], event['player1MoveCounts']))
+            moves.append((event['matchId'], event['player2Id'], event['player2MoveCounts']))
+
+        if matches:
+            self.cursor.executemany("""
+                INSERT INTO match_history (
+                    match_id, game_id, player1_id, player2_id, winner_id,
+                    start_time, end_time, duration_minutes, result
+                ) VALUES (
+                    UUID_TO_BIN(%s), %s, UUID_TO_BIN(%s), UUID_TO_BIN(%s), UUID_TO_BIN(%s),
+                    %s, %s, %s, %s
+                )
+            """, matches)
+            self.cursor.executemany("""
+                INSERT IGNORE INTO match_moves (move_id, match_id, player_id, moves_count)
+                VALUES (UUID_TO_BIN(UUID()), UUID_TO_BIN(%s), UUID_TO_BIN(%s), %s)
+            """, moves)
+        self.counts['matches'] += len(matches)
+
+    def flush(self) -> None:
+        if not self.users and not self.games:
+            return
+        self._insert_users()
+        self._insert_games()
+        self.conn.commit()
+        if self.on_commit is not None and self.tags:
+            self.on_commit([tag for tag in self.tags if tag not in self.skipped_tags])
+        logger.info(f"Committed batch: {self.counts}")
+        self.users, self.games = [], []
+        self.tags, self.match_tags, self.skipped_tags = [], {}, set()
+
+    def finish(self) -> Dict[str, int]:
+        """Flush the last batch, then rebuild the derived tables with the triggers re-enabled"""
+        self.flush()
+        self.cursor.execute("SET @suspend_stats_triggers = NULL")
+        # Also with nothing new: an interrupted run may have committed matches without rebuilding
+        logger.info("Rebuilding player_game_stats...")
+        self.cursor.execute("CALL rebuild_player_game_stats()")
+        logger.info("Rebuilding player_game_stats_view...")
+        self.cursor.execute("CALL rebuild_player_game_stats_view()")
+        logger.info("Replaying player_skill_ratings and player_ratings...")
+        rebuild_skill_ratings(self.conn)
+        # Invalidate every cached Statistics API response
+        self.cursor.execute("""
+            INSERT INTO stats_cache_versions (scope, version) VALUES ('global', 1)
+            ON DUPLICATE KEY UPDATE version = version + 1
+        """)
+        self.cursor.execute("UPDATE stats_cache_versions SET version = version + 1 WHERE scope <> 'global'")
+        self.conn.commit()
+        self.cursor.close()
+        return self.counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load game.over / user.signup events")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--jsonl", help="File with one message body per line")
+    source.add_argument("--parquet", help="Parquet file with one event per row")
+    source.add_argument("--queue", action="store_true", help="Drain user_signup_q and data_analytics_q")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Events per committed batch")
+    args = parser.parse_args()
+
+    db = DatabaseConnection(DBConfig(pool_size=1))
+    conn = db.get_connection()
+    rmq = None
+    try:
+        if args.queue:
+            rmq = RabbitMQConnection()
+            rmq.connect()
+            declare_analytics_topology(rmq)
+            rmq.channel.confirm_delivery()
+            backfill = Backfill(conn, args.batch_size, on_commit=lambda tags: ack_deliveries(rmq, tags))
+            events = drain_queue(rmq, backfill.counts)
+        else:
+            events = read_jsonl(args.jsonl) if args.jsonl else read_parquet(args.parquet)
+            backfill = Backfill(conn, args.batch_size)
+
+        for kind, event, delivery_tag in events:
+            backfill.add(kind, event, delivery_tag)
+        counts = backfill.finish()
+        logger.info(f"Backfill finished: {counts}")
+    finally:
+        conn.close()
+        if rmq is not None:
+            rmq.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Prometheus metrics for the analytics consumer, served in the text format on
+METRICS_PORT (default 9100, 0 disables the endpoint):
+
+    curl localhost:9100/metrics
+
+rate(analytics_events_total[1m]) gives events/sec per routing key;
+analytics_processing_seconds is split into the parse, db and commit phases,
+plus handle for the whole handler call of every consumer on the runtime.
+"""
+import logging
+import os
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
+
+# Most events take a few milliseconds; the long tail is lock waits and pool exhaustion
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+EVENTS = Counter(
+    'analytics_events_total', 'Messages received', ['routing_key']
+)
+OUTCOMES = Counter(
+    'analytics_messages_total',
+    'Messages by outcome: acked, parked, retried, dead_lettered, requeued or rejected',
+    ['routing_key', 'outcome']
+)
+PROCESSING_SECONDS = Histogram(
+    'analytics_processing_seconds', 'Time spent per processing phase',
+    ['routing_key', 'phase'], buckets=LATENCY_BUCKETS
+)
+POOL_WAIT_SECONDS = Histogram(
+    'analytics_db_pool_wait_seconds', 'Time waiting for a pooled database connection',
+    buckets=LATENCY_BUCKETS
+)
+EVENT_LAG_SECONDS = Histogram(
+    'analytics_event_lag_seconds', 'Time from the end of a match until its game.over event is stored',
+    buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600, 21600, 86400)
+)
+QUEUE_MESSAGES = Gauge(
+    'analytics_queue_messages', 'Messages ready in a queue', ['queue']
+)
+IN_FLIGHT = Gauge(
+    'analytics_messages_in_flight', 'Messages received and not yet acked or nacked'
+)
+BATCH_MESSAGES = Histogram(
+    'analytics_batch_messages', 'Messages per batch handed to a batching handler',
+    ['routing_key'], buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+PARKED_MATCHES = Gauge(
+    'analytics_parked_matches', 'Game events waiting for their players to sign up'
+)
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> None:
+    if port:
+        start_http_server(port)
+        logger.info(f"Metrics available on port {port}")
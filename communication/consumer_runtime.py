@@ -0,0 +1,565 @@
+"""
+Shared RabbitMQ consumer runtime.
+
+Consumers register a handler per routing key instead of running their own
+BlockingConnection loop:
+
+    runtime = ConsumerRuntime()
+    runtime.register(Subscription('match.completed', 'battleship_queue', 'battleship_exchange',
+                                  handle_matches, batch_size=200))
+    runtime.run()
+
+One connection thread owns the channel. It declares the exchanges, queues and
+bindings, keeps up to CONSUMER_PREFETCH unacked messages per queue and hands
+them to CONSUMER_CONCURRENCY worker threads. Handlers with batch_size > 1 get
+lists of up to batch_size deliveries, flushed batch_timeout seconds after the
+first one arrived at the latest. pika channels are not thread-safe, so
+Delivery.ack / nack and ConsumerRuntime.publish run on the connection thread
+and wait for it.
+
+A handler that returns leaves its unsettled deliveries acked. If it raises,
+they are republished to <queue>.retry, which hands them back to the queue
+after CONSUMER_RETRY_DELAY_MS. The attempts are counted in the x-retry-count
+header; after CONSUMER_MAX_RETRIES retries a failing message is rejected.
+With concurrency above 1, messages of one queue can be processed out of order.
+
+Rejected messages go to <queue>.dead once the queue has a dead-letter policy.
+Without one they are discarded. Apply it once per consumed queue; it changes
+no queue arguments, so existing queues keep their messages:
+
+    python consumer_runtime.py data_analytics_q user_signup_q battleship_queue
+
+prints the rabbitmqctl commands.
+
+Run the MQConfig subscribers with this directory on the import path:
+
+    PYTHONPATH=communication python MQConfig/BattleshipMatchSubscriber.py
+"""
+import argparse
+import functools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Tuple
+
+import backoff
+import pika
+from dotenv import load_dotenv
+from pika.exceptions import AMQPConnectionError, StreamLostError
+
+from consumer_metrics import BATCH_MESSAGES, EVENTS, IN_FLIGHT, OUTCOMES, PROCESSING_SECONDS, QUEUE_MESSAGES
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CONSUMER_PREFETCH = int(os.getenv('CONSUMER_PREFETCH', '50'))
+CONSUMER_CONCURRENCY = int(os.getenv('CONSUMER_CONCURRENCY', '4'))
+# Fraction of message payloads logged; full bodies at INFO cost more than processing them
+PAYLOAD_LOG_SAMPLE_RATE = float(os.getenv('PAYLOAD_LOG_SAMPLE_RATE', '0'))
+QUEUE_SAMPLE_SECONDS = 15
+# Longest the connection thread waits for broker events before checking for due batches
+POLL_SECONDS = 0.05
+SHUTDOWN_TIMEOUT_SECONDS = 30
+CONSUMER_MAX_RETRIES = int(os.getenv('CONSUMER_MAX_RETRIES', '3'))
+CONSUMER_RETRY_DELAY_MS = int(os.getenv('CONSUMER_RETRY_DELAY_MS', '5000'))
+
+# Set on republished messages (retries, dead letters) so they reach the handler
+# of the routing key they were first published with
+ORIGINAL_ROUTING_KEY_HEADER = 'x-original-routing-key'
+RETRY_COUNT_HEADER = 'x-retry-count'
+ERROR_HEADER = 'x-last-error'
+# Rejected messages of every runtime-managed queue are routed to its <queue>.dead
+CONSUMER_DEAD_LETTER_EXCHANGE = 'consumer_dead_letter_exchange'
+
+
+def dead_letter_queue_name(queue: str) -> str:
+    return f"{queue}.dead"
+
+
+def consumer_retry_queue_name(queue: str) -> str:
+    return f"{queue}.retry"
+
+
+class RabbitMQConnection:
+    def __init__(self):
+        self.connection = None
+        self.channel = None
+        self.host = os.getenv('RABBITMQ_HOST', 'localhost')
+        self.port = int(os.getenv('RABBITMQ_PORT', '5672'))
+        self.username = os.getenv('RABBITMQ_USERNAME', 'guest')
+        self.password = os.getenv('RABBITMQ_PASSWORD', 'guest')
+        self.connection_parameters = None
+
+        logger.info(f"RabbitMQ Configuration - Host: {self.host}, Port: {self.port}, Username: {self.username}")
+
+    def _create_connection_parameters(self):
+        """Create connection parameters with robust settings"""
+        if not self.username or not self.password:
+            raise ValueError("RabbitMQ credentials not properly configured!")
+
+        credentials = pika.PlainCredentials(
+            username=self.username,
+            password=self.password
+        )
+
+        return pika.ConnectionParameters(
+            host=self.host,
+            port=self.port,
+            credentials=credentials,
+            heartbeat=60,  # 60 second heartbeat
+            blocked_connection_timeout=300,
+            connection_attempts=3,
+            retry_delay=5,
+            socket_timeout=10,
+            stack_timeout=15
+        )
+
+    def declare_exchange(self, exchange_name: str, exchange_type: str):
+        """Safely declare an exchange, handling existing exchanges."""
+        try:
+            self.channel.exchange_declare(
+                exchange=exchange_name,
+                exchange_type=exchange_type,
+                durable=True
+            )
+            logger.info(f"Successfully declared exchange: {exchange_name}")
+        except pika.exceptions.ChannelClosedByBroker as e:
+            if e.args[0] == 406:  # PRECONDITION_FAILED
+                logger.warning(f"Exchange {exchange_name} exists with different settings. Attempting to recreate...")
+                self.channel = self.connection.channel()
+                try:
+                    self.channel.exchange_delete(exchange=exchange_name)
+                    logger.info(f"Deleted existing exchange: {exchange_name}")
+                    self.channel = self.connection.channel()
+                    self.channel.exchange_declare(
+                        exchange=exchange_name,
+                        exchange_type=exchange_type,
+                        durable=True
+                    )
+                    logger.info(f"Successfully recreated exchange: {exchange_name}")
+                except Exception as inner_e:
+                    logger.error(f"Failed to recreate exchange {exchange_name}: {str(inner_e)}")
+                    raise
+
+    def declare_queue(self, queue_name: str, durable: bool = False, arguments: Dict[str, Any] = None,
+                      recreate: bool = True):
+        """
+        Safely declare a queue, handling existing queues. With recreate=False a
+        queue that exists with different settings is kept as it is, messages
+        included.
+        """
+        try:
+            self.channel.queue_declare(queue=queue_name, durable=durable, arguments=arguments)
+            logger.info(f"Successfully declared queue: {queue_name}")
+        except pika.exceptions.ChannelClosedByBroker as e:
+            if e.args[0] == 406 and not recreate:
+                logger.warning(f"Queue {queue_name} exists with different settings, keeping it")
+                self.channel = self.connection.channel()
+                self.channel.queue_declare(queue=queue_name, passive=True)
+            elif e.args[0] == 406:  # PRECONDITION_FAILED
+                logger.warning(f"Queue {queue_name} exists with different settings. Attempting to recreate...")
+                self.channel = self.connection.channel()
+                try:
+                    self.channel.queue_delete(queue=queue_name)
+                    logger.info(f"Deleted existing queue: {queue_name}")
+                    self.channel = self.connection.channel()
+                    self.channel.queue_declare(queue=queue_name, durable=durable, arguments=arguments)
+                    logger.info(f"Successfully recreated queue: {queue_name}")
+                except Exception as inner_e:
+                    logger.error(f"Failed to recreate queue {queue_name}: {str(inner_e)}")
+                    raise
+
+    @backoff.on_exception(backoff.expo,
+                          (AMQPConnectionError, StreamLostError),
+                          max_tries=5,
+                          max_time=300)
+    def connect(self):
+        """Connect to RabbitMQ with exponential backoff retry"""
+        try:
+            logger.info(f"Attempting to connect to RabbitMQ at {self.host}:{self.port}")
+
+            if self.connection and not self.connection.is_closed:
+                logger.info("Closing existing connection before reconnecting...")
+                self.connection.close()
+
+            self.connection_parameters = self._create_connection_parameters()
+            self.connection = pika.BlockingConnection(self.connection_parameters)
+            self.channel = self.connection.channel()
+            logger.info("Successfully connected to RabbitMQ")
+
+        except pika.exceptions.ProbableAuthenticationError as auth_error:
+            logger.error(f"RabbitMQ Authentication Error: {str(auth_error)}")
+            raise
+        except pika.exceptions.AMQPConnectionError as conn_error:
+            logger.error(f"RabbitMQ Connection Error: {str(conn_error)}")
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error connecting to RabbitMQ: {str(e)}")
+            raise
+
+    def close(self):
+        """Safely close the RabbitMQ connection"""
+        try:
+            if self.connection and not self.connection.is_closed:
+                self.connection.close()
+                logger.info("RabbitMQ connection closed")
+        except Exception as e:
+            logger.error(f"Error closing RabbitMQ connection: {str(e)}")
+
+
+def declare_consumer_queue(rmq: RabbitMQConnection, queue: str, durable: bool = False) -> None:
+    """
+    A consumed queue with its dead-letter and retry queues.
+
+    The consumed queue itself is declared without arguments, as it always was:
+    changing them would make the broker refuse the declaration of an existing
+    queue. Rejected messages reach <queue>.dead through a broker policy instead,
+    see dead_letter_policy_command. A consumed queue is never deleted, even if
+    it exists with different settings.
+    """
+    rmq.declare_exchange(CONSUMER_DEAD_LETTER_EXCHANGE, 'direct')
+    dead_letter_queue = dead_letter_queue_name(queue)
+    rmq.declare_queue(dead_letter_queue, durable=True)
+    rmq.channel.queue_bind(exchange=CONSUMER_DEAD_LETTER_EXCHANGE, queue=dead_letter_queue,
+                           routing_key=dead_letter_queue)
+
+    rmq.declare_queue(queue, durable=durable, recreate=False)
+    # Nothing consumes the retry queue: expired messages go back to the queue
+    # through the default exchange
+    rmq.declare_queue(consumer_retry_queue_name(queue), durable=True, arguments={
+        'x-message-ttl': CONSUMER_RETRY_DELAY_MS,
+        'x-dead-letter-exchange': '',
+        'x-dead-letter-routing-key': queue
+    })
+
+
+def dead_letter_policy_command(queue: str) -> str:
+    """rabbitmqctl command that dead-letters the queue's rejected messages to <queue>.dead"""
+    definition = json.dumps({
+        'dead-letter-exchange': CONSUMER_DEAD_LETTER_EXCHANGE,
+        'dead-letter-routing-key': dead_letter_queue_name(queue)
+    })
+    return f"rabbitmqctl set_policy --apply-to queues {queue}-dead-letter '^{re.escape(queue)}$' '{definition}'"
+
+
+@dataclass
+class Subscription:
+    """A handler for the messages published to exchange with routing_key, consumed from queue"""
+    routing_key: str
+    queue: str
+    exchange: str
+    # Called with one Delivery, or with a list of them when batch_size > 1
+    handler: Callable
+    batch_size: int = 1
+    batch_timeout: float = 1.0
+    durable: bool = False
+    exchange_type: str = 'direct'
+
+
+class Delivery:
+    """A received message; ack / nack may be called from any thread"""
+
+    def __init__(self, runtime: 'ConsumerRuntime', method, properties, body: bytes, routing_key: str,
+                 queue: str):
+        self.body = body
+        self.properties = properties
+        self.headers: Dict[str, Any] = (properties.headers if properties else None) or {}
+        self.routing_key = routing_key
+        self.queue = queue
+        self.delivery_tag = method.delivery_tag
+        self.redelivered = method.redelivered
+        self.settled = False
+        self._runtime = runtime
+
+    def ack(self, outcome: str = 'acked') -> None:
+        self._runtime.settle([self], ack=True, outcome=outcome)
+
+    def nack(self, requeue: bool = True, outcome: str = None) -> None:
+        self._runtime.settle([self], ack=False, requeue=requeue,
+                             outcome=outcome or ('requeued' if requeue else 'rejected'))
+
+
+class ConsumerRuntime:
+    def __init__(self, prefetch: int = CONSUMER_PREFETCH, concurrency: int = CONSUMER_CONCURRENCY,
+                 connection: RabbitMQConnection = None):
+        self.prefetch = prefetch
+        self.concurrency = concurrency
+        self.rmq = connection or RabbitMQConnection()
+        # queue -> routing key -> subscription
+        self.subscriptions: Dict[str, Dict[str, Subscription]] = {}
+        self._setup_hooks: List[Callable[[RabbitMQConnection], None]] = []
+        self._tasks: List[Tuple[float, Callable[[], None]]] = []
+        self._monitored_queues: List[str] = []
+
+        # Connection thread only
+        self._batches: Dict[Tuple[str, str], List[Delivery]] = {}
+        self._batch_started: Dict[Tuple[str, str], float] = {}
+        self._thread_id = None
+        self._executor = None
+        self._stopping = False
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._pending: set = set()
+        self._closed = False
+
+    def register(self, subscription: Subscription) -> None:
+        routes = self.subscriptions.setdefault(subscription.queue, {})
+        if subscription.routing_key in routes:
+            raise ValueError(f"{subscription.routing_key} on {subscription.queue} already has a handler")
+        routes[subscription.routing_key] = subscription
+
+    def on_connect(self, hook: Callable[[RabbitMQConnection], None]) -> None:
+        """Run hook(connection) after the subscriptions are declared, e.g. for retry queues"""
+        self._setup_hooks.append(hook)
+
+    def every(self, seconds: float, task: Callable[[], None]) -> None:
+        """Run task on a worker thread every seconds while consuming"""
+        self._tasks.append((seconds, task))
+
+    def monitor_queue(self, queue: str) -> None:
+        """Report the depth of a queue that is not consumed, e.g. a dead-letter queue"""
+        self._monitored_queues.append(queue)
+
+    def call(self, fn: Callable[[Any], Any]) -> Any:
+        """Run fn(channel) on the connection thread and return its result"""
+        if threading.get_ident() == self._thread_id:
+            return fn(self.rmq.channel)
+
+        future = Future()
+
+        def run():
+            with self._lock:
+                self._pending.discard(future)
+            if future.done():  # failed at shutdown
+                return
+            try:
+                future.set_result(fn(self.rmq.channel))
+            except Exception as e:
+                future.set_exception(e)
+
+        with self._lock:
+            if self._closed:
+                raise ConnectionError("Consumer runtime is stopped")
+            self._pending.add(future)
+        self.rmq.connection.add_callback_threadsafe(run)
+        return future.result()
+
+    def publish(self, exchange: str, routing_key: str, body, headers: Dict[str, Any] = None,
+                content_type: str = None) -> None:
+        """Persistent publish; returns once the broker has confirmed it"""
+        properties = pika.BasicProperties(content_type=content_type, delivery_mode=2, headers=headers)
+        self.call(lambda channel: channel.basic_publish(exchange=exchange, routing_key=routing_key,
+                                                        body=body, properties=properties))
+
+    def settle(self, deliveries: List[Delivery], ack: bool, requeue: bool = True, outcome: str = 'acked') -> None:
+        """Ack or nack deliveries with one round trip to the connection thread"""
+        def run(channel):
+            for delivery in deliveries:
+                if ack:
+                    channel.basic_ack(delivery_tag=delivery.delivery_tag)
+                else:
+                    channel.basic_nack(delivery_tag=delivery.delivery_tag, requeue=requeue)
+
+        self.call(run)
+        for delivery in deliveries:
+            delivery.settled = True
+            OUTCOMES.labels(delivery.routing_key, outcome).inc()
+
+    def stop(self) -> None:
+        self._stopping = True
+
+    def _declare(self) -> None:
+        for queue, routes in self.subscriptions.items():
+            for subscription in routes.values():
+                self.rmq.declare_exchange(subscription.exchange, subscription.exchange_type)
+            declare_consumer_queue(self.rmq, queue, durable=any(s.durable for s in routes.values()))
+            for subscription in routes.values():
+                self.rmq.channel.queue_bind(exchange=subscription.exchange, queue=queue,
+                                            routing_key=subscription.routing_key)
+        logger.info("Successfully bound queues to exchanges")
+        for hook in self._setup_hooks:
+            hook(self.rmq)
+
+    def run(self) -> None:
+        """Consume until interrupted or stop() is called"""
+        if not self.subscriptions:
+            raise ValueError("No subscriptions registered")
+
+        self.rmq.connect()
+        self._declare()
+        channel = self.rmq.channel
+        channel.basic_qos(prefetch_count=self.prefetch)
+        # Handlers republish before acking; confirms make sure the broker has the copy first
+        channel.confirm_delivery()
+        for queue in self.subscriptions:
+            channel.basic_consume(queue=queue, on_message_callback=functools.partial(self._on_message, queue))
+
+        self._thread_id = threading.get_ident()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='consumer-worker')
+        for seconds, task in self._tasks:
+            self._schedule(seconds, task)
+        self._sample_queues()
+
+        logger.info(f"Consuming {', '.join(self.subscriptions)} with prefetch {self.prefetch} "
+                    f"and {self.concurrency} workers")
+        try:
+            while not self._stopping:
+                self.rmq.connection.process_data_events(time_limit=POLL_SECONDS)
+                self._flush_batches()
+        except KeyboardInterrupt:
+            logger.info("Shutting down consumer...")
+        finally:
+            self._shutdown()
+
+    def _on_message(self, queue: str, channel, method, properties, body) -> None:
+        headers = (properties.headers if properties else None) or {}
+        # Messages coming back from a delay queue carry the queue name as routing key
+        routing_key = headers.get(ORIGINAL_ROUTING_KEY_HEADER, method.routing_key)
+        routes = self.subscriptions[queue]
+        subscription = routes.get(routing_key) or next(iter(routes.values()))
+
+        EVENTS.labels(routing_key).inc()
+        if PAYLOAD_LOG_SAMPLE_RATE and random.random() < PAYLOAD_LOG_SAMPLE_RATE:
+            logger.info(f"Sampled message with routing key {routing_key}: {body}")
+
+        delivery = Delivery(self, method, properties, body, routing_key, queue)
+        with self._lock:
+            self._in_flight += 1
+            IN_FLIGHT.set(self._in_flight)
+
+        if subscription.batch_size <= 1:
+            self._submit(subscription, [delivery])
+            return
+        key = (queue, subscription.routing_key)
+        batch = self._batches.setdefault(key, [])
+        if not batch:
+            self._batch_started[key] = time.monotonic()
+        batch.append(delivery)
+        if len(batch) >= subscription.batch_size:
+            self._submit(subscription, self._batches.pop(key))
+
+    def _flush_batches(self, force: bool = False) -> None:
+        now = time.monotonic()
+        for (queue, routing_key), batch in list(self._batches.items()):
+            subscription = self.subscriptions[queue][routing_key]
+            if force or now - self._batch_started[(queue, routing_key)] >= subscription.batch_timeout:
+                self._submit(subscription, self._batches.pop((queue, routing_key)))
+
+    def _submit(self, subscription: Subscription, deliveries: List[Delivery]) -> None:
+        self._executor.submit(self._handle, subscription, deliveries)
+
+    def _handle(self, subscription: Subscription, deliveries: List[Delivery]) -> None:
+        start = time.perf_counter()
+        try:
+            subscription.handler(deliveries if subscription.batch_size > 1 else deliveries[0])
+            unsettled = [delivery for delivery in deliveries if not delivery.settled]
+            if unsettled:
+                self.settle(unsettled, ack=True)
+        except Exception as e:
+            logger.error(f"Handler for {subscription.routing_key} failed: {type(e).__name__}: {str(e)}")
+            for delivery in deliveries:
+                if delivery.settled:
+                    continue
+                try:
+                    self._retry(delivery, e)
+                except Exception as settle_error:
+                    logger.error(f"Could not retry message: {str(settle_error)}")
+        finally:
+            PROCESSING_SECONDS.labels(subscription.routing_key, 'handle').observe(time.perf_counter() - start)
+            if subscription.batch_size > 1:
+                BATCH_MESSAGES.labels(subscription.routing_key).observe(len(deliveries))
+            with self._lock:
+                self._in_flight -= len(deliveries)
+                IN_FLIGHT.set(self._in_flight)
+
+    def _retry(self, delivery: Delivery, error: Exception) -> None:
+        """Republish a failed message to its queue's retry queue, or reject it to <queue>.dead"""
+        retry_count = int(delivery.headers.get(RETRY_COUNT_HEADER, 0))
+        if retry_count >= CONSUMER_MAX_RETRIES:
+            logger.error(f"Moving message to {dead_letter_queue_name(delivery.queue)} "
+                         f"after {retry_count} retries")
+            delivery.nack(requeue=False, outcome='dead_lettered')
+            return
+
+        headers = dict(delivery.headers)
+        headers.update({
+            RETRY_COUNT_HEADER: retry_count + 1,
+            ORIGINAL_ROUTING_KEY_HEADER: delivery.routing_key,
+            ERROR_HEADER: str(error)[:1000]
+        })
+        content_type = delivery.properties.content_type if delivery.properties else None
+        try:
+            self.publish('', consumer_retry_queue_name(delivery.queue), delivery.body, headers,
+                         content_type=content_type)
+        except Exception as e:
+            logger.error(f"Could not republish message for retry: {str(e)}")
+            delivery.nack(requeue=True)
+            return
+        logger.warning(f"Retrying message in {CONSUMER_RETRY_DELAY_MS} ms "
+                       f"(attempt {retry_count + 1}/{CONSUMER_MAX_RETRIES})")
+        delivery.ack('retried')
+
+    def _schedule(self, seconds: float, task: Callable[[], None]) -> None:
+        def fire():
+            if self._stopping:
+                return
+            self._executor.submit(self._run_task, task)
+            self.rmq.connection.call_later(seconds, fire)
+
+        self.rmq.connection.call_later(seconds, fire)
+
+    @staticmethod
+    def _run_task(task: Callable[[], None]) -> None:
+        try:
+            task()
+        except Exception as e:
+            logger.error(f"Periodic task {getattr(task, '__name__', task)} failed: {str(e)}")
+
+    def _sample_queues(self) -> None:
+        """Queue lag: messages waiting in the consumed and monitored queues"""
+        dead_letter_queues = [dead_letter_queue_name(queue) for queue in self.subscriptions]
+        for queue in list(self.subscriptions) + dead_letter_queues + self._monitored_queues:
+            try:
+                declared = self.rmq.channel.queue_declare(queue=queue, passive=True)
+                QUEUE_MESSAGES.labels(queue).set(declared.method.message_count)
+            except Exception as e:
+                logger.warning(f"Could not read depth of {queue}: {str(e)}")
+        self.rmq.connection.call_later(QUEUE_SAMPLE_SECONDS, self._sample_queues)
+
+    def _shutdown(self) -> None:
+        """Stop receiving, let the workers settle what they have, then close the connection"""
+        self._stopping = True
+        try:
+            if self.rmq.channel is not None and self.rmq.channel.is_open:
+                self.rmq.channel.stop_consuming()
+                self._flush_batches(force=True)
+                deadline = time.monotonic() + SHUTDOWN_TIMEOUT_SECONDS
+                while self._in_flight and time.monotonic() < deadline:
+                    self.rmq.connection.process_data_events(time_limit=POLL_SECONDS)
+        except Exception as e:
+            logger.warning(f"Could not drain in-flight messages: {str(e)}")
+        finally:
+            with self._lock:
+                self._closed = True
+                pending, self._pending = self._pending, set()
+            for future in pending:
+                if not future.done():
+                    future.set_exception(ConnectionError("Consumer runtime is stopped"))
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+            self.rmq.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the rabbitmqctl dead-letter policy of each consumed queue")
+    parser.add_argument("queues", nargs="+", help="Queue names, e.g. data_analytics_q user_signup_q battleship_queue")
+    for queue in parser.parse_args().queues:
+        print(dead_letter_policy_command(queue))
@@ -0,0 +1,372 @@
+"""
+Load generator for the RabbitMQ ingestion path.
+
+Publishes game.over and user.signup events at a target rate over several
+connections with publisher confirms, then measures how long each event takes
+to become visible in MySQL (game.over -> player_game_stats, user.signup ->
+players) and the throughput the consumer sustains.
+
+The analytics consumer must be running against the same broker and database.
+Players used in matches are created first through user.signup events.
+
+    python load_generator.py --rate 500 --duration 60 --connections 4 --players 200
+    python load_generator.py --rate 2000 --duration 120 --signup-ratio 0.05 --output load_report.json
+
+Latency of a game.over event is measured per player: the generator polls
+player_game_stats.total_games_played for the players in the run, and when a
+player's count grows by n the n oldest unmatched events of that player are
+marked visible. Resolution is bounded by --poll-interval.
+"""
+import argparse
+import heapq
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import mysql.connector
+import pika
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+GAME_EXCHANGE = 'data_analytics_exchange'
+SIGNUP_EXCHANGE = 'user_signup_exchange'
+COUNTRIES = ['USA', 'China', 'Japan', 'Germany', 'UK', 'France', 'South Korea', 'Canada', 'India', 'Brazil']
+GENDERS = ['Male', 'Female', 'Non-Binary']
+
+
+@dataclass
+class LoadConfig:
+    rate: float = 200.0  # events per second over all connections
+    duration: float = 60.0
+    connections: int = 4
+    players: int = 200
+    signup_ratio: float = 0.0  # share of events that are user.signup
+    game: str = 'battleship'
+    poll_interval: float = 0.05
+    drain_timeout: float = 120.0
+    seed: int = 42
+
+
+def get_db_connection():
+    config = {
+        "host": os.getenv('DB_HOST', 'localhost'),
+        "port": int(os.getenv('DB_PORT', '3306')),
+        "user": os.getenv('DB_USER', 'root'),
+        "password": os.getenv('DB_PASSWORD', 'root'),
+        "database": os.getenv('DB_NAME', 'platform_analytics'),
+    }
+    ssl_ca = os.getenv('DB_SSL_CA', '')
+    if ssl_ca:
+        config.update({"ssl_ca": ssl_ca, "ssl_verify_cert": True})
+    conn = mysql.connector.connect(**config)
+    # Every poll must see rows committed by the consumer since the previous one
+    conn.autocommit = True
+    return conn
+
+
+def get_rabbitmq_parameters() -> pika.ConnectionParameters:
+    return pika.ConnectionParameters(
+        host=os.getenv('RABBITMQ_HOST', 'localhost'),
+        port=int(os.getenv('RABBITMQ_PORT', '5672')),
+        credentials=pika.PlainCredentials(os.getenv('RABBITMQ_USERNAME', 'guest'),
+                                          os.getenv('RABBITMQ_PASSWORD', 'guest')),
+        heartbeat=60,
+        blocked_connection_timeout=300
+    )
+
+
+def signup_event(player_id: str, rng: random.Random) -> Dict:
+    """user.signup message in the format the platform publishes"""
+    short_id = player_id[:8]
+    return {
+        'userId': player_id,
+        'username': f"load_{short_id}",
+        'firstName': 'Load',
+        'lastName': f"Test{short_id}",
+        'birthDate': [rng.randint(1960, 2008), rng.randint(1, 12), rng.randint(1, 28)],
+        'gender': rng.choice(GENDERS),
+        'country': rng.choice(COUNTRIES),
+    }
+
+
+def game_event(game: str, player1_id: str, player2_id: str, rng: random.Random) -> Dict:
+    end_time = datetime.now()
+    outcome = rng.random()
+    return {
+        'matchId': str(uuid.uuid4()),
+        'game': game,
+        'player1Id': player1_id,
+        'player2Id': player2_id,
+        'startTime': (end_time - timedelta(minutes=rng.randint(5, 40))).strftime("%Y-%m-%dT%H:%M:%S"),
+        'endTime': end_time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'player1MoveCounts': rng.randint(10, 70),
+        'player2MoveCounts': rng.randint(10, 70),
+        'winnerId': player1_id if outcome < 0.45 else player2_id if outcome < 0.9 else None,
+    }
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+
+    return {
+        'count': len(ordered),
+        'p50_ms': pick(0.50),
+        'p90_ms': pick(0.90),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+        'max_ms': round(ordered[-1] * 1000, 1),
+    }
+
+
+class LatencyTracker:
+    """Publish times of events not yet visible in the database, shared by publishers and the poller"""
+
+    def __init__(self, player_ids: List[str]):
+        self.lock = threading.Lock()
+        self.pending_matches: Dict[str, List[float]] = {player_id: [] for player_id in player_ids}
+        self.seen_games: Dict[str, int] = {player_id: 0 for player_id in player_ids}
+        self.pending_signups: Dict[str, float] = {}
+        self.latencies: Dict[str, List[float]] = {'game.over': [], 'user.signup': []}
+        self.visible_at: List[float] = []
+
+    def match_published(self, player1_id: str, player2_id: str, sent_at: float) -> None:
+        with self.lock:
+            heapq.heappush(self.pending_matches[player1_id], sent_at)
+            heapq.heappush(self.pending_matches[player2_id], sent_at)
+
+    def signup_published(self, player_id: str, sent_at: float) -> None:
+        with self.lock:
+            self.pending_signups[player_id] = sent_at
+
+    def pending(self) -> int:
+        with self.lock:
+            return sum(len(times) for times in self.pending_matches.values()) + len(self.pending_signups)
+
+    def poll(self, cursor, game_id: bytes) -> None:
+        with self.lock:
+            player_ids = list(self.pending_matches)
+            signups = list(self.pending_signups)
+
+        if player_ids:
+            placeholders = ', '.join(['UUID_TO_BIN(%s)'] * len(player_ids))
+            cursor.execute(
+                "SELECT BIN_TO_UUID(player_id), total_games_played FROM player_game_stats "
+                f"WHERE game_id = %s AND player_id IN ({placeholders})",
+                [game_id] + player_ids
+            )
+            rows = cursor.fetchall()
+            now = time.perf_counter()
+            with self.lock:
+                for player_id, total_games in rows:
+                    new_games = total_games - self.seen_games[player_id]
+                    pending = self.pending_matches[player_id]
+                    # Both players' rows change in the same transaction, so every match yields
+                    # two equally valid samples; match counts are halved in the report
+                    for _ in range(min(new_games, len(pending))):
+                        self.latencies['game.over'].append(now - heapq.heappop(pending))
+                        self.visible_at.append(now)
+                    self.seen_games[player_id] = total_games
+
+        if signups:
+            placeholders = ', '.join(['UUID_TO_BIN(%s)'] * len(signups))
+            cursor.execute(f"SELECT BIN_TO_UUID(player_id) FROM players WHERE player_id IN ({placeholders})",
+                           signups)
+            now = time.perf_counter()
+            with self.lock:
+                for (player_id,) in cursor.fetchall():
+                    sent_at = self.pending_signups.pop(player_id, None)
+                    if sent_at is not None:
+                        self.latencies['user.signup'].append(now - sent_at)
+
+
+class Publisher(threading.Thread):
+    """One connection with publisher confirms, paced to its share of the target rate"""
+
+    def __init__(self, index: int, config: LoadConfig, player_ids: List[str], tracker: LatencyTracker,
+                 stop_at: float):
+        super().__init__(name=f"publisher-{index}", daemon=True)
+        self.config = config
+        self.player_ids = player_ids
+        self.tracker = tracker
+        self.stop_at = stop_at
+        self.interval = config.connections / config.rate
+        self.rng = random.Random(config.seed * 1000 + index)
+        self.published = {'game.over': 0, 'user.signup': 0}
+        self.failed = 0
+        self.max_lag = 0.0
+
+    def run(self):
+        connection = pika.BlockingConnection(get_rabbitmq_parameters())
+        channel = connection.channel()
+        channel.confirm_delivery()
+        properties = pika.BasicProperties(delivery_mode=2, content_type='application/json')
+        next_send = time.perf_counter()
+
+        try:
+            while next_send < self.stop_at:
+                now = time.perf_counter()
+                if now < next_send:
+                    time.sleep(next_send - now)
+                else:
+                    # Open-loop schedule: fall behind instead of silently lowering the rate
+                    self.max_lag = max(self.max_lag, now - next_send)
+
+                if self.rng.random() < self.config.signup_ratio:
+                    routing_key, exchange = 'user.signup', SIGNUP_EXCHANGE
+                    player_id = str(uuid.uuid4())
+                    body = signup_event(player_id, self.rng)
+                else:
+                    routing_key, exchange = 'game.over', GAME_EXCHANGE
+                    player1_id, player2_id = self.rng.sample(self.player_ids, 2)
+                    body = game_event(self.config.game, player1_id, player2_id, self.rng)
+
+                # Registered before publishing: the consumer may store the row before the confirm arrives
+                sent_at = time.perf_counter()
+                if routing_key == 'user.signup':
+                    self.tracker.signup_published(player_id, sent_at)
+                else:
+                    self.tracker.match_published(player1_id, player2_id, sent_at)
+                try:
+                    channel.basic_publish(exchange=exchange, routing_key=routing_key,
+                                          body=json.dumps(body), properties=properties, mandatory=True)
+                    self.published[routing_key] += 1
+                except (pika.exceptions.NackError, pika.exceptions.UnroutableError) as e:
+                    # Left pending, so it shows up in not_visible_after_drain
+                    self.failed += 1
+                    logger.warning(f"{self.name}: {routing_key} not confirmed: {e}")
+                next_send += self.interval
+        finally:
+            connection.close()
+
+
+def publish_signups(player_ids: List[str], seed: int) -> None:
+    rng = random.Random(seed)
+    connection = pika.BlockingConnection(get_rabbitmq_parameters())
+    try:
+        channel = connection.channel()
+        channel.confirm_delivery()
+        for player_id in player_ids:
+            channel.basic_publish(exchange=SIGNUP_EXCHANGE, routing_key='user.signup',
+                                  body=json.dumps(signup_event(player_id, rng)),
+                                  properties=pika.BasicProperties(delivery_mode=2), mandatory=True)
+    finally:
+        connection.close()
+
+
+def create_players(cursor, config: LoadConfig) -> List[str]:
+    """Sign up the players used in matches and wait until the consumer has stored them"""
+    player_ids = [str(uuid.uuid4()) for _ in range(config.players)]
+    publish_signups(player_ids, config.seed)
+
+    placeholders = ', '.join(['UUID_TO_BIN(%s)'] * len(player_ids))
+    deadline = time.perf_counter() + config.drain_timeout
+    while time.perf_counter() < deadline:
+        cursor.execute(f"SELECT COUNT(*) FROM players WHERE player_id IN ({placeholders})", player_ids)
+        stored = cursor.fetchone()[0]
+        if stored == len(player_ids):
+            logger.info(f"{stored} load test players signed up")
+            return player_ids
+        time.sleep(0.5)
+    raise RuntimeError(f"Only {stored} of {len(player_ids)} players were stored; is the consumer running?")
+
+
+def run(config: LoadConfig) -> Dict:
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT game_id FROM games WHERE name = %s", (config.game,))
+        row = cursor.fetchone()
+        if row is None:
+            raise RuntimeError(f"Game {config.game} not found")
+        game_id = row[0]
+
+        player_ids = create_players(cursor, config)
+        tracker = LatencyTracker(player_ids)
+
+        start = time.perf_counter()
+        stop_at = start + config.duration
+        publishers = [Publisher(i, config, player_ids, tracker, stop_at) for i in range(config.connections)]
+        for publisher in publishers:
+            publisher.start()
+
+        logger.info(f"Publishing {config.rate:.0f} events/s over {config.connections} connections "
+                    f"for {config.duration:.0f}s")
+        while any(publisher.is_alive() for publisher in publishers):
+            tracker.poll(cursor, game_id)
+            time.sleep(config.poll_interval)
+        publish_seconds = time.perf_counter() - start
+
+        # Drain: keep polling until everything published is visible or the timeout passes
+        deadline = time.perf_counter() + config.drain_timeout
+        while tracker.pending() and time.perf_counter() < deadline:
+            tracker.poll(cursor, game_id)
+            time.sleep(config.poll_interval)
+    finally:
+        cursor.close()
+        conn.close()
+
+    published = {key: sum(publisher.published[key] for publisher in publishers) for key in ('game.over', 'user.signup')}
+    matches_visible = len(tracker.latencies['game.over']) // 2
+    visible_at = sorted(tracker.visible_at)
+    consume_seconds = (visible_at[-1] - start) if visible_at else 0.0
+
+    return {
+        'config': config.__dict__,
+        'published': published,
+        'publish_failures': sum(publisher.failed for publisher in publishers),
+        'publish_rate': round(sum(published.values()) / publish_seconds, 1),
+        'max_schedule_lag_ms': round(max(publisher.max_lag for publisher in publishers) * 1000, 1),
+        'visible': {'game.over': matches_visible, 'user.signup': len(tracker.latencies['user.signup'])},
+        'not_visible_after_drain': tracker.pending(),
+        'latency': {key: percentiles(values) for key, values in tracker.latencies.items()},
+        # Matches that reached player_game_stats per second, from the first publish to the last one visible
+        'consumer_throughput': round(matches_visible / consume_seconds, 1) if consume_seconds else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the game.over / user.signup ingestion path")
+    parser.add_argument("--rate", type=float, default=200.0, help="Target events per second")
+    parser.add_argument("--duration", type=float, default=60.0, help="Publishing time in seconds")
+    parser.add_argument("--connections", type=int, default=4, help="Publisher connections")
+    parser.add_argument("--players", type=int, default=200, help="Players signed up for the matches")
+    parser.add_argument("--signup-ratio", type=float, default=0.0, help="Share of events that are user.signup")
+    parser.add_argument("--game", default='battleship', help="Game name used in game.over events")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="Database poll interval in seconds")
+    parser.add_argument("--drain-timeout", type=float, default=120.0,
+                        help="Seconds to wait for published events to become visible")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    config = LoadConfig(rate=args.rate, duration=args.duration, connections=args.connections,
+                        players=args.players, signup_ratio=args.signup_ratio, game=args.game,
+                        poll_interval=args.poll_interval, drain_timeout=args.drain_timeout, seed=args.seed)
+    report = run(config)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
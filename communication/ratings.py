@@ -0,0 +1,273 @@
+"""
+Glicko rating engine for player_skill_ratings, one row per player and game.
+
+Every match updates both players in O(1) from their previous rating r and
+rating deviation RD (Glicko-1 with one game per rating period). RD shrinks as
+a player plays and grows back towards 350 while they are inactive, so the
+ratings of returning players move faster again. A expects to beat B with
+probability
+
+    1 / (1 + 10 ** (-g(sqrt(RD_A² + RD_B²)) * (r_A - r_B) / 400))
+
+player_ratings keeps its 1-5 scale, now derived from the rating by stars().
+
+The analytics consumer applies matches as they arrive. After bulk loads or
+corrections to match_history, replay everything in time order:
+
+    python ratings.py --rebuild
+
+The consumer can keep running. The rebuild holds the MySQL named lock
+RATINGS_LOCK until it commits, and update_skill_ratings waits for that lock
+to be free before it touches a rating. If it is not free within
+RATINGS_LOCK_TIMEOUT_SECONDS, update_skill_ratings raises and the consumer
+retries the match later. Updates that started before the rebuild took the
+lock are finished first, so the replay includes their matches.
+"""
+import argparse
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INITIAL_RATING = 1500.0
+INITIAL_DEVIATION = 350.0
+MIN_DEVIATION = float(os.getenv('GLICKO_MIN_DEVIATION', '30'))
+# Glicko's c: RD² grows by c² per idle day, so a settled RD of 50 is back at 350 after about 180 days
+DEVIATION_GROWTH = float(os.getenv('GLICKO_DEVIATION_GROWTH', '25.8'))
+REBUILD_BATCH_SIZE = 10000
+RATINGS_LOCK = 'player_skill_ratings'
+RATINGS_LOCK_TIMEOUT_SECONDS = int(os.getenv('RATINGS_LOCK_TIMEOUT_SECONDS', '10'))
+REBUILD_LOCK_TIMEOUT_SECONDS = 60
+
+Q = np.log(10) / 400
+
+
+def _g(deviation):
+    return 1.0 / np.sqrt(1.0 + 3.0 * Q ** 2 * deviation ** 2 / np.pi ** 2)
+
+
+def inflate_deviation(deviation, idle_days):
+    return np.minimum(np.sqrt(deviation ** 2 + DEVIATION_GROWTH ** 2 * idle_days), INITIAL_DEVIATION)
+
+
+def expected_score(rating, deviation, opponent_rating, opponent_deviation):
+    """Probability of beating the opponent, accounting for both ratings' uncertainty"""
+    combined = np.sqrt(deviation ** 2 + opponent_deviation ** 2)
+    return 1.0 / (1.0 + np.power(10.0, -_g(combined) * (rating - opponent_rating) / 400.0))
+
+
+def glicko_update(rating, deviation, opponent_rating, opponent_deviation, score):
+    """New (rating, deviation) after one game scored 1 (win), 0.5 (draw) or 0; element-wise on arrays"""
+    g = _g(opponent_deviation)
+    expected = 1.0 / (1.0 + np.power(10.0, -g * (rating - opponent_rating) / 400.0))
+    precision = 1.0 / deviation ** 2 + Q ** 2 * g ** 2 * expected * (1.0 - expected)
+    new_rating = rating + Q / precision * g * (score - expected)
+    new_deviation = np.maximum(np.sqrt(1.0 / precision), MIN_DEVIATION)
+    return new_rating, new_deviation
+
+
+def stars(rating):
+    """player_ratings 1-5 scale: 3 around the initial 1500, one star per 150 points"""
+    return np.clip(np.floor((np.asarray(rating) - 1350.0) / 150.0) + 2, 1, 5).astype(int)
+
+
+def _score(player1_id, winner_id) -> float:
+    return 0.5 if not winner_id else 1.0 if winner_id == player1_id else 0.0
+
+
+def update_skill_ratings(cursor, game_id: bytes, player1_id: str, player2_id: str, winner_id,
+                         played_at: datetime) -> None:
+    """Apply one match to player_skill_ratings and player_ratings, inside the caller's transaction"""
+    # A running rebuild would overwrite this update, see rebuild_skill_ratings
+    cursor.execute("SELECT IS_FREE_LOCK(%s)", (RATINGS_LOCK,))
+    if not cursor.fetchone()[0]:
+        logger.info("Waiting for the player_skill_ratings rebuild...")
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (RATINGS_LOCK, RATINGS_LOCK_TIMEOUT_SECONDS))
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError(f"player_skill_ratings rebuild still running after {RATINGS_LOCK_TIMEOUT_SECONDS}s")
+        cursor.execute("DO RELEASE_LOCK(%s)", (RATINGS_LOCK,))
+
+    # Locks both rows so concurrent consumers apply matches of the same players one after another
+    cursor.execute("""
+        SELECT BIN_TO_UUID(player_id), rating, rating_deviation, last_played FROM player_skill_ratings
+        WHERE game_id = %s AND player_id IN (UUID_TO_BIN(%s), UUID_TO_BIN(%s))
+        FOR UPDATE
+    """, (game_id, player1_id, player2_id))
+    current = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    def state(player_id: str) -> Tuple[float, float]:
+        rating, deviation, last_played = current.get(player_id, (INITIAL_RATING, INITIAL_DEVIATION, None))
+        if last_played is not None:
+            idle_days = max(0.0, (played_at - last_played).total_seconds() / 86400)
+            deviation = float(inflate_deviation(deviation, idle_days))
+        return rating, deviation
+
+    rating1, deviation1 = state(player1_id)
+    rating2, deviation2 = state(player2_id)
+    score1 = _score(player1_id, winner_id)
+    new1 = glicko_update(rating1, deviation1, rating2, deviation2, score1)
+    new2 = glicko_update(rating2, deviation2, rating1, deviation1, 1.0 - score1)
+
+    rows = [(player_id, game_id, float(rating), float(deviation), played_at)
+            for player_id, (rating, deviation) in ((player1_id, new1), (player2_id, new2))]
+    cursor.executemany("""
+        INSERT INTO player_skill_ratings (player_id, game_id, rating, rating_deviation, matches_played, last_played)
+        VALUES (UUID_TO_BIN(%s), %s, %s, %s, 1, %s)
+        ON DUPLICATE KEY UPDATE
+            rating = VALUES(rating),
+            rating_deviation = VALUES(rating_deviation),
+            matches_played = matches_played + 1,
+            last_played = GREATEST(COALESCE(last_played, VALUES(last_played)), VALUES(last_played))
+    """, rows)
+    cursor.executemany("""
+        INSERT INTO player_ratings (rating_id, player_id, game_id, rating, rating_date)
+        VALUES (UUID_TO_BIN(UUID()), UUID_TO_BIN(%s), %s, %s, CURRENT_TIMESTAMP)
+    """, [(player_id, game_id, int(stars(rating))) for player_id, game_id, rating, _, _ in rows])
+
+
+def replay_matches(player1: Sequence, player2: Sequence, winner: Sequence, game: Sequence,
+                   days: np.ndarray) -> Dict[str, object]:
+    """
+    Ratings after applying every match in order (days ascending), vectorized.
+
+    A match's wave is one more than the latest wave of either of its (player,
+    game) slots, so every slot sees its own matches in time order and appears
+    at most once per wave. Each wave is then one array update, and the result
+    equals a match-by-match replay.
+    """
+    slots: Dict[Tuple, int] = {}
+    slot1 = np.array([slots.setdefault((p, g), len(slots)) for p, g in zip(player1, game)], dtype=np.int64)
+    slot2 = np.array([slots.setdefault((p, g), len(slots)) for p, g in zip(player2, game)], dtype=np.int64)
+    score1 = np.array([_score(p, w) for p, w in zip(player1, winner)], dtype=float)
+
+    last_wave = [-1] * len(slots)
+    waves = np.empty(len(slot1), dtype=np.int64)
+    for i, (a, b) in enumerate(zip(slot1.tolist(), slot2.tolist())):
+        wave = max(last_wave[a], last_wave[b]) + 1
+        waves[i] = last_wave[a] = last_wave[b] = wave
+
+    rating = np.full(len(slots), INITIAL_RATING)
+    deviation = np.full(len(slots), INITIAL_DEVIATION)
+    last_day = np.full(len(slots), np.nan)
+    last_match = np.full(len(slots), -1, dtype=np.int64)
+    matches_played = np.zeros(len(slots), dtype=np.int64)
+
+    order = np.argsort(waves, kind='stable')
+    bounds = np.searchsorted(waves[order], np.arange(waves.max() + 2 if len(waves) else 1))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        idx = order[start:end]
+        a, b, t = slot1[idx], slot2[idx], days[idx]
+        deviation_a = inflate_deviation(deviation[a], np.nan_to_num(np.maximum(t - last_day[a], 0)))
+        deviation_b = inflate_deviation(deviation[b], np.nan_to_num(np.maximum(t - last_day[b], 0)))
+        rating_a, rating_b = rating[a], rating[b]
+
+        rating[a], deviation[a] = glicko_update(rating_a, deviation_a, rating_b, deviation_b, score1[idx])
+        rating[b], deviation[b] = glicko_update(rating_b, deviation_b, rating_a, deviation_a, 1.0 - score1[idx])
+        last_day[a] = last_day[b] = t
+        last_match[a] = last_match[b] = idx
+        matches_played[a] += 1
+        matches_played[b] += 1
+
+    return {
+        'slots': list(slots),
+        'rating': rating,
+        'deviation': deviation,
+        'matches_played': matches_played,
+        'last_match': last_match,
+    }
+
+
+def rebuild_skill_ratings(conn) -> int:
+    """
+    Replace player_skill_ratings with a replay of match_history and record the
+    new player_ratings. Commits the connection's pending work first.
+    """
+    conn.commit()
+    cursor = conn.cursor()
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (RATINGS_LOCK, REBUILD_LOCK_TIMEOUT_SECONDS))
+    if cursor.fetchone()[0] != 1:
+        cursor.close()
+        raise RuntimeError("Another player_skill_ratings rebuild is running")
+    try:
+        return _rebuild_skill_ratings(conn, cursor)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.execute("DO RELEASE_LOCK(%s)", (RATINGS_LOCK,))
+        cursor.close()
+
+
+def _rebuild_skill_ratings(conn, cursor) -> int:
+    # Updates that checked the lock before it was taken hold their rows until they
+    # commit; locking every row waits for them and blocks new rows until the rebuild
+    # commits. Only the SELECT below takes the transaction's snapshot, so it sees
+    # their matches.
+    cursor.execute("SELECT COUNT(*) FROM player_skill_ratings FOR UPDATE")
+    cursor.fetchall()
+
+    cursor.execute("""
+        SELECT player1_id, player2_id, winner_id, game_id, end_time
+        FROM match_history
+        WHERE player1_id <> player2_id
+        ORDER BY end_time, match_id
+    """)
+    matches = cursor.fetchall()
+    logger.info(f"Replaying {len(matches)} matches...")
+
+    player1 = [bytes(row[0]) for row in matches]
+    player2 = [bytes(row[1]) for row in matches]
+    winner = [bytes(row[2]) if row[2] is not None else None for row in matches]
+    game = [bytes(row[3]) for row in matches]
+    days = np.array([row[4].timestamp() / 86400 for row in matches], dtype=float)
+    result = replay_matches(player1, player2, winner, game, days)
+
+    ratings_rows = [
+        (player_id, game_id, float(rating), float(deviation), int(played), matches[last][4])
+        for (player_id, game_id), rating, deviation, played, last in zip(
+            result['slots'], result['rating'], result['deviation'],
+            result['matches_played'], result['last_match'])
+    ]
+    star_rows = [(player_id, game_id, int(star))
+                 for (player_id, game_id), star in zip(result['slots'], stars(result['rating']))]
+
+    cursor.execute("DELETE FROM player_skill_ratings")
+    for start in range(0, len(ratings_rows), REBUILD_BATCH_SIZE):
+        cursor.executemany("""
+            INSERT INTO player_skill_ratings
+                (player_id, game_id, rating, rating_deviation, matches_played, last_played)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, ratings_rows[start:start + REBUILD_BATCH_SIZE])
+        cursor.executemany("""
+            INSERT INTO player_ratings (rating_id, player_id, game_id, rating, rating_date)
+            VALUES (UUID_TO_BIN(UUID()), %s, %s, %s, CURRENT_TIMESTAMP)
+        """, star_rows[start:start + REBUILD_BATCH_SIZE])
+    conn.commit()
+    logger.info(f"Rebuilt {len(ratings_rows)} player ratings")
+    return len(ratings_rows)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Glicko player ratings")
+    parser.add_argument("--rebuild", action="store_true", help="Replay match_history into player_skill_ratings")
+    args = parser.parse_args(argv)
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    # Imported here: analytics_consumer imports this module
+    from analytics_consumer import DBConfig, DatabaseConnection
+
+    conn = DatabaseConnection(DBConfig(pool_size=1)).get_connection()
+    try:
+        rebuild_skill_ratings(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,9 @@
 -- Drop existing tables in correct order
+DROP TABLE IF EXISTS battleship_player_stats;
+DROP TABLE IF EXISTS battleship_match_metrics;
+DROP TABLE IF EXISTS stats_cache_versions;
+DROP TABLE IF EXISTS player_skill_ratings;
+DROP TABLE IF EXISTS player_game_stats_view;
 DROP TABLE IF EXISTS player_ratings;
 DROP TABLE IF EXISTS match_moves;
 DROP TABLE IF EXISTS match_history;
@@ -29,6 +34,7 @@ CREATE TABLE players (
     birthdate DATE NOT NULL,
     gender ENUM('Male', 'Female', 'Non-Binary') NOT NULL,
     country VARCHAR(100) NOT NULL,
+    full_name VARCHAR(101) GENERATED ALWAYS AS (CONCAT(firstname, ' ', lastname)) STORED,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -66,7 +72,9 @@ CREATE TABLE match_moves (
     player_id BINARY(16) NOT NULL,
     moves_count INT NOT NULL,
     FOREIGN KEY (match_id) REFERENCES match_history(match_id),
-    FOREIGN KEY (player_id) REFERENCES players(player_id)
+    FOREIGN KEY (player_id) REFERENCES players(player_id),
+    -- One row per player and match, so redelivered events cannot double count moves
+    UNIQUE KEY uq_match_moves_match_player (match_id, player_id)
 );
 
 -- Player game statistics table (normalized statistics)
@@ -109,6 +117,98 @@ CREATE TABLE player_ratings (
     FOREIGN KEY (game_id) REFERENCES games(game_id)
 );
 
+-- Glicko skill per player and game (updated by the analytics consumer on every match,
+-- read by the match-up win probability endpoint)
+CREATE TABLE player_skill_ratings (
+    player_id BINARY(16) NOT NULL,
+    game_id BINARY(16) NOT NULL,
+    rating DOUBLE NOT NULL DEFAULT 1500,
+    rating_deviation DOUBLE NOT NULL DEFAULT 350,      -- uncertainty, grows while the player is inactive
+    matches_played INT UNSIGNED NOT NULL DEFAULT 0,
+    last_played DATETIME NULL,                         -- end_time of the last rated match
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (player_id, game_id),
+    FOREIGN KEY (player_id) REFERENCES players(player_id) ON DELETE CASCADE,
+    FOREIGN KEY (game_id) REFERENCES games(game_id) ON DELETE CASCADE
+);
+
+-- Derived metrics of each Battleship match.completed event, written in batches by
+-- MQConfig/BattleshipMatchSubscriber.py. Player ids are not foreign keys: the
+-- event stream does not wait for user.signup.
+CREATE TABLE battleship_match_metrics (
+    match_id BINARY(16) PRIMARY KEY,
+    game_id BINARY(16) NOT NULL,
+    player1_id BINARY(16) NOT NULL,
+    player2_id BINARY(16) NOT NULL,
+    winner_id BINARY(16) NOT NULL,
+    start_time DATETIME NOT NULL,
+    end_time DATETIME NOT NULL,
+    duration_seconds DOUBLE NOT NULL,
+    player1_moves INT NOT NULL,
+    player2_moves INT NOT NULL,
+    winner_moves_per_ship DOUBLE NOT NULL,                  -- winner's moves / 5 ships
+    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_battleship_metrics_end_time (end_time)
+);
+
+-- Running per-player Battleship aggregates, incremented with every batch of new
+-- battleship_match_metrics rows
+CREATE TABLE battleship_player_stats (
+    player_id BINARY(16) PRIMARY KEY,
+    matches_played INT NOT NULL DEFAULT 0,
+    wins INT NOT NULL DEFAULT 0,
+    duration_seconds_sum DOUBLE NOT NULL DEFAULT 0,
+    moves_per_ship_sum DOUBLE NOT NULL DEFAULT 0,           -- over the matches won
+    avg_duration_seconds DOUBLE GENERATED ALWAYS AS (
+        duration_seconds_sum / NULLIF(matches_played, 0)
+    ) STORED,
+    avg_moves_per_ship DOUBLE GENERATED ALWAYS AS (
+        moves_per_ship_sum / NULLIF(wins, 0)
+    ) STORED,
+    last_match_at DATETIME,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Denormalized read model for the Statistics API (maintained by the analytics consumer)
+CREATE TABLE player_game_stats_view (
+    player_id BINARY(16) NOT NULL,
+    game_id BINARY(16) NOT NULL,
+    -- Case-insensitive, so the API's searches need no LOWER() and its prefix searches can use the indexes
+    player_name VARCHAR(101) NOT NULL COLLATE utf8mb4_0900_ai_ci,
+    game_name VARCHAR(50) NOT NULL COLLATE utf8mb4_0900_ai_ci,
+    total_games_played INT NOT NULL DEFAULT 0,
+    total_wins INT NOT NULL DEFAULT 0,
+    total_losses INT NOT NULL DEFAULT 0,
+    total_moves INT NOT NULL DEFAULT 0,
+    total_time_played_minutes INT NOT NULL DEFAULT 0,
+    win_ratio DECIMAL(5,2) NOT NULL DEFAULT 0.00,
+    last_played TIMESTAMP NULL,
+    birthdate DATE NOT NULL,
+    age TINYINT UNSIGNED NOT NULL,                     -- Refreshed daily by refresh_player_game_stats_ages
+    age_bucket VARCHAR(8) GENERATED ALWAYS AS (
+        CASE
+            WHEN age < 18 THEN 'under_18'
+            WHEN age < 25 THEN '18_24'
+            WHEN age < 35 THEN '25_34'
+            WHEN age < 45 THEN '35_44'
+            WHEN age < 55 THEN '45_54'
+            ELSE '55_plus'
+        END
+    ) STORED,
+    gender ENUM('Male', 'Female', 'Non-Binary') NOT NULL,
+    country VARCHAR(100) NOT NULL,
+    PRIMARY KEY (player_id, game_id),
+    FOREIGN KEY (player_id) REFERENCES players(player_id) ON DELETE CASCADE,
+    FOREIGN KEY (game_id) REFERENCES games(game_id) ON DELETE CASCADE
+);
+
+-- Statistics API cache versions (bumped by the analytics consumer on every committed match)
+CREATE TABLE stats_cache_versions (
+    scope VARCHAR(100) PRIMARY KEY,                    -- 'global', 'roster', 'game:<lowercase game name>' or 'player:<player uuid>'
+    version BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
 -- Create indexes for common queries
 CREATE INDEX idx_match_history_game ON match_history(game_id);
 CREATE INDEX idx_match_history_players ON match_history(player1_id, player2_id);
@@ -116,5 +216,11 @@ CREATE INDEX idx_match_history_winner ON match_history(winner_id);
 CREATE INDEX idx_match_moves_match ON match_moves(match_id);
 CREATE INDEX idx_player_game_stats_player ON player_game_stats(player_id);
 CREATE INDEX idx_player_ratings_player_game ON player_ratings(player_id, game_id);
+CREATE INDEX idx_players_full_name ON players(full_name);
+-- Read model indexes matching the Statistics API filters and orderings
+CREATE INDEX idx_pgs_view_last_played ON player_game_stats_view(last_played);
+CREATE INDEX idx_pgs_view_game_top ON player_game_stats_view(game_name, total_games_played, win_ratio);
+CREATE INDEX idx_pgs_view_player_name ON player_game_stats_view(player_name);
+CREATE INDEX idx_pgs_view_age_bucket ON player_game_stats_view(age_bucket, gender, country);
 -- Simple index for ML-related queries
 CREATE INDEX idx_player_game_stats_ml ON player_game_stats(is_churned, engagement_level, player_level);
\ No newline at end of file
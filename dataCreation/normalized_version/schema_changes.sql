@@ -78,4 +78,148 @@ ALTER TABLE player_ratings
         FOREIGN KEY (game_id)
         REFERENCES games (game_id)
         ON DELETE CASCADE
-        ON UPDATE CASCADE;
\ No newline at end of file
+        ON UPDATE CASCADE;
+
+-- Statistics API cache versions (bumped by the analytics consumer on every committed match)
+CREATE TABLE IF NOT EXISTS stats_cache_versions (
+    scope VARCHAR(100) PRIMARY KEY,                    -- 'global', 'roster', 'game:<lowercase game name>' or 'player:<player uuid>'
+    version BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Statistics API read model: stored full name on players plus a denormalized
+-- player_game_stats_view table (run triggers.sql first for the procedures)
+ALTER TABLE players
+    ADD COLUMN full_name VARCHAR(101) GENERATED ALWAYS AS (CONCAT(firstname, ' ', lastname)) STORED,
+    ADD INDEX idx_players_full_name (full_name);
+
+CREATE TABLE IF NOT EXISTS player_game_stats_view (
+    player_id BINARY(16) NOT NULL,
+    game_id BINARY(16) NOT NULL,
+    -- Case-insensitive, so the API's searches need no LOWER() and its prefix searches can use the indexes
+    player_name VARCHAR(101) NOT NULL COLLATE utf8mb4_0900_ai_ci,
+    game_name VARCHAR(50) NOT NULL COLLATE utf8mb4_0900_ai_ci,
+    total_games_played INT NOT NULL DEFAULT 0,
+    total_wins INT NOT NULL DEFAULT 0,
+    total_losses INT NOT NULL DEFAULT 0,
+    total_moves INT NOT NULL DEFAULT 0,
+    total_time_played_minutes INT NOT NULL DEFAULT 0,
+    win_ratio DECIMAL(5,2) NOT NULL DEFAULT 0.00,
+    last_played TIMESTAMP NULL,
+    birthdate DATE NOT NULL,
+    age TINYINT UNSIGNED NOT NULL,
+    age_bucket VARCHAR(8) GENERATED ALWAYS AS (
+        CASE
+            WHEN age < 18 THEN 'under_18'
+            WHEN age < 25 THEN '18_24'
+            WHEN age < 35 THEN '25_34'
+            WHEN age < 45 THEN '35_44'
+            WHEN age < 55 THEN '45_54'
+            ELSE '55_plus'
+        END
+    ) STORED,
+    gender ENUM('Male', 'Female', 'Non-Binary') NOT NULL,
+    country VARCHAR(100) NOT NULL,
+    PRIMARY KEY (player_id, game_id),
+    INDEX idx_pgs_view_last_played (last_played),
+    INDEX idx_pgs_view_game_top (game_name, total_games_played, win_ratio),
+    INDEX idx_pgs_view_player_name (player_name),
+    INDEX idx_pgs_view_age_bucket (age_bucket, gender, country),
+    CONSTRAINT player_game_stats_view_player_fk
+        FOREIGN KEY (player_id) REFERENCES players (player_id) ON DELETE CASCADE,
+    CONSTRAINT player_game_stats_view_game_fk
+        FOREIGN KEY (game_id) REFERENCES games (game_id) ON DELETE CASCADE
+);
+
+CALL rebuild_player_game_stats_view();
+-- Bulk backfill support: the match_history triggers skip their per-row stats
+-- recompute while @suspend_stats_triggers is set in the loading session, and
+-- rebuild_player_game_stats() recomputes everything afterwards. Drop and
+-- recreate the three match_history triggers and create the procedure from
+-- triggers.sql to apply this to an existing database.
+
+-- Idempotent match ingestion: one match_moves row per (match, player).
+-- Remove duplicates left by earlier redeliveries before adding the key.
+DELETE mm1 FROM match_moves mm1
+JOIN match_moves mm2
+    ON mm1.match_id = mm2.match_id
+    AND mm1.player_id = mm2.player_id
+    AND mm1.move_id > mm2.move_id;
+
+ALTER TABLE match_moves
+    ADD UNIQUE KEY uq_match_moves_match_player (match_id, player_id);
+
+-- Elo skill ratings for match-up win probabilities, maintained by the
+-- analytics consumer from each game.over event
+CREATE TABLE IF NOT EXISTS player_skill_ratings (
+    player_id BINARY(16) NOT NULL,
+    game_id BINARY(16) NOT NULL,
+    rating DOUBLE NOT NULL DEFAULT 1500,
+    matches_played INT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (player_id, game_id),
+    CONSTRAINT player_skill_ratings_player_fk
+        FOREIGN KEY (player_id) REFERENCES players (player_id) ON DELETE CASCADE,
+    CONSTRAINT player_skill_ratings_game_fk
+        FOREIGN KEY (game_id) REFERENCES games (game_id) ON DELETE CASCADE
+);
+
+-- Glicko rating engine: player_skill_ratings gains a rating deviation and the
+-- time of the last rated match, and player_ratings is now written by
+-- communication/ratings.py instead of update_player_game_stats. Recreate
+-- update_player_game_stats and rebuild_player_game_stats from triggers.sql,
+-- then rebuild every rating from match_history:
+--     python communication/ratings.py --rebuild
+ALTER TABLE player_skill_ratings
+    ADD COLUMN rating_deviation DOUBLE NOT NULL DEFAULT 350 AFTER rating,
+    ADD COLUMN last_played DATETIME NULL AFTER matches_played;
+
+-- Derived metrics of each Battleship match.completed event, written in batches by
+-- MQConfig/BattleshipMatchSubscriber.py. Player ids are not foreign keys: the
+-- event stream does not wait for user.signup.
+CREATE TABLE IF NOT EXISTS battleship_match_metrics (
+    match_id BINARY(16) PRIMARY KEY,
+    game_id BINARY(16) NOT NULL,
+    player1_id BINARY(16) NOT NULL,
+    player2_id BINARY(16) NOT NULL,
+    winner_id BINARY(16) NOT NULL,
+    start_time DATETIME NOT NULL,
+    end_time DATETIME NOT NULL,
+    duration_seconds DOUBLE NOT NULL,
+    player1_moves INT NOT NULL,
+    player2_moves INT NOT NULL,
+    winner_moves_per_ship DOUBLE NOT NULL,                  -- winner's moves / 5 ships
+    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_battleship_metrics_end_time (end_time)
+);
+
+-- Running per-player Battleship aggregates, incremented with every batch of new
+-- battleship_match_metrics rows
+CREATE TABLE IF NOT EXISTS battleship_player_stats (
+    player_id BINARY(16) PRIMARY KEY,
+    matches_played INT NOT NULL DEFAULT 0,
+    wins INT NOT NULL DEFAULT 0,
+    duration_seconds_sum DOUBLE NOT NULL DEFAULT 0,
+    moves_per_ship_sum DOUBLE NOT NULL DEFAULT 0,           -- over the matches won
+    avg_duration_seconds DOUBLE GENERATED ALWAYS AS (
+        duration_seconds_sum / NULLIF(matches_played, 0)
+    ) STORED,
+    avg_moves_per_ship DOUBLE GENERATED ALWAYS AS (
+        moves_per_ship_sum / NULLIF(wins, 0)
+    ) STORED,
+    last_match_at DATETIME,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- The read model follows every match_history change, including the update and
+-- delete triggers: update_player_game_stats now ends with
+-- refresh_player_game_stats_view, so recreate it from triggers.sql. The
+-- Statistics API matches names case-insensitively through the column collation
+-- instead of LOWER(...), so its opt-in prefix searches can use the indexes.
+ALTER TABLE player_game_stats_view
+    MODIFY player_name VARCHAR(101) NOT NULL COLLATE utf8mb4_0900_ai_ci,
+    MODIFY game_name VARCHAR(50) NOT NULL COLLATE utf8mb4_0900_ai_ci;
+
+-- Name searches in the Statistics API cache depend on the player:<uuid> scopes
+-- bumped by the analytics consumer and on the roster scope bumped by
+-- refresh_player_game_stats_view; recreate it from triggers.sql.
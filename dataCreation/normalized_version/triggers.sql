@@ -5,9 +5,13 @@ CREATE TRIGGER match_history_after_insert
 AFTER INSERT ON match_history
 FOR EACH ROW
 BEGIN
-    -- Update player game stats for both players
-    CALL update_player_game_stats(NEW.player1_id, NEW.game_id);
-    CALL update_player_game_stats(NEW.player2_id, NEW.game_id);
+    -- Bulk backfills set @suspend_stats_triggers in their session and rebuild
+    -- the stats once afterwards with rebuild_player_game_stats()
+    IF @suspend_stats_triggers IS NULL THEN
+        -- Update player game stats for both players
+        CALL update_player_game_stats(NEW.player1_id, NEW.game_id);
+        CALL update_player_game_stats(NEW.player2_id, NEW.game_id);
+    END IF;
 END//
 
 CREATE TRIGGER match_history_after_update
@@ -15,7 +19,8 @@ AFTER UPDATE ON match_history
 FOR EACH ROW
 BEGIN
     -- Update stats if winner or result changes
-    IF NEW.winner_id != OLD.winner_id OR NEW.result != OLD.result THEN
+    IF @suspend_stats_triggers IS NULL
+        AND (NEW.winner_id != OLD.winner_id OR NEW.result != OLD.result) THEN
         CALL update_player_game_stats(NEW.player1_id, NEW.game_id);
         CALL update_player_game_stats(NEW.player2_id, NEW.game_id);
     END IF;
@@ -25,9 +30,11 @@ CREATE TRIGGER match_history_after_delete
 AFTER DELETE ON match_history
 FOR EACH ROW
 BEGIN
-    -- Update stats for both players
-    CALL update_player_game_stats(OLD.player1_id, OLD.game_id);
-    CALL update_player_game_stats(OLD.player2_id, OLD.game_id);
+    IF @suspend_stats_triggers IS NULL THEN
+        -- Update stats for both players
+        CALL update_player_game_stats(OLD.player1_id, OLD.game_id);
+        CALL update_player_game_stats(OLD.player2_id, OLD.game_id);
+    END IF;
 END//
 
 -- Helper procedure to update player statistics
@@ -151,44 +158,195 @@ BEGIN
         player_level = VALUES(player_level),
         win_probability = VALUES(win_probability);
 
-    -- Update player rating
-    INSERT INTO player_ratings (
-        rating_id,
+    -- player_ratings is written by the rating engine (communication/ratings.py)
+    -- from the Glicko ratings in player_skill_ratings, not from these aggregates
+
+    -- Keep the Statistics API read model in step, also for the match_history
+    -- update and delete triggers
+    CALL refresh_player_game_stats_view(p_player_id, p_game_id);
+END//
+
+-- Recompute player_game_stats for every (player, game) in match_history with one
+-- set-based aggregate. Same formulas as update_player_game_stats; used after bulk
+-- backfills that suspend the triggers (ratings are rebuilt by ratings.py --rebuild).
+CREATE PROCEDURE rebuild_player_game_stats()
+BEGIN
+    INSERT INTO player_game_stats (
+        stat_id,
         player_id,
         game_id,
-        rating,
-        rating_date
+        total_games_played,
+        total_wins,
+        total_losses,
+        total_draws,
+        total_moves,
+        total_time_played_minutes,
+        last_played,
+        is_churned,
+        engagement_level,
+        player_level,
+        win_probability
     )
     SELECT
         UUID_TO_BIN(UUID()),
-        p_player_id,
-        p_game_id,
+        s.player_id,
+        s.game_id,
+        s.total_games,
+        s.total_wins,
+        s.total_losses,
+        s.total_draws,
+        s.total_moves,
+        s.total_time,
+        s.last_played,
+        DATEDIFF(CURRENT_TIMESTAMP, s.last_played) > 30,
+        GREATEST(0, LEAST(100,
+            (s.total_games * 40 / 100) +
+            (CASE
+                WHEN DATEDIFF(CURRENT_TIMESTAMP, s.last_played) < 7 THEN 40
+                WHEN DATEDIFF(CURRENT_TIMESTAMP, s.last_played) < 14 THEN 30
+                WHEN DATEDIFF(CURRENT_TIMESTAMP, s.last_played) < 30 THEN 20
+                ELSE 0
+            END) +
+            (s.total_time * 20 / 1000)
+        )),
         CASE
-            WHEN v_total_games < 5 THEN 1
-            ELSE
-                GREATEST(1, LEAST(5,
-                    FLOOR(
-                        (
-                            (COALESCE(v_total_wins, 0) * 100.0 / NULLIF(v_total_games, 0) * 0.4) +
-                            (CASE
-                                WHEN v_total_games >= 100 THEN 100
-                                ELSE v_total_games
-                             END * 0.3) +
-                            (CASE
-                                WHEN v_total_time >= 1000 THEN 100
-                                ELSE v_total_time / 10
-                             END * 0.3)
-                        ) / 20
-                    )
-                ))
+            WHEN s.total_games < 10 THEN 'novice'
+            WHEN (s.total_wins * 100.0 / s.total_games) > 65 AND s.total_games >= 50 THEN 'expert'
+            ELSE 'intermediate'
         END,
-        CURRENT_TIMESTAMP;
+        GREATEST(0.1, LEAST(0.9, s.total_wins * 1.0 / s.total_games))
+    FROM (
+        SELECT
+            pm.player_id,
+            pm.game_id,
+            COUNT(*) AS total_games,
+            SUM(CASE WHEN pm.winner_id = pm.player_id THEN 1 ELSE 0 END) AS total_wins,
+            SUM(CASE WHEN pm.winner_id IS NOT NULL AND pm.winner_id != pm.player_id THEN 1 ELSE 0 END) AS total_losses,
+            SUM(CASE WHEN pm.winner_id IS NULL THEN 1 ELSE 0 END) AS total_draws,
+            COALESCE(SUM(mm.moves_count), 0) AS total_moves,
+            SUM(pm.duration_minutes) AS total_time,
+            MAX(pm.end_time) AS last_played
+        FROM (
+            SELECT match_id, game_id, player1_id AS player_id, winner_id, duration_minutes, end_time
+            FROM match_history
+            UNION ALL
+            SELECT match_id, game_id, player2_id AS player_id, winner_id, duration_minutes, end_time
+            FROM match_history
+        ) pm
+        LEFT JOIN (
+            SELECT match_id, player_id, SUM(moves_count) AS moves_count
+            FROM match_moves
+            GROUP BY match_id, player_id
+        ) mm ON mm.match_id = pm.match_id AND mm.player_id = pm.player_id
+        GROUP BY pm.player_id, pm.game_id
+    ) s
+    ON DUPLICATE KEY UPDATE
+        total_games_played = VALUES(total_games_played),
+        total_wins = VALUES(total_wins),
+        total_losses = VALUES(total_losses),
+        total_draws = VALUES(total_draws),
+        total_moves = VALUES(total_moves),
+        total_time_played_minutes = VALUES(total_time_played_minutes),
+        last_played = VALUES(last_played),
+        is_churned = VALUES(is_churned),
+        engagement_level = VALUES(engagement_level),
+        player_level = VALUES(player_level),
+        win_probability = VALUES(win_probability);
 END//
 
+-- Upsert one (player, game) row of the Statistics API read model
+CREATE PROCEDURE refresh_player_game_stats_view(
+    IN p_player_id BINARY(16),
+    IN p_game_id BINARY(16)
+)
+BEGIN
+    DECLARE v_new_row BOOLEAN;
+
+    SET v_new_row = NOT EXISTS (
+        SELECT 1 FROM player_game_stats_view
+        WHERE player_id = p_player_id AND game_id = p_game_id
+    );
+
+    INSERT INTO player_game_stats_view (
+        player_id, game_id, player_name, game_name,
+        total_games_played, total_wins, total_losses, total_moves,
+        total_time_played_minutes, win_ratio, last_played,
+        birthdate, age, gender, country
+    )
+    SELECT
+        pgs.player_id, pgs.game_id, p.full_name, g.name,
+        pgs.total_games_played, pgs.total_wins, pgs.total_losses, pgs.total_moves,
+        pgs.total_time_played_minutes, pgs.win_ratio, pgs.last_played,
+        p.birthdate, TIMESTAMPDIFF(YEAR, p.birthdate, CURRENT_DATE), p.gender, p.country
+    FROM player_game_stats pgs
+    JOIN players p ON pgs.player_id = p.player_id
+    JOIN games g ON pgs.game_id = g.game_id
+    WHERE pgs.player_id = p_player_id AND pgs.game_id = p_game_id
+    ON DUPLICATE KEY UPDATE
+        player_name = VALUES(player_name),
+        game_name = VALUES(game_name),
+        total_games_played = VALUES(total_games_played),
+        total_wins = VALUES(total_wins),
+        total_losses = VALUES(total_losses),
+        total_moves = VALUES(total_moves),
+        total_time_played_minutes = VALUES(total_time_played_minutes),
+        win_ratio = VALUES(win_ratio),
+        last_played = VALUES(last_played),
+        birthdate = VALUES(birthdate),
+        age = VALUES(age),
+        gender = VALUES(gender),
+        country = VALUES(country);
+
+    -- A new row can match name searches cached before it existed
+    -- (ROSTER_SCOPE in GameAnalytics/stats_cache.py)
+    IF v_new_row THEN
+        INSERT INTO stats_cache_versions (scope, version) VALUES ('roster', 1)
+        ON DUPLICATE KEY UPDATE version = version + 1;
+    END IF;
+END//
+
+-- Rebuild the whole read model in one set-based statement (initial load and backfills)
+CREATE PROCEDURE rebuild_player_game_stats_view()
+BEGIN
+    DELETE FROM player_game_stats_view;
+
+    INSERT INTO player_game_stats_view (
+        player_id, game_id, player_name, game_name,
+        total_games_played, total_wins, total_losses, total_moves,
+        total_time_played_minutes, win_ratio, last_played,
+        birthdate, age, gender, country
+    )
+    SELECT
+        pgs.player_id, pgs.game_id, p.full_name, g.name,
+        pgs.total_games_played, pgs.total_wins, pgs.total_losses, pgs.total_moves,
+        pgs.total_time_played_minutes, pgs.win_ratio, pgs.last_played,
+        p.birthdate, TIMESTAMPDIFF(YEAR, p.birthdate, CURRENT_DATE), p.gender, p.country
+    FROM player_game_stats pgs
+    JOIN players p ON pgs.player_id = p.player_id
+    JOIN games g ON pgs.game_id = g.game_id;
+END//
+
+-- Stored ages only change on birthdays, so they are refreshed once a day
+CREATE PROCEDURE refresh_player_game_stats_ages()
+BEGIN
+    UPDATE player_game_stats_view
+    SET age = TIMESTAMPDIFF(YEAR, birthdate, CURRENT_DATE)
+    WHERE age <> TIMESTAMPDIFF(YEAR, birthdate, CURRENT_DATE);
+END//
+
+CREATE EVENT IF NOT EXISTS refresh_player_game_stats_ages_daily
+ON SCHEDULE EVERY 1 DAY STARTS (CURRENT_DATE + INTERVAL 1 DAY)
+DO CALL refresh_player_game_stats_ages()//
+
 DELIMITER ;
 
 
 # DROP PROCEDURE IF EXISTS update_player_game_stats;
+# DROP PROCEDURE IF EXISTS rebuild_player_game_stats;
+# DROP PROCEDURE IF EXISTS refresh_player_game_stats_view;
+# DROP PROCEDURE IF EXISTS rebuild_player_game_stats_view;
+# DROP PROCEDURE IF EXISTS refresh_player_game_stats_ages;
+# DROP EVENT IF EXISTS refresh_player_game_stats_ages_daily;
 
 # DROP TRIGGER IF EXISTS match_history_after_insert;
 # DROP TRIGGER IF EXISTS match_history_after_update;
@@ -0,0 +1,347 @@
+"""
+Seeded synthetic data generator for load and scale testing.
+
+Generates players, games, match_history and match_moves following
+normalized_version/create.sql at any volume (10M+ matches), with the same
+distributions as the generate_* procedures in normalized_version/insert.sql:
+the seven games with their duration and move ranges, the skewed gender and
+country mix, per-player game preferences and skill-driven results.
+
+Everything is generated with numpy in chunks of matches, so memory stays flat
+and output is identical for the same --seed and --chunk-size whatever the
+output format. UUID columns are written as 32-character hex strings.
+
+Write CSV or Parquet files (one directory per table):
+    python synthetic_data.py --players 200000 --matches 10000000 --output ../data/synthetic --format parquet
+
+Bulk load into MySQL with LOAD DATA LOCAL INFILE, chunk by chunk. The rating
+engine is imported from communication/, so run it with that on the import path:
+    PYTHONPATH=../communication python synthetic_data.py --players 200000 --matches 10000000 --mysql
+
+The load suspends the match_history triggers for its session
+(@suspend_stats_triggers), like communication/backfill.py, instead of
+recomputing a player's stats for every loaded row. Afterwards it rebuilds
+player_game_stats and the Statistics API read model with the set-based
+procedures, replays player_skill_ratings and invalidates the API cache.
+"""
+import argparse
+import logging
+import os
+import tempfile
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000000
+TABLES = ('games', 'players', 'match_history', 'match_moves')
+
+# name, can_draw, share of matches, (min, max) duration minutes, (min, max) moves
+GAMES = [
+    ('battleship', False, 0.22, (15, 40), (30, 70)),
+    ('chess', True, 0.20, (20, 60), (20, 80)),
+    ('connect four', True, 0.16, (5, 20), (5, 20)),
+    ('tic tac toe', True, 0.14, (5, 20), (5, 20)),
+    ('dots and boxes', False, 0.12, (5, 20), (5, 20)),
+    ('go', False, 0.09, (30, 90), (40, 140)),
+    ('reversi', False, 0.07, (5, 20), (5, 20)),
+]
+
+FIRST_NAMES = ['James', 'John', 'Robert', 'Michael', 'William', 'David', 'Joseph', 'Emma', 'Olivia', 'Ava',
+               'Isabella', 'Sophia', 'Wei', 'Li', 'Zhang', 'Yuki', 'Haruto', 'Soma', 'Juan', 'Carlos', 'Maria',
+               'Sofia', 'Mohammed', 'Ahmad', 'Hassan', 'Amir', 'Zara', 'Priya', 'Raj', 'Arjun', 'Klaus', 'Hans',
+               'Anna', 'Elena', 'Ivan', 'Dmitri']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Garcia', 'Miller', 'Davis', 'Chen', 'Wang', 'Liu', 'Sato',
+              'Tanaka', 'Suzuki', 'Rodriguez', 'Martinez', 'Kumar', 'Patel', 'Singh', 'Mueller', 'Schmidt',
+              'Ivanov', 'Petrov', 'Kim', 'Lee', 'Park', 'Nguyen', 'Tran', 'Ali', 'Ahmed', 'Khan']
+EMAIL_DOMAINS = ['gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com', 'protonmail.com', 'mail.com',
+                 'icloud.com', 'fastmail.com']
+GENDERS = (['Male', 'Female', 'Non-Binary'], [0.89, 0.10, 0.01])
+COUNTRIES = (
+    ['USA', 'China', 'Japan', 'Germany', 'UK', 'France', 'South Korea', 'Canada', 'India', 'Brazil', 'Russia',
+     'Spain', 'Australia', 'Netherlands', 'Sweden', 'Singapore'],
+    [15, 10, 9, 8, 7, 7, 7, 6, 6, 6, 5, 5, 4, 3, 1, 1],
+)
+
+# Hex digits for every byte value, used to format UUID columns without a Python loop
+HEX_PAIRS = np.array([f'{i:02x}'.encode() for i in range(256)], dtype='S2')
+
+LOAD_COLUMNS = {
+    'games': (['game_id', 'name', 'description', 'rules', 'can_draw'], ['game_id']),
+    'players': (['player_id', 'username', 'firstname', 'lastname', 'email', 'birthdate', 'gender', 'country'],
+                ['player_id']),
+    'match_history': (['match_id', 'game_id', 'player1_id', 'player2_id', 'winner_id', 'start_time', 'end_time',
+                       'duration_minutes', 'result'],
+                      ['match_id', 'game_id', 'player1_id', 'player2_id', 'winner_id']),
+    'match_moves': (['move_id', 'match_id', 'player_id', 'moves_count'], ['move_id', 'match_id', 'player_id']),
+}
+
+
+def uuid_hex(rng: np.random.Generator, count: int) -> np.ndarray:
+    """Random version 4 UUIDs as 32-character hex strings"""
+    raw = rng.integers(0, 256, size=(count, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    return np.ascontiguousarray(HEX_PAIRS[raw]).view('S32').ravel().astype('U32')
+
+
+def _weights(values) -> np.ndarray:
+    weights = np.asarray(values, dtype=np.float64)
+    return weights / weights.sum()
+
+
+class SyntheticDataGenerator:
+    """Deterministic generator: the same seed always produces the same rows"""
+
+    def __init__(self, n_players: int, n_matches: int, seed: int = 42,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, start_date: str = '2023-01-01',
+                 end_date: Optional[str] = None):
+        self.n_players = n_players
+        self.n_matches = n_matches
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.start = np.datetime64(start_date, 's')
+        self.end = np.datetime64(end_date or datetime.now().strftime('%Y-%m-%d'), 's')
+
+        rng = np.random.default_rng([seed, 0])
+        self.game_ids = uuid_hex(rng, len(GAMES))
+        self.player_ids = uuid_hex(rng, n_players)
+        # Persistent skill (0-1) and heavy-tailed activity so a few players play most matches
+        self.skill = rng.random(n_players)
+        self.activity = _weights(rng.lognormal(0.0, 1.0, n_players))
+        # Per-player game preference, as the insert.sql preference thresholds
+        self.preference = rng.random((n_players, len(GAMES))) < np.array([0.6, 0.55, 0.5, 0.45, 0.4, 0.3, 0.2])
+
+    def games(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            'game_id': self.game_ids,
+            'name': [game[0] for game in GAMES],
+            'description': [f"Synthetic {game[0]} game" for game in GAMES],
+            'rules': [f"Standard {game[0]} rules" for game in GAMES],
+            'can_draw': [int(game[1]) for game in GAMES],
+        })
+
+    def players(self) -> Iterator[pd.DataFrame]:
+        for chunk_index, offset in enumerate(range(0, self.n_players, self.chunk_size)):
+            count = min(self.chunk_size, self.n_players - offset)
+            rng = np.random.default_rng([self.seed, 1, chunk_index])
+            number = np.arange(offset, offset + count).astype(str)
+            first = rng.choice(FIRST_NAMES, count)
+            last = rng.choice(LAST_NAMES, count)
+            username = np.char.add('player_', number)
+            email = np.char.add(np.char.add(username, '@'), rng.choice(EMAIL_DOMAINS, count))
+            age_days = rng.integers(13 * 365, 65 * 365, count).astype('timedelta64[D]')
+            yield pd.DataFrame({
+                'player_id': self.player_ids[offset:offset + count],
+                'username': username,
+                'firstname': first,
+                'lastname': last,
+                'email': email,
+                'birthdate': np.datetime_as_string(self.end.astype('datetime64[D]') - age_days, unit='D'),
+                'gender': rng.choice(GENDERS[0], count, p=GENDERS[1]),
+                'country': rng.choice(COUNTRIES[0], count, p=_weights(COUNTRIES[1])),
+            })
+
+    def matches(self) -> Iterator[Dict[str, pd.DataFrame]]:
+        """Yield {'match_history': ..., 'match_moves': ...} per chunk of matches"""
+        game_share = _weights([game[2] for game in GAMES])
+        can_draw = np.array([game[1] for game in GAMES])
+        duration_range = np.array([game[3] for game in GAMES])
+        moves_range = np.array([game[4] for game in GAMES])
+        span_seconds = int((self.end - self.start) / np.timedelta64(1, 's'))
+
+        for chunk_index, offset in enumerate(range(0, self.n_matches, self.chunk_size)):
+            count = min(self.chunk_size, self.n_matches - offset)
+            rng = np.random.default_rng([self.seed, 2, chunk_index])
+
+            game = rng.choice(len(GAMES), count, p=game_share)
+            player1 = rng.choice(self.n_players, count, p=self.activity)
+            # Players mostly stick to the games they prefer: resample the game once if not
+            unpreferred = ~self.preference[player1, game]
+            game[unpreferred] = rng.choice(len(GAMES), int(unpreferred.sum()), p=game_share)
+
+            player2 = rng.choice(self.n_players, count, p=self.activity)
+            same = player2 == player1
+            player2[same] = (player1[same] + rng.integers(1, self.n_players, int(same.sum()))) % self.n_players
+
+            # Logistic win chance from the skill gap, draws only for games that allow them
+            skill_gap = self.skill[player1] - self.skill[player2]
+            p1_wins = rng.random(count) < 1.0 / (1.0 + np.exp(-4.0 * skill_gap))
+            draw = can_draw[game] & (np.abs(skill_gap) < 0.1) & (rng.random(count) < 0.2)
+            result = np.where(draw, 'draw', np.where(p1_wins, 'win', 'loss'))
+            winner = np.where(p1_wins, self.player_ids[player1], self.player_ids[player2]).astype(object)
+            winner[draw] = None
+
+            duration = rng.integers(duration_range[game, 0], duration_range[game, 1] + 1)
+            start_time = self.start + rng.integers(0, span_seconds, count).astype('timedelta64[s]')
+            end_time = start_time + (duration * 60).astype('timedelta64[s]')
+            base_moves = rng.integers(moves_range[game, 0], moves_range[game, 1] + 1)
+
+            match_ids = uuid_hex(rng, count)
+            match_history = pd.DataFrame({
+                'match_id': match_ids,
+                'game_id': self.game_ids[game],
+                'player1_id': self.player_ids[player1],
+                'player2_id': self.player_ids[player2],
+                'winner_id': winner,
+                'start_time': start_time,
+                'end_time': end_time,
+                'duration_minutes': duration,
+                'result': result,
+            })
+            # Two move rows per match, ±5 moves around the game's base
+            match_moves = pd.DataFrame({
+                'move_id': uuid_hex(rng, 2 * count),
+                'match_id': np.concatenate([match_ids, match_ids]),
+                'player_id': np.concatenate([self.player_ids[player1], self.player_ids[player2]]),
+                'moves_count': np.maximum(1, np.concatenate([base_moves, base_moves])
+                                          + rng.integers(-5, 6, 2 * count)),
+            })
+            yield {'match_history': match_history, 'match_moves': match_moves}
+
+    def tables(self) -> Iterator[tuple]:
+        """Yield (table, chunk DataFrame) in foreign key order"""
+        yield 'games', self.games()
+        for chunk in self.players():
+            yield 'players', chunk
+        for chunks in self.matches():
+            yield 'match_history', chunks['match_history']
+            yield 'match_moves', chunks['match_moves']
+
+
+def write_files(generator: SyntheticDataGenerator, output_dir: str, file_format: str) -> Dict[str, int]:
+    counts = {table: 0 for table in TABLES}
+    parts = {table: 0 for table in TABLES}
+    for table, df in generator.tables():
+        table_dir = os.path.join(output_dir, table)
+        os.makedirs(table_dir, exist_ok=True)
+        path = os.path.join(table_dir, f"part-{parts[table]:05d}.{file_format}")
+        parts[table] += 1
+        if file_format == 'parquet':
+            df.to_parquet(path, index=False)
+        else:
+            df.to_csv(path, index=False, date_format='%Y-%m-%d %H:%M:%S')
+        counts[table] += len(df)
+        logger.info(f"Wrote {len(df)} {table} rows to {path}")
+    return counts
+
+
+def get_connection():
+    import mysql.connector
+
+    config = {
+        "host": os.getenv('DB_HOST', 'localhost'),
+        "port": int(os.getenv('DB_PORT', '3306')),
+        "user": os.getenv('DB_USER', 'root'),
+        "password": os.getenv('DB_PASSWORD', 'root'),
+        "database": os.getenv('DB_NAME', 'platform_analytics'),
+        "allow_local_infile": True,
+    }
+    ssl_ca = os.getenv('DB_SSL_CA', '')
+    if ssl_ca:
+        config.update({"ssl_ca": ssl_ca, "ssl_verify_cert": True})
+    return mysql.connector.connect(**config)
+
+
+def load_data_statement(table: str, path: str) -> str:
+    columns, uuid_columns = LOAD_COLUMNS[table]
+    variables = ', '.join(f"@{column}" if column in uuid_columns else column for column in columns)
+    assignments = ', '.join(
+        f"{column} = UNHEX(NULLIF(@{column}, ''))" for column in uuid_columns
+    )
+    return (
+        f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {table} "
+        "CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+        "LINES TERMINATED BY '\\n' IGNORE 1 LINES "
+        f"({variables}) SET {assignments}"
+    )
+
+
+def load_mysql(generator: SyntheticDataGenerator) -> Dict[str, int]:
+    """
+    Load every chunk with LOAD DATA LOCAL INFILE through a temporary CSV file,
+    then rebuild the tables derived from match_history
+    """
+    # Imported before loading anything, so a missing import path fails fast
+    from ratings import rebuild_skill_ratings
+
+    counts = {table: 0 for table in TABLES}
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        # Rows are generated consistent with the schema, so skip per-row checks during the load
+        cursor.execute("SET SESSION foreign_key_checks = 0")
+        cursor.execute("SET SESSION unique_checks = 0")
+        # Stats are rebuilt once below instead of per row by the match_history triggers
+        cursor.execute("SET @suspend_stats_triggers = 1")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'chunk.csv')
+            for table, df in generator.tables():
+                df.to_csv(path, index=False, date_format='%Y-%m-%d %H:%M:%S')
+                cursor.execute(load_data_statement(table, path))
+                conn.commit()
+                counts[table] += len(df)
+                logger.info(f"Loaded {len(df)} {table} rows ({counts[table]} total)")
+        cursor.execute("SET SESSION unique_checks = 1")
+        cursor.execute("SET SESSION foreign_key_checks = 1")
+        cursor.execute("SET @suspend_stats_triggers = NULL")
+
+        logger.info("Rebuilding player_game_stats...")
+        cursor.execute("CALL rebuild_player_game_stats()")
+        logger.info("Rebuilding player_game_stats_view...")
+        cursor.execute("CALL rebuild_player_game_stats_view()")
+        logger.info("Replaying player_skill_ratings and player_ratings...")
+        rebuild_skill_ratings(conn)
+        # Invalidate every cached Statistics API response
+        cursor.execute("""
+            INSERT INTO stats_cache_versions (scope, version) VALUES ('global', 1)
+            ON DUPLICATE KEY UPDATE version = version + 1
+        """)
+        cursor.execute("UPDATE stats_cache_versions SET version = version + 1 WHERE scope <> 'global'")
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic players, games and matches at scale")
+    parser.add_argument("--players", type=int, default=100000, help="Number of players")
+    parser.add_argument("--matches", type=int, default=1000000, help="Number of matches")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows generated per chunk")
+    parser.add_argument("--start-date", default='2023-01-01', help="Earliest match start (YYYY-MM-DD)")
+    parser.add_argument("--end-date", help="Latest match start and age reference date (default: today)")
+    parser.add_argument("--output", help="Directory to write one sub-directory of files per table")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="File format for --output")
+    parser.add_argument("--mysql", action="store_true", help="Bulk load into the DB_* database")
+    args = parser.parse_args()
+
+    if not args.output and not args.mysql:
+        parser.error("pass --output and/or --mysql")
+
+    def new_generator():
+        return SyntheticDataGenerator(args.players, args.matches, args.seed, args.chunk_size,
+                                      args.start_date, args.end_date)
+
+    if args.output:
+        counts = write_files(new_generator(), args.output, args.format)
+        logger.info(f"Files written to {args.output}: {counts}")
+    if args.mysql:
+        counts = load_mysql(new_generator())
+        logger.info(f"Loaded into MySQL: {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Columnar export of player_game_stats for notebooks and model training.
+
+Streams player_game_stats joined with players and games out of MySQL with an
+unbuffered cursor and writes it in chunks to a Hive-partitioned (game_name=...)
+Parquet or Arrow dataset, replacing the hand-exported player_game_statistics.csv
+copies.
+
+Full export (replaces the dataset once it has been written completely):
+    python player_stats_export.py --output ../data/player_game_stats
+
+Incremental export (only rows whose last_played moved past the stored watermark):
+    python player_stats_export.py --output ../data/player_game_stats --incremental
+
+Readers should go through load_player_game_stats(), which keeps the newest
+version of every (player_id, game_id) row across full and incremental files.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime
+from typing import Optional
+
+import mysql.connector
+import pyarrow as pa
+import pyarrow.dataset as ds
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+WATERMARK_FILE = '_watermark.json'
+DEFAULT_CHUNK_SIZE = 50000
+
+SCHEMA = pa.schema([
+    ('stat_id', pa.string()),
+    ('player_id', pa.string()),
+    ('player_name', pa.string()),
+    ('age', pa.int16()),
+    ('gender', pa.string()),
+    ('country', pa.string()),
+    ('game_id', pa.string()),
+    ('game_name', pa.string()),
+    ('total_games_played', pa.int32()),
+    ('total_wins', pa.int32()),
+    ('total_losses', pa.int32()),
+    ('total_draws', pa.int32()),
+    ('total_moves', pa.int32()),
+    ('total_time_played_minutes', pa.int32()),
+    ('win_ratio', pa.float64()),
+    ('is_churned', pa.int8()),
+    ('player_level', pa.string()),
+    ('engagement_level', pa.float64()),
+    ('win_probability', pa.float64()),
+    ('rating', pa.int8()),
+    ('last_played', pa.timestamp('s')),
+])
+
+# Column order must match SCHEMA
+EXPORT_QUERY = """
+SELECT
+    BIN_TO_UUID(pgs.stat_id) as stat_id,
+    BIN_TO_UUID(pgs.player_id) as player_id,
+    CONCAT(p.firstname, ' ', p.lastname) as player_name,
+    TIMESTAMPDIFF(YEAR, p.birthdate, CURRENT_DATE) as age,
+    p.gender,
+    p.country,
+    BIN_TO_UUID(pgs.game_id) as game_id,
+    g.name as game_name,
+    pgs.total_games_played,
+    pgs.total_wins,
+    pgs.total_losses,
+    pgs.total_draws,
+    pgs.total_moves,
+    pgs.total_time_played_minutes,
+    CAST(pgs.win_ratio AS DOUBLE) as win_ratio,
+    pgs.is_churned,
+    pgs.player_level,
+    CAST(pgs.engagement_level AS DOUBLE) as engagement_level,
+    CAST(pgs.win_probability AS DOUBLE) as win_probability,
+    -- The 1-5 stars last appended to player_ratings, derived like stars() in
+    -- communication/ratings.py from the one current Glicko row per (player, game)
+    CAST(LEAST(5, GREATEST(1, FLOOR((psr.rating - 1350) / 150) + 2)) AS SIGNED) as rating,
+    pgs.last_played
+FROM player_game_stats pgs
+JOIN players p ON pgs.player_id = p.player_id
+JOIN games g ON pgs.game_id = g.game_id
+LEFT JOIN player_skill_ratings psr ON psr.player_id = pgs.player_id AND psr.game_id = pgs.game_id
+"""
+
+
+def get_connection():
+    config = {
+        "host": os.getenv('DB_HOST', 'localhost'),
+        "port": int(os.getenv('DB_PORT', '3306')),
+        "user": os.getenv('DB_USER', 'root'),
+        "password": os.getenv('DB_PASSWORD', 'root'),
+        "database": os.getenv('DB_NAME', 'platform_analytics'),
+    }
+    ssl_ca = os.getenv('DB_SSL_CA', '')
+    if ssl_ca:
+        config.update({"ssl_ca": ssl_ca, "ssl_verify_cert": True})
+    return mysql.connector.connect(**config)
+
+
+def read_watermark(output_dir: str) -> Optional[datetime]:
+    path = os.path.join(output_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return datetime.fromisoformat(json.load(f)['last_played'])
+
+
+def write_watermark(output_dir: str, last_played: datetime) -> None:
+    path = os.path.join(output_dir, WATERMARK_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'last_played': last_played.isoformat(), 'exported_at': datetime.now().isoformat()}, f)
+    os.replace(path + '.tmp', path)
+
+
+def replace_dataset(staging_dir: str, output_dir: str) -> None:
+    """Swap a completed full export in for the previous partitions and watermark"""
+    if not os.path.isdir(output_dir):
+        os.rename(staging_dir, output_dir)
+        return
+    # Anything else kept in the dataset directory moves over to the new one
+    for name in os.listdir(output_dir):
+        path = os.path.join(output_dir, name)
+        if not (name.startswith('game_name=') and os.path.isdir(path)) and name != WATERMARK_FILE:
+            os.rename(path, os.path.join(staging_dir, name))
+    old_dir = staging_dir + '.old'
+    os.rename(output_dir, old_dir)
+    os.rename(staging_dir, output_dir)
+    shutil.rmtree(old_dir)
+
+
+def export(output_dir: str, incremental: bool = False, file_format: str = 'parquet',
+           chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Export player_game_stats to a partitioned dataset and return the number of rows written"""
+    output_dir = os.path.normpath(output_dir)
+    watermark = read_watermark(output_dir) if incremental else None
+    if incremental and watermark is None:
+        logger.info("No watermark found, running a full export")
+        incremental = False
+
+    query = EXPORT_QUERY
+    params = ()
+    if watermark is not None:
+        # >= so rows committed later with the same timestamp are not missed; readers dedupe
+        query += " WHERE pgs.last_played >= %s"
+        params = (watermark,)
+        logger.info(f"Incremental export of rows with last_played >= {watermark}")
+
+    run_id = datetime.now().strftime('%Y%m%d%H%M%S') + '-' + uuid.uuid4().hex[:8]
+    # A full export is written next to the dataset and only replaces it once it
+    # has succeeded, so a failed run leaves the previous export in place
+    target_dir = output_dir if incremental else f"{output_dir}.tmp-{run_id}"
+    os.makedirs(target_dir, exist_ok=True)
+    try:
+        max_last_played, total_rows = _write_chunks(target_dir, query, params, file_format, chunk_size,
+                                                    run_id, watermark)
+        if max_last_played is not None:
+            write_watermark(target_dir, max_last_played)
+    except BaseException:
+        if not incremental:
+            shutil.rmtree(target_dir, ignore_errors=True)
+        raise
+
+    if not incremental:
+        replace_dataset(target_dir, output_dir)
+    logger.info(f"Export finished: {total_rows} rows written to {output_dir}")
+    return total_rows
+
+
+def _write_chunks(target_dir: str, query: str, params: tuple, file_format: str, chunk_size: int,
+                  run_id: str, watermark: Optional[datetime]):
+    """Stream the query into target_dir; returns the newest last_played seen and the row count"""
+    partitioning = ds.partitioning(pa.schema([('game_name', pa.string())]), flavor='hive')
+    last_played_index = SCHEMA.get_field_index('last_played')
+    max_last_played = watermark
+    total_rows = 0
+    chunk_number = 0
+
+    conn = get_connection()
+    try:
+        # Unbuffered cursor: rows are streamed from the server chunk by chunk
+        cursor = conn.cursor(buffered=False)
+        cursor.execute(query, params)
+
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+
+            columns = list(zip(*rows))
+            table = pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, SCHEMA)],
+                schema=SCHEMA
+            )
+            ds.write_dataset(
+                table,
+                target_dir,
+                format=file_format,
+                partitioning=partitioning,
+                basename_template=f"part-{run_id}-{chunk_number:05d}-{{i}}.{file_format}",
+                existing_data_behavior='overwrite_or_ignore'
+            )
+
+            chunk_max = max((value for value in columns[last_played_index] if value is not None), default=None)
+            if chunk_max is not None and (max_last_played is None or chunk_max > max_last_played):
+                max_last_played = chunk_max
+
+            total_rows += len(rows)
+            chunk_number += 1
+            logger.info(f"Wrote chunk {chunk_number} ({total_rows} rows so far)")
+
+        cursor.close()
+    finally:
+        conn.close()
+    return max_last_played, total_rows
+
+
+def load_player_game_stats(path: str, file_format: str = 'parquet', columns: Optional[list] = None):
+    """
+    Read an exported dataset into a pandas DataFrame.
+
+    Incremental exports append new versions of changed rows, so only the newest
+    version of each (player_id, game_id) pair is kept.
+    """
+    dataset = ds.dataset(path, format=file_format, partitioning='hive')
+    read_columns = None
+    if columns is not None:
+        read_columns = list(dict.fromkeys(list(columns) + ['player_id', 'game_id', 'last_played']))
+    df = dataset.to_table(columns=read_columns).to_pandas()
+    df['game_name'] = df['game_name'].astype(str)
+    df = (df.sort_values('last_played')
+            .drop_duplicates(subset=['player_id', 'game_id'], keep='last')
+            .reset_index(drop=True))
+    return df[columns] if columns is not None else df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export player_game_stats to a partitioned Parquet/Arrow dataset")
+    parser.add_argument("--output", required=True, help="Dataset directory")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only export rows changed since the last_played watermark")
+    parser.add_argument("--format", choices=["parquet", "feather"], default="parquet",
+                        help="File format (feather = Arrow IPC)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows fetched per chunk")
+    args = parser.parse_args()
+
+    export(args.output, args.incremental, args.format, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()